@@ -0,0 +1,209 @@
+import math
+import re
+import threading
+
+from django.conf import settings
+
+_token_pattern = re.compile(r"[a-z0-9']+")
+
+# Hand-labelled messages so the classifier is usable before any chats are stored
+SEED_EXAMPLES = [
+    ("I'm so happy today, looking for a nice matcha", 'happy'),
+    ("feeling great, want to treat myself to a matcha latte", 'happy'),
+    ("love this weather, where can I enjoy a tea", 'happy'),
+    ("had an awesome morning and want a good cafe", 'happy'),
+    ("in a great mood, happy to try somewhere new", 'happy'),
+    ("feeling happy and want a lovely cafe", 'happy'),
+    ("such a great day, I love matcha", 'happy'),
+    ("happy weekend, want to enjoy a nice tea", 'happy'),
+    ("so excited, just got the job! let's celebrate", 'excited'),
+    ("can't wait to try the new matcha place", 'excited'),
+    ("super pumped for the weekend, want somewhere fun", 'excited'),
+    ("celebrating my birthday, want something special", 'excited'),
+    ("so excited to celebrate tonight", 'excited'),
+    ("we're celebrating! excited for something special", 'excited'),
+    ("can't wait, so excited for the new cafe", 'excited'),
+    ("pumped and excited, want an amazing place", 'excited'),
+    ("just want to relax with a calm cup of tea", 'calm'),
+    ("looking for a chill, peaceful spot to unwind", 'calm'),
+    ("relaxed sunday, somewhere slow and cozy", 'calm'),
+    ("a tranquil tea house to sit quietly", 'calm'),
+    ("feeling calm, want a peaceful tea", 'calm'),
+    ("want to unwind and relax somewhere peaceful", 'calm'),
+    ("chill afternoon, a relaxing cafe please", 'calm'),
+    ("calm and relaxed, just a slow tea", 'calm'),
+    ("I'm so stressed with exams, need a break", 'stressed'),
+    ("overwhelmed at work, need somewhere to decompress", 'stressed'),
+    ("busy busy day, anxious and need a quick matcha", 'stressed'),
+    ("deadlines everywhere, I'm exhausted and stressed out", 'stressed'),
+    ("stressed out, I need a break from everything", 'stressed'),
+    ("so much pressure, feeling anxious", 'stressed'),
+    ("exhausted and overwhelmed, need to escape", 'stressed'),
+    ("stressed about deadlines, need a quick break", 'stressed'),
+    ("feeling down today, need some comfort", 'sad'),
+    ("bit sad and lonely, want a cozy corner", 'sad'),
+    ("rough day, feeling blue", 'sad'),
+    ("I miss home, want something comforting", 'sad'),
+    ("feeling sad, need a comforting drink", 'sad'),
+    ("lonely and down, want somewhere cozy", 'sad'),
+    ("sad day, I miss my friends", 'sad'),
+    ("feeling low and blue, need comfort", 'sad'),
+    ("so annoyed, the last cafe was terrible", 'angry'),
+    ("frustrated and angry, just need good matcha", 'angry'),
+    ("furious about my commute, need a drink", 'angry'),
+    ("ugh, everything is irritating today", 'angry'),
+    ("angry and annoyed, the service was terrible", 'angry'),
+    ("so frustrated, ugh", 'angry'),
+    ("irritated and angry about today", 'angry'),
+    ("furious, the worst day, annoyed at everyone", 'angry'),
+    ("where can I get matcha near me", 'neutral'),
+    ("show me cafes in sydney", 'neutral'),
+    ("any matcha places around the cbd", 'neutral'),
+    ("what tea places are open now", 'neutral'),
+    ("find matcha cafes near me", 'neutral'),
+    ("show me tea places in surry hills", 'neutral'),
+    ("where is a matcha cafe open now", 'neutral'),
+    ("list cafes around the cbd", 'neutral'),
+    ("meeting friends for a catch up, want somewhere lively", 'social'),
+    ("group of us hanging out, need a big table", 'social'),
+    ("date night, want a fun social spot", 'social'),
+    ("looking for a place to meet people and chat", 'social'),
+    ("catching up with friends, somewhere lively", 'social'),
+    ("meeting a group of friends to chat", 'social'),
+    ("social afternoon with friends, fun vibe", 'social'),
+    ("hanging out with mates, big group", 'social'),
+    ("need a quiet place to study with wifi", 'focused'),
+    ("want to get some work done on my laptop", 'focused'),
+    ("somewhere to concentrate and focus for a few hours", 'focused'),
+    ("cafe good for reading and working", 'focused'),
+    ("need to focus and study, quiet with wifi", 'focused'),
+    ("working on my laptop, need wifi and power", 'focused'),
+    ("quiet cafe to study and concentrate", 'focused'),
+    ("need to get work done, somewhere to focus", 'focused'),
+]
+
+# Function words that carry no sentiment but skew small classes under smoothing
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'the', 'to', 'for', 'of', 'in', 'on', 'at', 'with', 'my', 'me', 'i', "i'm",
+    'is', 'it', 'so', 'some', 'somewhere', 'want', 'need', 'just', 'this', 'that', 'from', 'be',
+])
+
+
+def tokenize(text):
+    """Lowercased word tokens of a message"""
+    return _token_pattern.findall(text.lower())
+
+
+def features(text):
+    """Unigram and bigram features of a message, ignoring stopwords"""
+    tokens = [token for token in tokenize(text) if token not in STOPWORDS]
+    return tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+
+
+class NaiveBayesClassifier:
+    """
+    Multinomial naive Bayes over unigram and bigram features.
+
+    Training folds each feature's per-class log likelihoods into one tuple, so
+    predicting is a dict lookup and a short vector add per feature; features
+    never seen in training are skipped.
+    """
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.labels = ()
+        self.log_priors = ()
+        self.log_likelihoods = {}
+
+    def fit(self, examples):
+        """Train on (text, label) pairs"""
+        class_counts, feature_counts, totals = {}, {}, {}
+        for text, label in examples:
+            class_counts[label] = class_counts.get(label, 0) + 1
+            counts = feature_counts.setdefault(label, {})
+            for feature in features(text):
+                counts[feature] = counts.get(feature, 0) + 1
+                totals[label] = totals.get(label, 0) + 1
+
+        self.labels = tuple(sorted(class_counts))
+        examples_seen = sum(class_counts.values())
+        self.log_priors = tuple(math.log(class_counts[label] / examples_seen) for label in self.labels)
+
+        vocabulary = set().union(*feature_counts.values()) if feature_counts else set()
+        denominators = [totals.get(label, 0) + self.alpha * len(vocabulary) for label in self.labels]
+        self.log_likelihoods = {
+            feature: tuple(
+                math.log((feature_counts[label].get(feature, 0) + self.alpha) / denominator)
+                for label, denominator in zip(self.labels, denominators)
+            )
+            for feature in vocabulary
+        }
+        return self
+
+    def predict(self, text):
+        """Return (label, probability) for the most likely class"""
+        if not self.labels:
+            return 'neutral', 0.0
+        scores = list(self.log_priors)
+        for feature in features(text):
+            likelihoods = self.log_likelihoods.get(feature)
+            if likelihoods:
+                scores = [score + likelihood for score, likelihood in zip(scores, likelihoods)]
+        best = max(scores)
+        total = sum(math.exp(score - best) for score in scores)
+        index = scores.index(best)
+        return self.labels[index], 1.0 / total
+
+
+def training_examples():
+    """Seed examples plus stored messages Ollama has labelled"""
+    from .models import SentimentAnalysis
+
+    rows = SentimentAnalysis.objects.filter(source='ollama').values_list('message__content', 'sentiment')
+    return SEED_EXAMPLES + [(content, sentiment) for content, sentiment in rows if content]
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_sentiment_classifier():
+    """Return the shared classifier, training it on first use"""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                try:
+                    examples = training_examples()
+                except Exception as e:
+                    print(f"Error loading sentiment training data: {e}")
+                    examples = SEED_EXAMPLES
+                _classifier = NaiveBayesClassifier().fit(examples)
+    return _classifier
+
+
+def loaded_classifier():
+    """The shared classifier if it has been trained already, otherwise None"""
+    return _classifier
+
+
+def reset_sentiment_classifier():
+    """Drop the shared classifier so the next call retrains it"""
+    global _classifier
+    with _classifier_lock:
+        _classifier = None
+
+
+def route_sentiment(classifier, text):
+    """
+    Label a message with the local classifier when it is confident enough.
+
+    Returns (sentiment, confidence), or None when the message should be
+    escalated to Ollama.
+    """
+    if not getattr(settings, 'SENTIMENT_CLASSIFIER_ENABLED', True):
+        return None
+    sentiment, confidence = classifier.predict(text)
+    if confidence < getattr(settings, 'SENTIMENT_CLASSIFIER_THRESHOLD', 0.8):
+        return None
+    return sentiment, round(confidence, 3)
@@ -0,0 +1,123 @@
+"""
+Template-based explanations ("AI insights") for café recommendations.
+
+Every combination of mood, rank, rating bucket, distance bucket and
+matcha-in-name has its fields precomputed at import as format strings, and
+rendered insights are memoised, so explaining a café is a table lookup and
+one format per field.
+"""
+from functools import lru_cache
+from itertools import product
+
+# mood_match, best_for, key_features
+MOOD_TEMPLATES = {
+    'stressed': (
+        "This café offers a peaceful, calming atmosphere perfect for when you're feeling {sentiment}. The quiet environment will help you relax and unwind.",
+        "Stress relief, relaxation, peaceful dining, quiet contemplation",
+        "Tranquil atmosphere, comfortable seating, soothing environment",
+    ),
+    'excited': (
+        "This vibrant café matches your {sentiment} energy perfectly! The lively atmosphere will keep your spirits high.",
+        "Celebrations, social gatherings, energetic dining, fun experiences",
+        "Vibrant atmosphere, social environment, exciting menu options",
+    ),
+    'focused': (
+        "This café provides the perfect environment for your {sentiment} mindset. The quiet atmosphere supports concentration and focus.",
+        "Study sessions, work meetings, focused dining, concentration",
+        "Quiet atmosphere, good lighting, comfortable work spaces",
+    ),
+    None: (
+        "This café is ideal for your {sentiment} mood! The atmosphere perfectly complements your current state of mind.",
+        "Quality dining, authentic matcha experience, comfortable atmosphere",
+        "High rating, good location, authentic atmosphere",
+    ),
+}
+
+MATCHA_TEMPLATE = "This café specializes in authentic matcha, offering you the genuine Japanese tea experience you're looking for."
+
+RATING_TEMPLATES = {
+    'excellent': "With an excellent {rating}-star rating, this café consistently delivers outstanding quality and service.",
+    'solid': "This café offers a solid {rating}-star experience with good value for your money.",
+}
+
+DISTANCE_TEMPLATES = {
+    'near': "Located just {distance} km away, this café is extremely convenient for your current location.",
+    'short': "At {distance} km away, this café is easily accessible and worth the short trip.",
+    'far': "While {distance} km away, this café's exceptional quality makes it worth the journey.",
+}
+
+RANK_TEMPLATES = {
+    1: "This café ranks #1 because it perfectly balances your {sentiment} mood, location convenience, and quality expectations.",
+    2: "This café ranks #2 as an excellent alternative that closely matches your needs and preferences.",
+    3: "This café ranks #3 as a solid option that meets your basic requirements and offers good value.",
+}
+
+BUDGET_EXPLANATION = "This café provides excellent value for the quality and experience offered."
+
+
+def build_templates():
+    """Format strings for every insight field, keyed on (mood, rank, rating bucket, distance bucket, matcha)"""
+    table = {}
+    for mood, rank, rating_bucket, distance_bucket, matcha in product(
+        MOOD_TEMPLATES, RANK_TEMPLATES, RATING_TEMPLATES, DISTANCE_TEMPLATES, (True, False)
+    ):
+        mood_match, best_for, key_features = MOOD_TEMPLATES[mood]
+        quality = MATCHA_TEMPLATE if matcha else RATING_TEMPLATES[rating_bucket]
+        table[mood, rank, rating_bucket, distance_bucket, matcha] = {
+            'rank': rank,
+            'reason': f"{quality} {mood_match} The combination of quality, atmosphere, and convenience makes this an ideal choice for your current needs.",
+            'mood_match': mood_match,
+            'best_for': best_for,
+            'key_features': key_features,
+            'why_better_than_others': RANK_TEMPLATES[rank],
+            'budget_explanation': BUDGET_EXPLANATION,
+            'distance_benefit': DISTANCE_TEMPLATES[distance_bucket],
+        }
+    return table
+
+
+INSIGHT_TEMPLATES = build_templates()
+
+
+def distance_bucket(distance):
+    if distance <= 1.0:
+        return 'near'
+    if distance <= 2.0:
+        return 'short'
+    return 'far'
+
+
+@lru_cache(maxsize=4096)
+def _render(sentiment, rank, rating, distance, matcha):
+    key = (
+        sentiment if sentiment in MOOD_TEMPLATES else None,
+        min(rank, 3),
+        'excellent' if rating >= 4.5 else 'solid',
+        distance_bucket(distance),
+        matcha,
+    )
+    values = {'sentiment': sentiment, 'rating': rating, 'distance': distance}
+    return tuple(
+        (name, template.format(**values) if isinstance(template, str) else template)
+        for name, template in INSIGHT_TEMPLATES[key].items()
+    )
+
+
+def render_insight(sentiment, rank, rating, distance, place_name):
+    """The ai_insight dict explaining why a café suits the user's mood"""
+    return dict(_render(sentiment, rank, rating, distance, 'matcha' in place_name.lower()))
+
+
+def build_recommendation(place, rank, sentiment):
+    """Chat recommendation dict for a PlaceCandidate at the given rank (1-based)"""
+    return {
+        'id': place.place_id,
+        'place_id': place.place_id,
+        'name': place.name,
+        'address': place.vicinity,
+        'rating': place.rating,
+        'price_level': place.price_range,
+        'distance': place.distance,
+        'photos': place.photos,
+        'ai_insight': render_insight(sentiment, rank, place.rating, place.distance, place.name),
+    }
@@ -0,0 +1,120 @@
+from types import MappingProxyType
+
+from .classifier import tokenize
+
+# Sentiment classes in tie-break order (earlier wins on equal scores)
+SENTIMENTS = ('happy', 'excited', 'stressed', 'social', 'focused', 'calm', 'sad', 'angry')
+
+# Preference signals scored in the same pass as the sentiments
+PREFERENCE_SIGNALS = (
+    ('budget', 'low'),
+    ('budget', 'high'),
+    ('vibe', 'quiet'),
+    ('vibe', 'trendy'),
+)
+
+# Token or bigram -> {signal: weight}; a signal is a sentiment or a (preference, value) pair
+_ENTRIES = {
+    'happy': {'happy': 1.0}, 'great': {'happy': 1.0}, 'awesome': {'happy': 1.0},
+    'love': {'happy': 1.0}, 'loving': {'happy': 1.0}, 'lovely': {'happy': 1.0},
+    'enjoy': {'happy': 1.0}, 'enjoying': {'happy': 1.0}, 'good mood': {'happy': 1.5},
+    'great mood': {'happy': 1.5}, 'feeling good': {'happy': 1.5},
+
+    'excited': {'excited': 1.5}, 'exciting': {'excited': 1.0}, 'celebrate': {'excited': 1.0},
+    'celebrating': {'excited': 1.0}, 'pumped': {'excited': 1.0}, "can't wait": {'excited': 1.5},
+
+    'stressed': {'stressed': 1.5}, 'stressful': {'stressed': 1.0}, 'stress': {'stressed': 1.0},
+    'stressed out': {'stressed': 1.0}, 'busy': {'stressed': 1.0}, 'overwhelmed': {'stressed': 1.0},
+    'anxious': {'stressed': 1.0}, 'exhausted': {'stressed': 1.0}, 'deadline': {'stressed': 1.0},
+    'deadlines': {'stressed': 1.0},
+
+    'friends': {'social': 1.0}, 'friend': {'social': 1.0}, 'meet': {'social': 1.0},
+    'meeting': {'social': 1.0}, 'social': {'social': 1.0}, 'fun': {'social': 1.0},
+    'party': {'social': 1.0}, 'group': {'social': 1.0}, 'catch up': {'social': 1.5},
+    'hang out': {'social': 1.5}, 'hanging out': {'social': 1.5},
+
+    # "work", "study" and "quiet" lean stressed first, as the original keyword lists did
+    'work': {'stressed': 1.0, 'focused': 1.0}, 'working': {'stressed': 1.0, 'focused': 1.0},
+    'study': {'stressed': 1.0, 'focused': 1.0}, 'studying': {'stressed': 1.0, 'focused': 1.0},
+    'focus': {'focused': 1.0}, 'focused': {'focused': 1.0}, 'concentrate': {'focused': 1.0},
+    'concentration': {'focused': 1.0}, 'laptop': {'focused': 1.0}, 'get work': {'focused': 1.0},
+
+    'quiet': {'stressed': 1.0, 'focused': 1.0, ('vibe', 'quiet'): 1.0},
+    'peaceful': {'stressed': 1.0, 'calm': 0.5, ('vibe', 'quiet'): 1.0},
+    'calm': {'calm': 1.0}, 'relax': {'calm': 1.0}, 'relaxed': {'calm': 1.0},
+    'relaxing': {'calm': 1.0}, 'chill': {'calm': 1.0}, 'unwind': {'calm': 1.0},
+
+    'sad': {'sad': 1.0}, 'lonely': {'sad': 1.0}, 'down': {'sad': 0.5}, 'feeling down': {'sad': 1.0},
+    'upset': {'sad': 1.0}, 'not happy': {'sad': 1.0, 'happy': -1.0},
+
+    'angry': {'angry': 1.0}, 'annoyed': {'angry': 1.0}, 'frustrated': {'angry': 1.0},
+    'furious': {'angry': 1.0}, 'irritated': {'angry': 1.0},
+
+    'cheap': {('budget', 'low'): 1.0}, 'affordable': {('budget', 'low'): 1.0},
+    'budget': {('budget', 'low'): 1.0}, 'expensive': {('budget', 'high'): 1.0},
+    'luxury': {('budget', 'high'): 1.0}, 'premium': {('budget', 'high'): 1.0},
+    'cozy': {('vibe', 'quiet'): 1.0}, 'trendy': {('vibe', 'trendy'): 1.0},
+    'vibrant': {('vibe', 'trendy'): 1.0}, 'lively': {('vibe', 'trendy'): 1.0},
+}
+
+SIGNALS = SENTIMENTS + PREFERENCE_SIGNALS
+_signal_index = {signal: index for index, signal in enumerate(SIGNALS)}
+
+# Frozen lookup table: feature -> ((signal index, weight), ...)
+LEXICON = MappingProxyType({
+    feature: tuple((_signal_index[signal], weight) for signal, weight in signals.items())
+    for feature, signals in _ENTRIES.items()
+})
+
+
+def score(text):
+    """Score every sentiment and preference signal for a message in one pass over its tokens and bigrams"""
+    scores = [0.0] * len(SIGNALS)
+    previous = None
+    for token in tokenize(text):
+        for feature in (token, f"{previous} {token}" if previous else None):
+            entries = LEXICON.get(feature)
+            if entries:
+                for index, weight in entries:
+                    scores[index] += weight
+        previous = token
+    return scores
+
+
+def analyze(text):
+    """Keyword sentiment, per-class scores and basic preferences for a message"""
+    scores = score(text)
+    sentiment_scores = dict(zip(SENTIMENTS, scores))
+
+    # max() keeps the first of equal scores, so SENTIMENTS order breaks ties
+    best = max(SENTIMENTS, key=sentiment_scores.__getitem__)
+    sentiment = best if sentiment_scores[best] > 0 else 'neutral'
+
+    preferences = {
+        'budget': 'medium',
+        'vibe': 'neutral',
+        'location': 'anywhere',
+        'special_needs': 'none'
+    }
+    for preference in ('budget', 'vibe'):
+        options = [
+            (scores[_signal_index[signal]], signal[1])
+            for signal in PREFERENCE_SIGNALS if signal[0] == preference
+        ]
+        strongest = max(options, key=lambda option: option[0])
+        if strongest[0] > 0:
+            preferences[preference] = strongest[1]
+
+    return {'sentiment': sentiment, 'scores': sentiment_scores, 'preferences': preferences}
+
+
+def analyze_batch(texts):
+    """analyze() for many messages, e.g. a backfill; repeated messages are scored once"""
+    seen = {}
+    results = []
+    for text in texts:
+        result = seen.get(text)
+        if result is None:
+            result = seen[text] = analyze(text)
+        results.append(result)
+    return results
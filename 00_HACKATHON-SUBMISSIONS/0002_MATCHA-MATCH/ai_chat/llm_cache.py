@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+_whitespace = re.compile(r'\s+')
+
+
+class LLMCache:
+    """
+    Persistent cache of Ollama responses in a local SQLite file.
+
+    Entries are keyed by a hash of (model, normalised prompt, options), so the
+    same prompt reformatted with different indentation still hits. Entries
+    expire after ttl seconds and the least recently used ones are evicted
+    once there are more than max_entries.
+    """
+
+    def __init__(self, path, ttl=86400, max_entries=5000):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._conn_pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # Opened lazily so importing this module never touches the disk; a
+        # forked worker opens its own connection
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn_pid = os.getpid()
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS llm_cache ('
+                ' key TEXT PRIMARY KEY,'
+                ' response TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL,'
+                ' accessed_at REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)')
+        return self._conn
+
+    def make_key(self, model, prompt, options=None):
+        """Fingerprint of a generate call"""
+        normalised = _whitespace.sub(' ', prompt).strip()
+        raw = json.dumps([model, normalised, options or {}], sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute('SELECT response, expires_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+            if row is not None and row[1] > now:
+                conn.execute('UPDATE llm_cache SET accessed_at = ? WHERE key = ?', (now, key))
+                self.hits += 1
+                return row[0]
+            if row is not None:
+                conn.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+            self.misses += 1
+            return None
+
+    def set(self, key, response):
+        """Store response under key, evicting the least recently used entries"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO llm_cache (key, response, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, response, now + self.ttl, now)
+            )
+            if conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0] > self.max_entries:
+                # Expired entries go first, then the least recently used
+                conn.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (now,))
+                excess = conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0] - self.max_entries
+                if excess > 0:
+                    conn.execute(
+                        'DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)',
+                        (excess,)
+                    )
+
+    def clear(self):
+        with self._lock:
+            self._connection().execute('DELETE FROM llm_cache')
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'size': self._connection().execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0],
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+            }
+
+
+llm_cache = LLMCache(
+    getattr(settings, 'OLLAMA_CACHE_PATH', 'llm_cache.sqlite3'),
+    ttl=getattr(settings, 'OLLAMA_CACHE_TTL', 86400),
+    max_entries=getattr(settings, 'OLLAMA_CACHE_MAX_ENTRIES', 5000),
+)
@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import RequestFactory
+from django.utils import timezone
+
+from ai_chat.persistence import save_chat_turn
+from ai_chat.views import get_conversation_history
+
+PROFILES = (
+    ('default', 'false'),  # Django's SQLite defaults
+    ('production', 'true'),  # backend.sqlite with WAL and pragmas
+)
+
+
+class Command(BaseCommand):
+    help = "Measure chat turn write and history read throughput with and without the SQLite production profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent writers")
+        parser.add_argument('--turns', type=int, default=50, help="Chat turns saved per writer")
+        parser.add_argument('--reads', type=int, default=2, help="History pages read after each turn")
+        parser.add_argument('--worker', action='store_true', help="Run one profile against the current database")
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self.run_workload(options)))
+            return
+
+        # Each profile runs in a fresh process against a fresh database file,
+        # since the profile is chosen when settings are loaded
+        self.stdout.write(
+            f"{options['threads']} writers x {options['turns']} turns, {options['reads']} history reads per turn\n"
+        )
+        self.stdout.write(f"{'profile':<12}{'turns/s':>10}{'reads/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+        for name, enabled in PROFILES:
+            with tempfile.TemporaryDirectory() as directory:
+                env = dict(
+                    os.environ,
+                    SQLITE_PROFILE=enabled,
+                    SQLITE_READ_ALIAS=enabled,
+                    DATABASE_PATH=os.path.join(directory, 'benchmark.sqlite3'),
+                )
+                output = subprocess.run(
+                    [
+                        sys.executable, str(settings.BASE_DIR / 'manage.py'), 'db_benchmark', '--worker',
+                        '--threads', str(options['threads']),
+                        '--turns', str(options['turns']),
+                        '--reads', str(options['reads']),
+                    ],
+                    env=env, capture_output=True, text=True, check=True,
+                ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            self.stdout.write(
+                f"{name:<12}{result['turns_per_second']:>10.1f}{result['reads_per_second']:>10.1f}"
+                f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['errors']:>8}"
+            )
+
+    def run_workload(self, options):
+        call_command('migrate', verbosity=0, interactive=False)
+        factory = RequestFactory()
+        latencies = []
+        errors = []
+        reads = []
+        lock = threading.Lock()
+
+        def writer(number):
+            try:
+                for turn in range(options['turns']):
+                    session_id = f"bench-{number}-{turn % 5}"
+                    start = time.perf_counter()
+                    try:
+                        save_chat_turn(
+                            session_id, f"message {turn}", timezone.now(),
+                            {'sentiment': 'happy', 'confidence': 0.9, 'preferences': {'budget': 'low'}},
+                            f"reply {turn}",
+                            [{'id': f"place-{place}", 'name': f"Cafe {place}"} for place in range(3)]
+                        )
+                    except Exception as e:
+                        with lock:
+                            errors.append(str(e))
+                        continue
+                    elapsed = time.perf_counter() - start
+                    read_count = 0
+                    for _ in range(options['reads']):
+                        response = get_conversation_history(factory.get('/', {'limit': 20}), session_id)
+                        read_count += response.status_code == 200
+                    with lock:
+                        latencies.append(elapsed)
+                        reads.append(read_count)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=writer, args=(number,)) for number in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            'turns_per_second': len(latencies) / seconds,
+            'reads_per_second': sum(reads) / seconds,
+            'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+            'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+            'errors': len(errors),
+        }
@@ -0,0 +1,93 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ai_chat import ollama
+from ai_chat.classifier import SEED_EXAMPLES, NaiveBayesClassifier, training_examples
+from ai_chat.views import build_sentiment_prompt, fallback_sentiment_analysis_batch, parse_sentiment_response
+
+
+class Command(BaseCommand):
+    help = "Compare accuracy and latency of the sentiment tiers (local classifier, keywords, Ollama)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--folds', type=int, default=5, help="Cross-validation folds for the classifier")
+        parser.add_argument('--threshold', type=float, default=None,
+                            help="Routing threshold to report (defaults to SENTIMENT_CLASSIFIER_THRESHOLD)")
+        parser.add_argument('--ollama', action='store_true', help="Also label the examples with Ollama (slow)")
+        parser.add_argument('--limit', type=int, default=50, help="Maximum examples sent to Ollama")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        examples = training_examples()
+        random.Random(options['seed']).shuffle(examples)
+        threshold = options['threshold']
+        if threshold is None:
+            threshold = getattr(settings, 'SENTIMENT_CLASSIFIER_THRESHOLD', 0.8)
+        self.stdout.write(f"{len(examples)} labelled examples, {options['folds']}-fold cross-validation\n")
+
+        # Local classifier: every example is predicted by a model that never saw it
+        folds = max(2, min(options['folds'], len(examples)))
+        predictions = []
+        predict_seconds = 0.0
+        for fold in range(folds):
+            train = [example for index, example in enumerate(examples) if index % folds != fold]
+            test = [example for index, example in enumerate(examples) if index % folds == fold]
+            classifier = NaiveBayesClassifier().fit(train)
+            for text, label in test:
+                start = time.perf_counter()
+                sentiment, confidence = classifier.predict(text)
+                predict_seconds += time.perf_counter() - start
+                predictions.append((label, sentiment, confidence))
+        self.report_tier('classifier', [(label, sentiment) for label, sentiment, _ in predictions], predict_seconds)
+
+        # Keyword fallback: the lexicon was written from the seed examples, so
+        # it is scored on the stored Ollama-labelled messages only
+        seed_texts = {text for text, _ in SEED_EXAMPLES}
+        held_out = [(text, label) for text, label in examples if text not in seed_texts]
+        keyword_examples = held_out or examples
+        start = time.perf_counter()
+        keyword_results = fallback_sentiment_analysis_batch([text for text, _ in keyword_examples])
+        keyword_labels = [(label, result['sentiment']) for (_, label), result in zip(keyword_examples, keyword_results)]
+        self.report_tier('keywords', keyword_labels, time.perf_counter() - start)
+        if held_out:
+            self.stdout.write(f"           ({len(held_out)} Ollama-labelled messages, seed examples excluded)")
+        else:
+            self.stdout.write(
+                "           (no Ollama-labelled messages yet: scored on the seed examples the lexicon "
+                "was built from, so this overstates its accuracy)"
+            )
+
+        # Routing: share answered locally and how accurate those answers are
+        self.stdout.write("\nthreshold  local  local accuracy")
+        for level in sorted({0.5, 0.6, 0.7, 0.8, 0.9, threshold}):
+            local = [(label, sentiment) for label, sentiment, confidence in predictions if confidence >= level]
+            marker = '  <- configured' if level == threshold else ''
+            self.stdout.write(
+                f"{level:9.2f}  {len(local) / len(predictions):5.0%}  {self.accuracy(local):14.1%}{marker}"
+            )
+
+        if options['ollama']:
+            # Bypass the LLM cache so the latency is that of real Ollama calls
+            sample = examples[:options['limit']]
+            start = time.perf_counter()
+            ollama_labels = [(label, self.ollama_sentiment(text)) for text, label in sample]
+            self.stdout.write('')
+            self.report_tier('ollama', ollama_labels, time.perf_counter() - start)
+
+    def ollama_sentiment(self, text):
+        try:
+            ai_response = ollama.generate('llama2', build_sentiment_prompt(text), timeout=30, cache=False)
+        except Exception as e:
+            self.stderr.write(f"Ollama error: {e}")
+            return None
+        return parse_sentiment_response(text, ai_response)['sentiment']
+
+    def accuracy(self, pairs):
+        return sum(label == predicted for label, predicted in pairs) / len(pairs) if pairs else 0.0
+
+    def report_tier(self, name, pairs, seconds):
+        per_message = seconds / len(pairs) * 1e6 if pairs else 0.0
+        self.stdout.write(f"{name:<10} accuracy {self.accuracy(pairs):6.1%}   {per_message:10.1f} us/message")
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.23 on 2026-10-17 22:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_chat', '0001_initial'),
+    ]
+
+    operations = [
+        # Rows saved before sources were recorded are marked unknown, so they
+        # are not mistaken for Ollama labels; new rows default to ollama
+        migrations.AddField(
+            model_name='sentimentanalysis',
+            name='source',
+            field=models.CharField(choices=[('ollama', 'Ollama'), ('classifier', 'Local classifier'), ('keywords', 'Keyword fallback'), ('unknown', 'Unknown (saved before sources were recorded)')], default='unknown', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='sentimentanalysis',
+            name='source',
+            field=models.CharField(choices=[('ollama', 'Ollama'), ('classifier', 'Local classifier'), ('keywords', 'Keyword fallback'), ('unknown', 'Unknown (saved before sources were recorded)')], default='ollama', max_length=20),
+        ),
+    ]
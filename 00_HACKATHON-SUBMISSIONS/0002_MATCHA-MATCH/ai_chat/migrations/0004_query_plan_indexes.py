@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-17 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_chat', '0003_message_preference_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='airecommendation',
+            index=models.Index(fields=['conversation', '-created_at'], name='recommendation_conv_created'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['-updated_at'], name='conversation_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='sentimentanalysis',
+            index=models.Index(fields=['source', '-created_at'], name='sentiment_source_created'),
+        ),
+        migrations.AddIndex(
+            model_name='userpreference',
+            index=models.Index(fields=['session_id', '-extracted_at'], name='preference_session_extracted'),
+        ),
+    ]
@@ -11,6 +11,10 @@ class Conversation(models.Model):
     
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Backs the default ordering, e.g. the admin changelist
+            models.Index(fields=['-updated_at'], name='conversation_updated'),
+        ]
 
 class Message(models.Model):
     """Individual messages in a conversation"""
@@ -26,6 +30,10 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # History pages: one conversation's messages in time order
+            models.Index(fields=['conversation', 'timestamp'], name='message_conversation_time'),
+        ]
 
 class SentimentAnalysis(models.Model):
     """Stores sentiment analysis results for user messages"""
@@ -41,14 +49,26 @@ class SentimentAnalysis(models.Model):
         ('focused', 'Focused'),
     ]
     
+    SOURCE_CHOICES = [
+        ('ollama', 'Ollama'),
+        ('classifier', 'Local classifier'),
+        ('keywords', 'Keyword fallback'),
+        ('unknown', 'Unknown (saved before sources were recorded)'),
+    ]
+    
     message = models.OneToOneField(Message, on_delete=models.CASCADE, related_name='sentiment')
     sentiment = models.CharField(max_length=20, choices=SENTIMENT_CHOICES)
     confidence = models.FloatField(default=0.0)  # 0.0 to 1.0
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='ollama')  # Which tier labelled it
     extracted_preferences = models.JSONField(default=dict)  # Store extracted preferences
     created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Classifier training data: Ollama-labelled rows, newest first
+            models.Index(fields=['source', '-created_at'], name='sentiment_source_created'),
+        ]
 
 class UserPreference(models.Model):
     """Stores user preferences extracted from conversations"""
@@ -62,6 +82,12 @@ class UserPreference(models.Model):
     class Meta:
         ordering = ['-extracted_at']
         unique_together = ['user', 'session_id', 'preference_type']
+        indexes = [
+            # Preference lookups and upserts by anonymous session
+            models.Index(fields=['session_id', 'preference_type'], name='preference_session_type'),
+            # A session's preferences in the default newest-first order
+            models.Index(fields=['session_id', '-extracted_at'], name='preference_session_extracted'),
+        ]
 
 class AIRecommendation(models.Model):
     """Stores AI-generated recommendations for cafés"""
@@ -75,3 +101,7 @@ class AIRecommendation(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A conversation's recommendations in the default newest-first order
+            models.Index(fields=['conversation', '-created_at'], name='recommendation_conv_created'),
+        ]
@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from backend.clients import get_async_client
+
+from .llm_cache import llm_cache
+
+# The LLM cache does SQLite I/O; async callers run it in a thread. It is not
+# the ORM, so it need not wait for Django's single sync thread
+acache_get = sync_to_async(llm_cache.get, thread_sensitive=False)
+acache_set = sync_to_async(llm_cache.set, thread_sensitive=False)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+class OllamaError(Exception):
+    """Ollama answered with a non-200 status"""
+
+    def __init__(self, status_code, body=''):
+        super().__init__(f"Ollama returned HTTP {status_code}: {body[:200]}")
+        self.status_code = status_code
+
+
+def get_session():
+    """
+    Return the shared Ollama session for this worker process.
+
+    Connections are pooled and kept alive, so a chat turn does not pay for
+    TCP setup on each of its Ollama calls. A forked worker builds its own.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            pool_size = getattr(settings, 'OLLAMA_POOL_SIZE', 10)
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+            _session_pid = pid
+    return _session
+
+
+def build_payload(model, prompt, stream=False, options=None):
+    """JSON body for /api/generate; keep_alive keeps the model loaded after the call"""
+    payload = {
+        'model': model,
+        'prompt': prompt,
+        'stream': stream,
+        'keep_alive': getattr(settings, 'OLLAMA_KEEP_ALIVE', '30m'),
+    }
+    if options:
+        payload['options'] = options
+    return payload
+
+
+def generate_url():
+    return getattr(settings, 'OLLAMA_BASE_URL', 'http://localhost:11434').rstrip('/') + '/api/generate'
+
+
+def cache_key(model, prompt, options, cache):
+    """LLM cache key for a call, or None when the cache is bypassed"""
+    if not cache or not getattr(settings, 'OLLAMA_CACHE_ENABLED', True):
+        return None
+    return llm_cache.make_key(model, prompt, options)
+
+
+def generate(model, prompt, timeout, options=None, cache=True):
+    """
+    Run a non-streaming generate call and return the response text.
+
+    Responses are served from and stored in the LLM cache unless cache=False.
+    """
+    key = cache_key(model, prompt, options, cache)
+    if key is not None:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+
+    response = get_session().post(
+        generate_url(),
+        json=build_payload(model, prompt, options=options),
+        timeout=(getattr(settings, 'OLLAMA_CONNECT_TIMEOUT', 3), timeout),
+    )
+    if response.status_code != 200:
+        raise OllamaError(response.status_code, response.text)
+    text = response.json().get('response', '')
+    if key is not None:
+        llm_cache.set(key, text)
+    return text
+
+
+def generate_stream(model, prompt, timeout, options=None, cache=True):
+    """
+    Run a streaming generate call, yielding response text as Ollama produces it.
+
+    timeout bounds the wait for each chunk rather than the whole reply. A
+    cached response is yielded as one piece; a completed stream is cached.
+    """
+    key = cache_key(model, prompt, options, cache)
+    if key is not None:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    pieces = []
+    with get_session().post(
+        generate_url(),
+        json=build_payload(model, prompt, stream=True, options=options),
+        timeout=(getattr(settings, 'OLLAMA_CONNECT_TIMEOUT', 3), timeout),
+        stream=True,
+    ) as response:
+        if response.status_code != 200:
+            raise OllamaError(response.status_code, response.text)
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('error'):
+                raise OllamaError(response.status_code, chunk['error'])
+            if chunk.get('response'):
+                pieces.append(chunk['response'])
+                yield chunk['response']
+            if chunk.get('done'):
+                if key is not None:
+                    llm_cache.set(key, ''.join(pieces))
+                break
+
+
+def build_async_client():
+    """Async counterpart of get_session()"""
+    pool_size = getattr(settings, 'OLLAMA_POOL_SIZE', 10)
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+    )
+
+
+async def agenerate(model, prompt, timeout, options=None, cache=True):
+    """Async generate() over the event loop's pooled httpx client"""
+    key = cache_key(model, prompt, options, cache)
+    if key is not None:
+        cached = await acache_get(key)
+        if cached is not None:
+            return cached
+
+    client = get_async_client('ollama', build_async_client)
+    response = await client.post(
+        generate_url(),
+        json=build_payload(model, prompt, options=options),
+        timeout=httpx.Timeout(timeout, connect=getattr(settings, 'OLLAMA_CONNECT_TIMEOUT', 3)),
+    )
+    if response.status_code != 200:
+        raise OllamaError(response.status_code, response.text)
+    text = response.json().get('response', '')
+    if key is not None:
+        await acache_set(key, text)
+    return text
+
+
+async def agenerate_stream(model, prompt, timeout, options=None, cache=True):
+    """Async generate_stream()"""
+    key = cache_key(model, prompt, options, cache)
+    if key is not None:
+        cached = await acache_get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    pieces = []
+    client = get_async_client('ollama', build_async_client)
+    async with client.stream(
+        'POST',
+        generate_url(),
+        json=build_payload(model, prompt, stream=True, options=options),
+        timeout=httpx.Timeout(timeout, connect=getattr(settings, 'OLLAMA_CONNECT_TIMEOUT', 3)),
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise OllamaError(response.status_code, response.text)
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('error'):
+                raise OllamaError(response.status_code, chunk['error'])
+            if chunk.get('response'):
+                pieces.append(chunk['response'])
+                yield chunk['response']
+            if chunk.get('done'):
+                if key is not None:
+                    await acache_set(key, ''.join(pieces))
+                break
@@ -0,0 +1,286 @@
+import atexit
+import json
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import AIRecommendation, Conversation, Message, SentimentAnalysis, UserPreference
+
+
+@dataclass
+class ChatTurn:
+    """Everything a chat turn writes to the database"""
+    session_id: str
+    user_message: str
+    received_at: datetime
+    sentiment_result: dict
+    ai_message: str
+    cafe_recommendations: List[dict] = field(default_factory=list)
+    replied_at: datetime = field(default_factory=timezone.now)
+
+
+def save_chat_turn(session_id, user_message, received_at, sentiment_result, ai_message, cafe_recommendations):
+    """
+    Persist a whole chat turn in one transaction.
+
+    The conversation, both messages, the sentiment analysis, the preferences
+    and the recommendations are committed together, so a turn costs one
+    SQLite commit instead of one per row.
+    """
+    turn = ChatTurn(session_id, user_message, received_at, sentiment_result, ai_message, cafe_recommendations)
+    return save_chat_turns([turn])[turn.session_id]
+
+
+def save_chat_turns(turns):
+    """
+    Persist a batch of chat turns in one transaction, with one bulk insert
+    per table. Returns the conversations by session_id.
+    """
+    with transaction.atomic():
+        conversations = get_or_create_conversations({turn.session_id for turn in turns})
+
+        # bulk_create sets the primary keys on SQLite 3.35+, which the sentiment rows need
+        user_messages = Message.objects.bulk_create([
+            Message(
+                conversation=conversations[turn.session_id],
+                role='user',
+                content=turn.user_message,
+                timestamp=turn.received_at
+            )
+            for turn in turns
+        ])
+
+        SentimentAnalysis.objects.bulk_create([
+            SentimentAnalysis(
+                message=user_msg,
+                sentiment=turn.sentiment_result.get('sentiment', 'neutral'),
+                confidence=turn.sentiment_result.get('confidence', 0.8),
+                source=turn.sentiment_result.get('source', 'unknown'),
+                extracted_preferences=json.dumps(turn.sentiment_result.get('preferences', []))
+            )
+            for turn, user_msg in zip(turns, user_messages)
+        ])
+
+        upsert_user_preferences([
+            (turn.session_id, turn.sentiment_result.get('preferences', []), turn.sentiment_result.get('confidence', 0.8))
+            for turn in turns
+        ])
+
+        Message.objects.bulk_create([
+            Message(
+                conversation=conversations[turn.session_id],
+                role='assistant',
+                content=turn.ai_message,
+                timestamp=turn.replied_at
+            )
+            for turn in turns
+        ])
+
+        AIRecommendation.objects.bulk_create([
+            AIRecommendation(
+                conversation=conversations[turn.session_id],
+                place_id=cafe['id'],
+                place_name=cafe['name'],
+                recommendation_reason=f"Matches your {sentiment} mood and preferences",
+                sentiment_context=sentiment
+            )
+            for turn in turns
+            for sentiment in [turn.sentiment_result.get('sentiment', 'neutral')]
+            for cafe in turn.cafe_recommendations
+        ])
+
+    return conversations
+
+
+def get_or_create_conversations(session_ids):
+    """Conversations by session_id, creating the missing ones"""
+    # INSERT OR IGNORE first: starting the transaction with a write takes
+    # SQLite's write lock up front (waiting on the busy timeout), whereas a
+    # read followed by a write fails at once with "database is locked" when
+    # another connection is writing
+    Conversation.objects.bulk_create(
+        [Conversation(session_id=session_id) for session_id in session_ids], ignore_conflicts=True
+    )
+    return {
+        conversation.session_id: conversation
+        for conversation in Conversation.objects.filter(session_id__in=session_ids)
+    }
+
+
+def upsert_user_preferences(entries):
+    """
+    Upsert extracted preferences from (session_id, preferences, confidence)
+    entries: one query finds the stored ones, then they are updated and the
+    new ones inserted in a batch each. Later entries win.
+
+    An INSERT ... ON CONFLICT upsert cannot be used because anonymous rows
+    have a NULL user, and NULLs never conflict in the unique constraint.
+    """
+    try:
+        values = {}
+        for session_id, preferences, confidence in entries:
+            if not isinstance(preferences, dict):
+                continue
+            for pref_type, pref_value in preferences.items():
+                if pref_value and pref_value != 'none':
+                    values[(session_id, pref_type)] = (pref_value, confidence)
+        if not values:
+            return
+        now = timezone.now()
+
+        # A savepoint, so a failure here does not abort the caller's transaction
+        with transaction.atomic():
+            existing = list(UserPreference.objects.filter(
+                session_id__in={session_id for session_id, _ in values},
+                preference_type__in={pref_type for _, pref_type in values}
+            ))
+            existing = [
+                preference for preference in existing
+                if (preference.session_id, preference.preference_type) in values
+            ]
+            for preference in existing:
+                preference.preference_value, preference.confidence = values[
+                    (preference.session_id, preference.preference_type)
+                ]
+                preference.extracted_at = now
+            UserPreference.objects.bulk_update(existing, ['preference_value', 'confidence', 'extracted_at'])
+
+            stored = {(preference.session_id, preference.preference_type) for preference in existing}
+            UserPreference.objects.bulk_create([
+                UserPreference(
+                    session_id=session_id,
+                    preference_type=pref_type,
+                    preference_value=pref_value,
+                    confidence=confidence,
+                    extracted_at=now
+                )
+                for (session_id, pref_type), (pref_value, confidence) in values.items()
+                if (session_id, pref_type) not in stored
+            ])
+    except Exception as e:
+        print(f"Error saving preferences: {e}")
+
+
+class ChatTurnWriter:
+    """
+    Write-behind queue for chat turns.
+
+    Requests push their turn onto a bounded queue and return; one daemon
+    thread drains it in batches through save_chat_turns(). When the queue is
+    full a request waits up to block_timeout seconds for space and then saves
+    its own turn, so a slow database slows requests down instead of losing
+    turns or growing memory. The queue is flushed at interpreter exit.
+    """
+
+    def __init__(self, max_size=1000, batch_size=50, block_timeout=0.5):
+        self.batch_size = batch_size
+        self.block_timeout = block_timeout
+        self.queued = 0
+        self.written = 0
+        self.batches = 0
+        self.inline_writes = 0
+        self.failed = 0
+        self.last_error = None
+        self._queue = queue.Queue(maxsize=max_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='chat-turn-writer', daemon=True)
+                    self._thread.start()
+
+    def submit(self, turn):
+        """Queue a turn for writing, or write it now if the queue stays full"""
+        self._ensure_worker()
+        try:
+            self._queue.put(turn, timeout=self.block_timeout)
+        except queue.Full:
+            with self._lock:
+                self.inline_writes += 1
+            self._write([turn])
+            return
+        with self._lock:
+            self.queued += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, turns):
+        try:
+            save_chat_turns(turns)
+            with self._lock:
+                self.written += len(turns)
+                self.batches += 1
+        except Exception as e:
+            print(f"Error writing {len(turns)} chat turns: {e}")
+            if len(turns) > 1:
+                # Retry one by one so a single bad turn does not lose the batch
+                for turn in turns:
+                    self._write([turn])
+            else:
+                with self._lock:
+                    self.failed += 1
+                    self.last_error = str(e)
+        finally:
+            if threading.current_thread() is self._thread:
+                close_old_connections()
+
+    def flush(self, timeout=10):
+        """Wait up to timeout seconds for queued turns to be written; True if the queue drained"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline or self._thread is None or not self._thread.is_alive():
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self._queue.qsize(),
+                'queued': self.queued,
+                'written': self.written,
+                'batches': self.batches,
+                'inline_writes': self.inline_writes,
+                'failed': self.failed,
+                'last_error': self.last_error,
+            }
+
+
+chat_turn_writer = ChatTurnWriter(
+    max_size=getattr(settings, 'CHAT_WRITE_QUEUE_SIZE', 1000),
+    batch_size=getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 50),
+    block_timeout=getattr(settings, 'CHAT_WRITE_BLOCK_TIMEOUT', 0.5),
+)
+atexit.register(chat_turn_writer.flush, getattr(settings, 'CHAT_WRITE_FLUSH_TIMEOUT', 10))
+
+
+def persist_chat_turn(session_id, user_message, received_at, sentiment_result, ai_message, cafe_recommendations):
+    """Save a chat turn now, or hand it to the write-behind queue when CHAT_WRITE_BEHIND is on"""
+    if not getattr(settings, 'CHAT_WRITE_BEHIND', False):
+        save_chat_turn(session_id, user_message, received_at, sentiment_result, ai_message, cafe_recommendations)
+        return
+    chat_turn_writer.submit(
+        ChatTurn(session_id, user_message, received_at, sentiment_result, ai_message, cafe_recommendations)
+    )
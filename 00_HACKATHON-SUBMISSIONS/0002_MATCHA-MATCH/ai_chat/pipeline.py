@@ -0,0 +1,145 @@
+import asyncio
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+from django.db import connections
+
+
+class StageGraph:
+    """
+    A small dependency graph of pipeline stages.
+
+    Each stage is called with the results of its dependencies, in the order
+    they were listed, as soon as all of them are available; stages with no
+    path between them run at the same time. Start and end times are recorded
+    per stage so report() can show the critical path of a run.
+
+    on_stage_done(name, result), if given, is called as each stage finishes,
+    so callers can act on early results before the whole graph is done.
+    """
+
+    def __init__(self, on_stage_done=None):
+        self.on_stage_done = on_stage_done
+        self.stages = {}
+        self.timings = {}
+        self._origin = None
+
+    def add(self, name, fn, deps=()):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self.stages[name] = (fn, tuple(deps))
+        return self
+
+    def _timed(self, name, fn, args, close_connections=False):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.timings[name] = (start - self._origin, time.perf_counter() - self._origin)
+            if close_connections:
+                # The thread belongs to a pool that is thrown away after the
+                # run, so its DB connections would otherwise never be closed
+                connections.close_all()
+
+    async def _atimed(self, name, fn, args, executor):
+        start = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                return await fn(*args)
+            # Sync stages go to the thread pool so they never block the loop
+            return await asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args))
+        finally:
+            self.timings[name] = (start - self._origin, time.perf_counter() - self._origin)
+
+    def run(self, executor=None):
+        """
+        Run every stage on a thread pool and return {stage: result}.
+
+        Without an executor the run gets its own pool, one thread per stage,
+        so concurrent runs never queue behind each other's slow stages, and
+        each stage closes its thread's DB connections when it finishes.
+        """
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=max(len(self.stages), 1), thread_name_prefix='chat-pipeline')
+        try:
+            return self._run(executor, close_connections=own_executor)
+        finally:
+            if own_executor:
+                # Do not wait for stages still running after a failure
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, executor, close_connections=False):
+        self._origin = time.perf_counter()
+        results = {}
+        running = {}
+        waiting = dict(self.stages)
+        while waiting or running:
+            for name, (fn, deps) in list(waiting.items()):
+                if all(dep in results for dep in deps):
+                    args = [results[dep] for dep in deps]
+                    running[executor.submit(self._timed, name, fn, args, close_connections)] = name
+                    del waiting[name]
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    raise
+                if self.on_stage_done:
+                    self.on_stage_done(name, results[name])
+        return results
+
+    async def arun(self, executor=None):
+        """Run every stage as a task on the running loop; sync stages use executor (default: the loop's)"""
+        self._origin = time.perf_counter()
+        tasks = {}
+
+        async def run_stage(name, fn, deps):
+            args = [await tasks[dep] for dep in deps]
+            result = await self._atimed(name, fn, args, executor)
+            if self.on_stage_done:
+                self.on_stage_done(name, result)
+            return result
+
+        for name, (fn, deps) in self.stages.items():
+            tasks[name] = asyncio.ensure_future(run_stage(name, fn, deps))
+        try:
+            await asyncio.gather(*tasks.values())
+        except Exception:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        return {name: task.result() for name, task in tasks.items()}
+
+    def report(self):
+        """Stage timings (ms) plus the critical path through the graph"""
+        durations = {name: end - start for name, (start, end) in self.timings.items()}
+
+        # Longest chain of dependent stage durations, in insertion (topological) order
+        finish, previous = {}, {}
+        for name, (fn, deps) in self.stages.items():
+            slowest = max(deps, key=lambda dep: finish.get(dep, 0), default=None)
+            previous[name] = slowest
+            finish[name] = durations.get(name, 0) + (finish.get(slowest, 0) if slowest else 0)
+        path = []
+        name = max(finish, key=finish.get, default=None)
+        while name is not None:
+            path.insert(0, name)
+            name = previous[name]
+
+        return {
+            'wall_ms': round(max((end for _, end in self.timings.values()), default=0) * 1000, 1),
+            'serial_ms': round(sum(durations.values()) * 1000, 1),
+            'critical_path': path,
+            'critical_path_ms': round(finish[path[-1]] * 1000, 1) if path else 0.0,
+            'stages': {
+                name: {'start_ms': round(start * 1000, 1), 'duration_ms': round((end - start) * 1000, 1)}
+                for name, (start, end) in self.timings.items()
+            },
+        }
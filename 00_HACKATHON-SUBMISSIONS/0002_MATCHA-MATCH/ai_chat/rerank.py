@@ -0,0 +1,128 @@
+"""
+LLM re-ranking of café candidates under a latency budget.
+
+The ranking call runs in the background and the request waits for it only
+until the deadline. A call that finishes late still stores its answer in
+the LLM cache, so the next identical request gets the LLM ranking at once.
+"""
+import difflib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+
+from . import ollama
+
+# Insight fields the model may write; anything else in its answer is ignored
+LLM_INSIGHT_FIELDS = ('reason', 'mood_match', 'best_for', 'key_features', 'why_better_than_others')
+
+rerank_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'AI_RERANK_WORKERS', 2),
+    thread_name_prefix='ai-rerank'
+)
+# Distinct ranking calls allowed in flight; past this the heuristic order is
+# served at once instead of queueing behind calls that will miss their deadline
+MAX_PENDING = getattr(settings, 'AI_RERANK_MAX_PENDING', getattr(settings, 'AI_RERANK_WORKERS', 2))
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def generate_within(model, prompt, deadline, timeout):
+    """
+    Return Ollama's response if it arrives within deadline seconds, else
+    None (also when the call fails).
+
+    The call keeps running after the deadline and its response is cached;
+    identical prompts already in flight share one call instead of queueing
+    another. When MAX_PENDING calls are already in flight nothing is
+    submitted and None is returned at once.
+    """
+    key = ollama.cache_key(model, prompt, None, True) or prompt
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            if len(_in_flight) >= MAX_PENDING:
+                return None
+            future = _in_flight[key] = rerank_executor.submit(ollama.generate, model, prompt, timeout)
+    if leader:
+        # Outside the lock: the callback runs at once if the call already finished
+        future.add_done_callback(lambda done: _finish(key, done))
+    try:
+        return future.result(timeout=deadline)
+    except FutureTimeoutError:
+        return None
+    except Exception:
+        # Already logged by _finish
+        return None
+
+
+def _finish(key, future):
+    with _in_flight_lock:
+        _in_flight.pop(key, None)
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Ollama ranking error: {future.exception()}")
+
+
+def parse_ranking(ai_response):
+    """Ranking entries (dicts with at least cafe_name) from the model's JSON array, best first"""
+    json_start = ai_response.find('[')
+    json_end = ai_response.rfind(']') + 1
+    if json_start == -1 or json_end == 0:
+        return []
+    try:
+        entries = json.loads(ai_response[json_start:json_end])
+    except json.JSONDecodeError:
+        return []
+    entries = [entry for entry in entries if isinstance(entry, dict) and isinstance(entry.get('cafe_name'), str)]
+
+    def rank(entry):
+        try:
+            return int(entry.get('rank'))
+        except (TypeError, ValueError):
+            return len(entries) + 1
+    return sorted(entries, key=rank)
+
+
+def match_ranking(entries, places):
+    """
+    Map ranking entries back to candidates by cafe_name.
+
+    Returns (place, entry) pairs in the model's order. Names are matched
+    exactly (ignoring case) or, failing that, to the closest candidate name;
+    unknown and repeated cafés are dropped.
+    """
+    by_name = {}
+    for place in places:
+        by_name.setdefault(place.name.strip().lower(), place)
+
+    matched = []
+    seen = set()
+    for entry in entries:
+        name = entry['cafe_name'].strip().lower()
+        place = by_name.get(name)
+        if place is None:
+            close = difflib.get_close_matches(name, list(by_name), n=1, cutoff=0.8)
+            place = by_name[close[0]] if close else None
+        if place is not None and place.place_id not in seen:
+            seen.add(place.place_id)
+            matched.append((place, entry))
+    return matched
+
+
+def rerank(places, ai_response, limit=3):
+    """
+    The top candidates in the model's order, topped up from the heuristic order.
+
+    Returns (place, entry) pairs; entry is None for heuristic picks.
+    """
+    ranked = match_ranking(parse_ranking(ai_response), places)[:limit]
+    chosen = {place.place_id for place, _ in ranked}
+    for place in places:
+        if len(ranked) >= limit:
+            break
+        if place.place_id not in chosen:
+            ranked.append((place, None))
+    return ranked
@@ -1,3 +1,893 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from itertools import product
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import ConnectionRouter, DatabaseError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .classifier import NaiveBayesClassifier, SEED_EXAMPLES, route_sentiment, training_examples
+from .models import AIRecommendation, Conversation, Message, SentimentAnalysis, UserPreference
+from . import lexicon, ollama, views
+from . import rerank as rerank_module
+from .llm_cache import LLMCache, llm_cache
+from .persistence import ChatTurn, ChatTurnWriter, save_chat_turn
+from .pipeline import StageGraph
+from .rerank import generate_within, match_ranking, parse_ranking, rerank
+from backend.routers import ReadReplicaRouter
+from backend.sqlite.base import DatabaseWrapper
+from places.models import Place
+from places.services import PlaceCandidate
+
+# EXPLAIN QUERY PLAN details that mean a table is read end to end or sorted
+# in a temporary b-tree; older SQLite versions write "SCAN TABLE x"
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+TEMP_SORT = re.compile(r'^USE TEMP B-TREE FOR (?:ORDER BY|RIGHT PART OF ORDER BY)')
+
+
+def query_plan(sql, params=()):
+    """Detail lines of SQLite's EXPLAIN QUERY PLAN for a statement"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(sql, params=()):
+    """Full table scans and temp-b-tree sorts in a statement's query plan"""
+    return [detail for detail in query_plan(sql, params) if FULL_SCAN.match(detail) or TEMP_SORT.match(detail)]
+
+
+class QueryPlanTests(TestCase):
+    """The hot ai_chat queries must be answered from indexes, without full scans or sorts"""
+
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now()
+        for i in range(3):
+            save_chat_turn(
+                f'session-{i}',
+                f'message {i}',
+                start + timedelta(seconds=i),
+                {
+                    'sentiment': 'happy',
+                    'confidence': 0.9,
+                    'preferences': {'budget': 'low', 'vibe': 'quiet'},
+                    'source': 'ollama'
+                },
+                f'reply {i}',
+                [{'id': f'place-{i}', 'name': f'Cafe {i}'}]
+            )
+        cls.conversation = Conversation.objects.get(session_id='session-0')
+        cls.message = Message.objects.filter(conversation=cls.conversation, role='user').first()
+
+    def assertIndexedQueries(self, queries):
+        """Fail with the offending plans if any captured SELECT or UPDATE scans or sorts a table"""
+        problems = {}
+        for query in queries:
+            sql = query['sql']
+            if sql.split(' ', 1)[0] in ('SELECT', 'UPDATE', 'DELETE'):
+                found = plan_problems(sql)
+                if found:
+                    problems[sql] = found
+        self.assertEqual(problems, {}, "queries fall back to full scans or sorts")
+
+    def assertIndexed(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        self.assertEqual(plan_problems(sql, params), [], f"{sql} falls back to a full scan or sort")
+
+    def test_save_chat_turn(self):
+        with CaptureQueriesContext(connection) as queries:
+            save_chat_turn(
+                'session-0', 'another message', timezone.now(),
+                {'sentiment': 'calm', 'preferences': {'budget': 'high', 'location': 'cbd'}},
+                'another reply', [{'id': 'place-9', 'name': 'Cafe 9'}]
+            )
+        self.assertIndexedQueries(queries)
+
+    def test_conversation_history(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get('/api/ai/history/session-0/', {'limit': 1}).json()
+            self.client.get('/api/ai/history/session-0/', {'limit': 1, 'before': first['next_cursor']})
+        self.assertEqual(len(queries), 2)
+        self.assertIndexedQueries(queries)
+
+    def test_user_preferences(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/ai/preferences/session-0/')
+        self.assertIndexedQueries(queries)
+
+    def test_recommendations_by_conversation(self):
+        self.assertIndexed(AIRecommendation.objects.filter(conversation=self.conversation))
+
+    def test_sentiment_by_message(self):
+        self.assertIndexed(SentimentAnalysis.objects.filter(message=self.message))
+
+    def test_conversation_by_session(self):
+        self.assertIndexed(Conversation.objects.filter(session_id='session-0'))
+
+    def test_preferences_by_session(self):
+        self.assertIndexed(UserPreference.objects.filter(session_id='session-0'))
+
+    def test_classifier_training_examples(self):
+        with CaptureQueriesContext(connection) as queries:
+            training_examples()
+        self.assertIndexedQueries(queries)
+
+    def test_checker_flags_full_scans(self):
+        self.assertNotEqual(plan_problems(*Message.objects.filter(content='x').query.sql_with_params()), [])
+
+
+def chat_turn(message, session_id='session-writer'):
+    return ChatTurn(session_id, message, timezone.now(), {'sentiment': 'happy'}, f'reply to {message}')
+
+
+class ChatTurnWriterTests(TestCase):
+    """Write-behind queue behaviour, with save_chat_turns replaced by a recorder"""
+
+    def setUp(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+        def record(turns):
+            if threading.current_thread().name == 'chat-turn-writer':
+                self.release.wait(5)
+            if any(turn.user_message == 'bad' for turn in turns):
+                raise ValueError('bad turn')
+            self.batches.append([turn.user_message for turn in turns])
+        patcher = mock.patch('ai_chat.persistence.save_chat_turns', side_effect=record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Never leave the worker blocked
+        self.addCleanup(self.release.set)
+
+    def wait_until_taken(self, writer):
+        """Wait for the worker to take everything queued so far"""
+        deadline = time.monotonic() + 5
+        while writer.stats()['pending'] and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def test_full_queue_falls_back_to_an_inline_write(self):
+        writer = ChatTurnWriter(max_size=1, batch_size=10, block_timeout=0.01)
+        self.release.clear()
+        writer.submit(chat_turn('first'))
+        # The worker takes the first turn and blocks; the second fills the queue
+        self.wait_until_taken(writer)
+        writer.submit(chat_turn('queued'))
+        writer.submit(chat_turn('inline'))
+
+        self.assertEqual(self.batches, [['inline']])
+        self.assertEqual(writer.stats()['inline_writes'], 1)
+        self.release.set()
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual(self.batches, [['inline'], ['first'], ['queued']])
+        self.assertEqual(writer.stats()['written'], 3)
+
+    def test_bad_turn_in_a_batch_is_retried_alone(self):
+        writer = ChatTurnWriter(max_size=10, batch_size=10, block_timeout=0.01)
+        self.release.clear()
+        writer.submit(chat_turn('first'))
+        self.wait_until_taken(writer)
+        for message in ('good', 'bad', 'also good'):
+            writer.submit(chat_turn(message))
+        self.release.set()
+
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual(self.batches, [['first'], ['good'], ['also good']])
+        stats = writer.stats()
+        self.assertEqual((stats['written'], stats['failed'], stats['last_error']), (3, 1, 'bad turn'))
+
+    def test_flush_times_out_while_the_worker_is_stuck(self):
+        writer = ChatTurnWriter(max_size=10, batch_size=10, block_timeout=0.01)
+        self.release.clear()
+        writer.submit(chat_turn('stuck'))
+        self.assertFalse(writer.flush(timeout=0.05))
+        self.release.set()
+        self.assertTrue(writer.flush(timeout=5))
+
+
+class ChatTurnWriterFlushTests(TransactionTestCase):
+    """Flushing drains queued turns into the database"""
+
+    # With SQLITE_READ_ALIAS on, chat reads outside a transaction go to 'read'
+    databases = '__all__'
+
+    def test_flush_drains_the_queue(self):
+        writer = ChatTurnWriter(max_size=100, batch_size=3, block_timeout=0.5)
+        for i in range(7):
+            writer.submit(chat_turn(f'message {i}', session_id=f'session-{i % 2}'))
+
+        self.assertTrue(writer.flush(timeout=10))
+        stats = writer.stats()
+        self.assertEqual((stats['pending'], stats['written'], stats['failed']), (0, 7, 0))
+        self.assertEqual(Message.objects.filter(role='user').count(), 7)
+        self.assertEqual(Message.objects.filter(role='assistant').count(), 7)
+        self.assertEqual(Conversation.objects.count(), 2)
+
+
+def candidate(place_id, name):
+    return PlaceCandidate(
+        place_id=place_id, name=name, rating=4.5, price_level=2, vicinity='', lat=0.0, lng=0.0,
+        match_score=90, distance=0.5
+    )
+
+
+class RerankTests(SimpleTestCase):
+    """Parsing and applying the model's ranking, and the bounded ranking pool"""
+
+    places = [
+        candidate('zen', 'Zen Matcha House'),
+        candidate('emerald', 'Emerald Tea Lounge'),
+        candidate('leaf', 'Green Leaf Cafe'),
+        candidate('corner', 'Corner Coffee'),
+    ]
+
+    def test_parse_ranking_rejects_bad_json(self):
+        self.assertEqual(parse_ranking('no ranking here'), [])
+        self.assertEqual(parse_ranking('[{"cafe_name": "Zen Matcha House",]'), [])
+        self.assertEqual(parse_ranking('] backwards ['), [])
+
+    def test_parse_ranking_orders_by_rank(self):
+        entries = parse_ranking(
+            'Sure! [{"cafe_name": "B", "rank": "2"}, "junk", {"rank": 1}, {"cafe_name": "C"},'
+            ' {"cafe_name": "A", "rank": 1}] Hope that helps.'
+        )
+        self.assertEqual([entry['cafe_name'] for entry in entries], ['A', 'B', 'C'])
+
+    def test_match_ranking_fuzzy_names_and_duplicates(self):
+        entries = [
+            {'cafe_name': ' green leaf cafe '},
+            {'cafe_name': 'Zen Matcha Hous'},
+            {'cafe_name': 'Green Leaf Café'},
+            {'cafe_name': 'Nowhere Bakery'},
+        ]
+        matched = match_ranking(entries, self.places)
+        self.assertEqual([place.place_id for place, _ in matched], ['leaf', 'zen'])
+        self.assertEqual(matched[1][1]['cafe_name'], 'Zen Matcha Hous')
+
+    def test_rerank_tops_up_from_the_heuristic_order(self):
+        ranked = rerank(self.places, '[{"cafe_name": "Corner Coffee", "rank": 1, "reason": "close"}]')
+        self.assertEqual([place.place_id for place, _ in ranked], ['corner', 'zen', 'emerald'])
+        self.assertEqual([entry and entry['reason'] for _, entry in ranked], ['close', None, None])
+
+    def test_rerank_without_a_usable_answer_keeps_the_heuristic_order(self):
+        ranked = rerank(self.places, 'I cannot rank these', limit=2)
+        self.assertEqual([(place.place_id, entry) for place, entry in ranked], [('zen', None), ('emerald', None)])
+
+    def test_saturated_pool_serves_heuristics_without_queueing(self):
+        release = threading.Event()
+        prompts = []
+
+        def generate(model, prompt, timeout):
+            prompts.append(prompt)
+            release.wait(5)
+            return f'ranked {prompt}'
+
+        with mock.patch.object(rerank_module.ollama, 'generate', side_effect=generate), \
+                mock.patch.object(rerank_module, 'MAX_PENDING', 1):
+            self.assertIsNone(generate_within('model', 'first', deadline=0.01, timeout=5))
+            # The pool is full: a new prompt is not submitted, a repeated one joins the running call
+            self.assertIsNone(generate_within('model', 'second', deadline=0.01, timeout=5))
+            release.set()
+            self.assertEqual(generate_within('model', 'first', deadline=5, timeout=5), 'ranked first')
+            self.assertEqual(prompts, ['first'])
+
+            deadline = time.monotonic() + 5
+            while rerank_module._in_flight and time.monotonic() < deadline:
+                time.sleep(0.005)
+            self.assertEqual(generate_within('model', 'second', deadline=5, timeout=5), 'ranked second')
+
+
+class FakeOllamaResponse:
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+    def json(self):
+        return {'response': self.text}
+
+
+class LLMCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'llm_cache.sqlite3')
+        self.now = 1000.0
+        clock = mock.patch('ai_chat.llm_cache.time.time', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def cache(self, **kwargs):
+        cache = LLMCache(self.path, **kwargs)
+        self.addCleanup(lambda: cache._conn and cache._conn.close())
+        return cache
+
+    def test_test_runs_use_an_in_memory_cache(self):
+        self.assertEqual(settings.OLLAMA_CACHE_PATH, ':memory:')
+        self.assertEqual(llm_cache.path, ':memory:')
+
+    def test_entries_expire_after_ttl(self):
+        cache = self.cache(ttl=60)
+        cache.set('key', 'answer')
+        self.now += 59
+        self.assertEqual(cache.get('key'), 'answer')
+        self.now += 1
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.stats()['size'], 0)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_least_recently_used_entries_are_evicted_past_max_entries(self):
+        cache = self.cache(max_entries=2)
+        cache.set('a', 'first')
+        self.now += 1
+        cache.set('b', 'second')
+        self.now += 1
+        # Reading a makes b the least recently used
+        self.assertEqual(cache.get('a'), 'first')
+        self.now += 1
+        cache.set('c', 'third')
+        self.assertEqual(cache.stats()['size'], 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'first')
+        self.assertEqual(cache.get('c'), 'third')
+
+    def test_expired_entries_are_evicted_before_live_ones(self):
+        cache = self.cache(ttl=10, max_entries=2)
+        cache.set('old', 'stale')
+        self.now += 5
+        cache.set('live', 'kept')
+        self.now += 6
+        cache.set('new', 'fresh')
+        self.assertEqual(cache.get('live'), 'kept')
+        self.assertEqual(cache.get('new'), 'fresh')
+        self.assertIsNone(cache.get('old'))
+
+    def test_entries_survive_a_new_instance(self):
+        cache = self.cache()
+        key = cache.make_key('model', 'same   prompt\n', {'temperature': 0})
+        cache.set(key, 'answer')
+        reopened = self.cache()
+        self.assertEqual(reopened.get(reopened.make_key('model', 'same prompt', {'temperature': 0})), 'answer')
+
+    def test_generate_bypasses_the_cache_when_asked(self):
+        cache = self.cache()
+        session = mock.Mock()
+        session.post.side_effect = [FakeOllamaResponse(f'answer {n}') for n in range(4)]
+        with mock.patch.object(ollama, 'llm_cache', cache), \
+                mock.patch.object(ollama, 'get_session', return_value=session):
+            self.assertEqual(ollama.generate('model', 'prompt', timeout=5), 'answer 0')
+            self.assertEqual(ollama.generate('model', 'prompt', timeout=5), 'answer 0')
+            self.assertEqual(session.post.call_count, 1)
+
+            self.assertIsNone(ollama.cache_key('model', 'prompt', None, cache=False))
+            self.assertEqual(ollama.generate('model', 'prompt', timeout=5, cache=False), 'answer 1')
+            self.assertEqual(ollama.generate('model', 'other', timeout=5, cache=False), 'answer 2')
+            self.assertEqual(session.post.call_count, 3)
+            # Bypassed calls neither read nor store entries
+            self.assertEqual(cache.stats()['size'], 1)
+            self.assertEqual(ollama.generate('model', 'prompt', timeout=5), 'answer 0')
+
+            with override_settings(OLLAMA_CACHE_ENABLED=False):
+                self.assertEqual(ollama.generate('model', 'prompt', timeout=5), 'answer 3')
+        self.assertEqual(session.post.call_count, 4)
+
+
+def parse_sse(chunk):
+    """(event, data) from one encoded Server-Sent Events message"""
+    if isinstance(chunk, bytes):
+        chunk = chunk.decode()
+    event_line, data_line = chunk.strip().split('\n')
+    return event_line[len('event: '):], json.loads(data_line[len('data: '):])
+
+
+class ChatStreamTests(TransactionTestCase):
+    """The pipeline runs for real; its Ollama and Places stages are faked"""
+
+    # With SQLITE_READ_ALIAS on, chat reads outside a transaction go to 'read'
+    databases = '__all__'
+    sentiment = {'sentiment': 'calm', 'confidence': 0.9, 'preferences': [], 'source': 'classifier'}
+    recommendations = [{'id': 'zen', 'name': 'Zen Tea House'}]
+
+    def setUp(self):
+        # The reply streams once 'recommendations' has been queued, and only
+        # after release is set, so tests can close the stream mid-turn
+        self.recommended = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.saved = threading.Event()
+        build_chat_pipeline = views.build_chat_pipeline
+        persist_chat_turn = views.persist_chat_turn
+
+        def build(*args, on_stage_done=None, **kwargs):
+            def stage_done(name, result):
+                on_stage_done(name, result)
+                if name == 'recommendations':
+                    self.recommended.set()
+            return build_chat_pipeline(*args, on_stage_done=stage_done, **kwargs)
+
+        def generate_stream(*args, **kwargs):
+            self.recommended.wait(5)
+            self.release.wait(5)
+            yield 'Hello'
+            yield ' there'
+
+        async def agenerate_stream(*args, **kwargs):
+            for event in (self.recommended, self.release):
+                while not event.is_set():
+                    await asyncio.sleep(0.001)
+            yield 'Hello'
+            yield ' there'
+
+        def persist(*args):
+            persist_chat_turn(*args)
+            self.saved.set()
+
+        patches = [
+            mock.patch.object(views, 'build_chat_pipeline', side_effect=build),
+            mock.patch.object(views, 'persist_chat_turn', side_effect=persist),
+            mock.patch.object(views, 'analyze_sentiment_with_ollama', return_value=self.sentiment),
+            mock.patch.object(views, 'analyze_sentiment_with_ollama_async', mock.AsyncMock(return_value=self.sentiment)),
+            mock.patch.object(views, 'prefetch_places', return_value=None),
+            mock.patch.object(views, 'aprefetch_places', mock.AsyncMock(return_value=None)),
+            mock.patch.object(views, 'recommend_places', return_value=self.recommendations),
+            mock.patch.object(views.ollama, 'generate_stream', side_effect=generate_stream),
+            mock.patch.object(views.ollama, 'agenerate_stream', side_effect=agenerate_stream),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def post(self, factory, session_id):
+        return factory.post(
+            '/api/ai/chat/stream/', data=json.dumps({'message': 'somewhere calm', 'session_id': session_id}),
+            content_type='application/json'
+        )
+
+    def assertEventOrder(self, events, session_id):
+        names = [event for event, _ in events]
+        self.assertEqual(names, ['start', 'sentiment', 'recommendations', 'token', 'token', 'done'])
+        self.assertEqual(events[0][1], {'session_id': session_id})
+        self.assertEqual(events[1][1], {'sentiment': 'calm'})
+        self.assertEqual(events[2][1], self.recommendations)
+        self.assertEqual([data['text'] for event, data in events if event == 'token'], ['Hello', ' there'])
+        self.assertEqual(events[-1][1], {'message': 'Hello there', 'sentiment': 'calm', 'session_id': session_id})
+
+    def assertTurnSaved(self, session_id):
+        # Reading while the pipeline thread writes would hit the shared in-memory test database's table locks
+        self.assertTrue(self.saved.wait(5))
+        messages = Message.objects.filter(conversation__session_id=session_id).order_by('id')
+        self.assertEqual([(message.role, message.content) for message in messages],
+                         [('user', 'somewhere calm'), ('assistant', 'Hello there')])
+        self.assertEqual(AIRecommendation.objects.get(conversation__session_id=session_id).place_id, 'zen')
+
+    def test_sync_stream_event_order(self):
+        response = views.chat_stream(self.post(RequestFactory(), 'stream-sync'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEventOrder([parse_sse(chunk) for chunk in response.streaming_content], 'stream-sync')
+        self.assertTurnSaved('stream-sync')
+
+    def test_sync_stream_closed_early_still_saves_the_turn(self):
+        self.release.clear()
+        response = views.chat_stream(self.post(RequestFactory(), 'stream-sync-closed'))
+        self.assertEqual(parse_sse(next(iter(response.streaming_content)))[0], 'start')
+        response.close()
+        self.release.set()
+        self.assertTurnSaved('stream-sync-closed')
+
+    async def test_async_stream_event_order(self):
+        response = await views.AsyncChatStreamView.as_view()(self.post(AsyncRequestFactory(), 'stream-async'))
+        events = [parse_sse(chunk) async for chunk in response.streaming_content]
+        self.assertEventOrder(events, 'stream-async')
+        await asyncio.gather(*views.AsyncChatStreamView.turns)
+        await sync_to_async(self.assertTurnSaved)('stream-async')
+
+    async def test_async_stream_closed_early_still_saves_the_turn(self):
+        self.release.clear()
+        response = await views.AsyncChatStreamView.as_view()(self.post(AsyncRequestFactory(), 'stream-async-closed'))
+        events = response.streaming_content.__aiter__()
+        self.assertEqual(parse_sse(await events.__anext__())[0], 'start')
+        await events.aclose()
+        self.release.set()
+        await asyncio.gather(*views.AsyncChatStreamView.turns)
+        await sync_to_async(self.assertTurnSaved)('stream-async-closed')
+
+
+class ConversationHistoryTests(TestCase):
+    """Keyset pages of /api/ai/history/, newest page first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        conversation = Conversation.objects.create(session_id='history')
+        other = Conversation.objects.create(session_id='other')
+        start = timezone.now()
+        # Several messages share a timestamp, so pages must break ties on id
+        offsets = [0, 0, 0, 1, 1, 2, 2]
+        cls.messages = []
+        for i, offset in enumerate(offsets):
+            message = Message.objects.create(
+                conversation=conversation, role='user' if i % 2 == 0 else 'assistant',
+                content=f'message {i}', timestamp=start + timedelta(seconds=offset)
+            )
+            Message.objects.create(conversation=other, role='user', content='elsewhere', timestamp=message.timestamp)
+            cls.messages.append(message)
+        SentimentAnalysis.objects.create(message=cls.messages[0], sentiment='calm', confidence=0.9)
+
+    def history(self, **params):
+        return self.client.get('/api/ai/history/history/', params)
+
+    def test_pages_walk_every_message_once_across_equal_timestamps(self):
+        pages, before = [], None
+        while True:
+            with self.assertNumQueries(1):
+                response = self.history(limit=2, **({'before': before} if before else {}))
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            pages.append([entry['id'] for entry in body['conversation']])
+            before = body['next_cursor']
+            if before is None:
+                break
+
+        ids = [message.pk for message in self.messages]
+        self.assertEqual(pages, [ids[5:7], ids[3:5], ids[1:3], ids[0:1]])
+
+    def test_last_page_has_no_cursor(self):
+        body = self.history(limit=len(self.messages)).json()
+        self.assertEqual([entry['content'] for entry in body['conversation']], [f'message {i}' for i in range(7)])
+        self.assertIsNone(body['next_cursor'])
+        self.assertEqual(body['conversation'][0]['sentiment'], 'calm')
+        self.assertIsNone(body['conversation'][1]['sentiment'])
+
+    def test_cursor_round_trips(self):
+        cursor = views.encode_history_cursor(self.messages[3])
+        self.assertEqual(views.decode_history_cursor(cursor), (self.messages[3].timestamp, self.messages[3].pk))
+        body = self.history(before=cursor).json()
+        self.assertEqual([entry['id'] for entry in body['conversation']], [message.pk for message in self.messages[:3]])
+        self.assertIsNone(body['next_cursor'])
+
+    def test_bad_cursor_or_limit_is_rejected(self):
+        for params in (
+            {'before': 'not a cursor'}, {'before': 'bm90LWEtY3Vyc29y'}, {'before': 'MjAyNHwx'},
+            {'limit': 'ten'}, {'limit': '0'}, {'limit': '-3'},
+        ):
+            with self.subTest(**params):
+                self.assertEqual(self.history(**params).status_code, 400)
+
+    def test_limit_is_capped(self):
+        with mock.patch.object(views, 'HISTORY_MAX_PAGE_SIZE', 3):
+            body = self.history(limit=100).json()
+        self.assertEqual(len(body['conversation']), 3)
+        self.assertIsNotNone(body['next_cursor'])
+
+
+# The keyword lists the lexicon replaced, in their old priority order
+OLD_SENTIMENT_KEYWORDS = (
+    ('happy', ['happy', 'excited', 'great', 'awesome', 'love', 'enjoy']),
+    ('stressed', ['stressed', 'busy', 'work', 'study', 'quiet', 'peaceful']),
+    ('social', ['friends', 'meet', 'social', 'fun', 'party', 'group']),
+    ('focused', ['study', 'work', 'focus', 'quiet', 'concentration']),
+)
+
+
+def old_keyword_sentiment(text):
+    """The replaced if/elif chain, on whole words"""
+    words = set(text.lower().split())
+    for sentiment, keywords in OLD_SENTIMENT_KEYWORDS:
+        if words.intersection(keywords):
+            return sentiment
+    return 'neutral'
+
+
+class LexiconTests(SimpleTestCase):
+    def sentiment(self, text):
+        return lexicon.analyze(text)['sentiment']
+
+    def test_words_are_matched_whole(self):
+        for text in ('network outage', 'homework', 'friendship', 'unhappy', 'the cheapest', 'partying'):
+            with self.subTest(text=text):
+                result = lexicon.analyze(text)
+                self.assertEqual(result['sentiment'], 'neutral')
+                self.assertEqual(set(result['scores'].values()), {0.0})
+                self.assertEqual(result['preferences']['budget'], 'medium')
+        self.assertEqual(self.sentiment('I love the network'), 'happy')
+
+    def test_bigrams_beat_their_unigrams(self):
+        cases = {
+            'not happy today': 'sad',
+            'feeling down': 'sad',
+            'catch up on work': 'social',
+            'hang out after work': 'social',
+            'happy and stressed out': 'stressed',
+        }
+        for text, sentiment in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(self.sentiment(text), sentiment)
+        self.assertEqual(lexicon.analyze('not happy')['scores']['happy'], 0.0)
+
+    def test_ties_follow_the_old_keyword_order(self):
+        # Words that score a single class with weight 1, so every pair ties
+        single_class = {
+            'happy': ['great', 'awesome', 'love', 'enjoy', 'happy'],
+            'stressed': ['busy'],
+            'social': ['friends', 'meet', 'social', 'fun', 'party', 'group'],
+            'focused': ['focus', 'concentration'],
+        }
+        words = [word for group in single_class.values() for word in group]
+        for first, second in product(words, repeat=2):
+            text = f'{first} and {second}'
+            with self.subTest(text=text):
+                self.assertEqual(self.sentiment(text), old_keyword_sentiment(text))
+        # Words the old lists shared between classes still lean stressed
+        for text in ('work', 'study', 'quiet', 'peaceful'):
+            with self.subTest(text=text):
+                self.assertEqual(self.sentiment(text), old_keyword_sentiment(text))
+
+    def test_preferences(self):
+        preferences = lexicon.analyze('somewhere cozy and cheap, not too lively')['preferences']
+        self.assertEqual((preferences['budget'], preferences['vibe']), ('low', 'quiet'))
+        self.assertEqual(lexicon.analyze('a luxury trendy spot')['preferences']['budget'], 'high')
+
+
+class StageGraphTests(SimpleTestCase):
+    def graph(self, fail=None):
+        calls = []
+
+        def stage(name, *args):
+            calls.append(name)
+            if name == fail:
+                raise RuntimeError(f'{name} failed')
+            return (name,) + args
+
+        graph = StageGraph()
+        graph.add('a', partial(stage, 'a'))
+        graph.add('b', partial(stage, 'b'))
+        graph.add('c', partial(stage, 'c'), deps=['b', 'a'])
+        graph.add('d', partial(stage, 'd'), deps=['c'])
+        return graph, calls
+
+    def test_stages_get_their_dependencies_in_listed_order(self):
+        graph, calls = self.graph()
+        results = graph.run()
+        self.assertEqual(results['c'], ('c', ('b',), ('a',)))
+        self.assertEqual(results['d'], ('d', ('c', ('b',), ('a',))))
+        self.assertEqual(calls[2:], ['c', 'd'])
+        self.assertLessEqual(graph.timings['a'][1], graph.timings['c'][0])
+        self.assertLessEqual(graph.timings['c'][1], graph.timings['d'][0])
+
+    def test_independent_stages_run_together(self):
+        barrier = threading.Barrier(2, timeout=5)
+        graph = StageGraph()
+        graph.add('a', barrier.wait)
+        graph.add('b', barrier.wait)
+        self.assertEqual(set(graph.run()), {'a', 'b'})
+
+    def test_stage_errors_propagate_and_stop_dependents(self):
+        graph, calls = self.graph(fail='c')
+        with self.assertRaisesMessage(RuntimeError, 'c failed'):
+            graph.run()
+        self.assertNotIn('d', calls)
+
+    def test_async_run_matches_run(self):
+        graph, _ = self.graph()
+        self.assertEqual(asyncio.run(graph.arun()), self.graph()[0].run())
+        graph, calls = self.graph(fail='a')
+        with self.assertRaisesMessage(RuntimeError, 'a failed'):
+            asyncio.run(graph.arun())
+        self.assertNotIn('c', calls)
+
+    def test_unknown_dependency_is_rejected(self):
+        with self.assertRaises(ValueError):
+            StageGraph().add('a', print, deps=['missing'])
+
+    def test_own_pool_closes_each_stage_thread_connections(self):
+        closed = []
+        with mock.patch('ai_chat.pipeline.connections') as connections:
+            connections.close_all.side_effect = lambda: closed.append(threading.current_thread().name)
+            self.graph()[0].run()
+            self.assertEqual(len(closed), 4)
+            self.assertTrue(all(name.startswith('chat-pipeline') for name in closed))
+
+            # A caller-owned pool outlives the run and keeps its connections
+            closed.clear()
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                self.graph()[0].run(executor)
+            self.assertEqual(closed, [])
+
+
+class FixedClassifier:
+    def __init__(self, sentiment, confidence):
+        self.prediction = (sentiment, confidence)
+
+    def predict(self, text):
+        return self.prediction
+
+
+class SentimentRoutingTests(SimpleTestCase):
+    """Confident local predictions answer directly; the rest fall through to Ollama"""
+
+    @override_settings(SENTIMENT_CLASSIFIER_THRESHOLD=0.9)
+    def test_threshold(self):
+        self.assertEqual(route_sentiment(FixedClassifier('calm', 0.95), 'text'), ('calm', 0.95))
+        self.assertEqual(route_sentiment(FixedClassifier('calm', 0.9), 'text'), ('calm', 0.9))
+        self.assertIsNone(route_sentiment(FixedClassifier('calm', 0.89), 'text'))
+        with override_settings(SENTIMENT_CLASSIFIER_ENABLED=False):
+            self.assertIsNone(route_sentiment(FixedClassifier('calm', 1.0), 'text'))
+
+    @override_settings(SENTIMENT_CLASSIFIER_THRESHOLD=0.8)
+    def test_low_confidence_falls_through_to_ollama(self):
+        ollama_answer = '{"sentiment": "sad", "confidence": 0.7, "preferences": {}}'
+        for confidence, source, sentiment in ((0.85, 'classifier', 'calm'), (0.5, 'ollama', 'sad')):
+            with self.subTest(confidence=confidence), \
+                    mock.patch.object(views, 'get_sentiment_classifier', return_value=FixedClassifier('calm', confidence)), \
+                    mock.patch.object(views.ollama, 'generate', return_value=ollama_answer) as generate:
+                result = views.analyze_sentiment_with_ollama('somewhere to sit')
+                self.assertEqual((result['source'], result['sentiment']), (source, sentiment))
+                self.assertEqual(generate.called, source == 'ollama')
+
+    def test_seed_examples_are_learnt(self):
+        classifier = NaiveBayesClassifier().fit(SEED_EXAMPLES)
+        for text, label in SEED_EXAMPLES[:10]:
+            with self.subTest(text=text):
+                self.assertEqual(classifier.predict(text)[0], label)
+        self.assertEqual(NaiveBayesClassifier().predict('anything'), ('neutral', 0.0))
+
+
+class SentimentSourceMigrationTests(TransactionTestCase):
+    """0002 marks sentiments saved before sources were recorded as unknown"""
+
+    # With SQLITE_READ_ALIAS on, chat reads outside a transaction go to 'read'
+    databases = '__all__'
+    migrate_from = [('ai_chat', '0001_initial')]
+    migrate_to = [('ai_chat', '0002_sentimentanalysis_source')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_existing_rows_become_unknown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+        conversation = old_apps.get_model('ai_chat', 'Conversation').objects.create(session_id='before')
+        message = old_apps.get_model('ai_chat', 'Message').objects.create(
+            conversation=conversation, role='user', content='so stressed about work'
+        )
+        old_apps.get_model('ai_chat', 'SentimentAnalysis').objects.create(
+            message=message, sentiment='stressed', confidence=0.9
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+        new_apps = executor.loader.project_state(self.migrate_to).apps
+        SentimentAnalysis = new_apps.get_model('ai_chat', 'SentimentAnalysis')
+        self.assertEqual(SentimentAnalysis.objects.get().source, 'unknown')
+
+        # Rows saved afterwards default to ollama
+        later = new_apps.get_model('ai_chat', 'Message').objects.create(
+            conversation_id=conversation.pk, role='user', content='feeling great'
+        )
+        self.assertEqual(SentimentAnalysis.objects.create(message=later, sentiment='happy', confidence=0.8).source, 'ollama')
+
+        # Only the rows Ollama labelled are used for training
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        self.assertIn(('feeling great', 'happy'), training_examples())
+        self.assertNotIn(('so stressed about work', 'stressed'), training_examples())
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    """backend.sqlite applies the production profile to every new connection"""
+
+    databases = {'default'}
+
+    def wrapper(self, path=None, **settings_dict):
+        if path is None:
+            tmp = tempfile.TemporaryDirectory()
+            self.addCleanup(tmp.cleanup)
+            path = os.path.join(tmp.name, 'db.sqlite3')
+        wrapper = DatabaseWrapper(
+            {**connection.settings_dict, 'NAME': path, 'TEST': {}, 'PRAGMAS': {}, **settings_dict}, alias='profile-test'
+        )
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_on_connect(self):
+        wrapper = self.wrapper(PRAGMAS={
+            'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 4321,
+            'cache_size': -2048, 'temp_store': 'MEMORY',
+        })
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 4321)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -2048)
+        self.assertEqual(self.pragma(wrapper, 'temp_store'), 2)
+        self.assertEqual(self.pragma(wrapper, 'query_only'), 0)
+
+        # A reconnect gets them again
+        wrapper.close()
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 4321)
+
+    @skipUnless(settings.SQLITE_PROFILE, 'SQLITE_PROFILE is off')
+    def test_settings_profile_is_applied(self):
+        default = connections['default']
+        self.assertIsInstance(default, DatabaseWrapper)
+        self.assertEqual(default.settings_dict['TRANSACTION_MODE'], 'IMMEDIATE')
+        with default.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_DATABASE['PRAGMAS']['busy_timeout'])
+
+    def test_read_only_connections_refuse_writes(self):
+        writer = self.wrapper()
+        with writer.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+        reader = self.wrapper(writer.settings_dict['NAME'], READ_ONLY=True)
+        self.assertEqual(self.pragma(reader, 'query_only'), 1)
+        with reader.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM t')
+            with self.assertRaises(DatabaseError):
+                cursor.execute('INSERT INTO t VALUES (1)')
+
+    def test_transactions_begin_in_the_configured_mode(self):
+        for mode, expected, locked in (('IMMEDIATE', 'BEGIN IMMEDIATE', True), (None, 'BEGIN DEFERRED', False)):
+            with self.subTest(mode=mode):
+                wrapper = self.wrapper(TRANSACTION_MODE=mode)
+                wrapper.ensure_connection()
+                with CaptureQueriesContext(wrapper) as queries:
+                    # What atomic() calls to open a transaction on SQLite
+                    wrapper._start_transaction_under_autocommit()
+                self.assertEqual(queries.captured_queries[-1]['sql'], expected)
+
+                # IMMEDIATE holds the write lock from the start
+                other = sqlite3.connect(wrapper.settings_dict['NAME'], timeout=0)
+                self.addCleanup(other.close)
+                if locked:
+                    with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                        other.execute('BEGIN IMMEDIATE')
+                else:
+                    other.execute('BEGIN IMMEDIATE')
+                    other.rollback()
+                wrapper.connection.rollback()
+
+
+class ReadReplicaRouterTests(TransactionTestCase):
+    def setUp(self):
+        self.router = ConnectionRouter([ReadReplicaRouter()])
+
+    def test_chat_reads_go_to_the_read_alias(self):
+        for model in (Conversation, Message, SentimentAnalysis, UserPreference):
+            with self.subTest(model=model.__name__):
+                self.assertEqual(self.router.db_for_read(model), 'read')
+                self.assertEqual(self.router.db_for_write(model), 'default')
+        # Models the router does not list keep Django's default routing
+        self.assertEqual(self.router.db_for_read(Place), 'default')
+        self.assertEqual(self.router.db_for_write(Place), 'default')
+
+    def test_reads_inside_a_transaction_stay_on_default(self):
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Message), 'default')
+        self.assertEqual(self.router.db_for_read(Message), 'read')
+
+    def test_nothing_is_migrated_on_the_read_alias(self):
+        self.assertFalse(self.router.allow_migrate('read', 'ai_chat', model_name='message'))
+        self.assertTrue(self.router.allow_migrate('default', 'ai_chat', model_name='message'))
@@ -1,10 +1,15 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'ai_chat'
 
 urlpatterns = [
-    path('chat/', views.chat_with_ai, name='chat_with_ai'),
+    path('chat/', views.AsyncChatView.as_view() if settings.ASYNC_VIEWS else views.chat_with_ai, name='chat_with_ai'),
+    path('chat/stream/', views.AsyncChatStreamView.as_view() if settings.ASYNC_VIEWS else views.chat_stream, name='chat_stream'),
+    path('history/<str:session_id>/', views.get_conversation_history, name='conversation_history'),
+    path('preferences/<str:session_id>/', views.get_user_preferences, name='user_preferences'),
+    path('stats/', views.ollama_stats, name='ollama_stats'),
     path('test-ai/', views.test_ai_enhancement, name='test_ai_enhancement'),
     path('placeholder/<int:width>/<int:height>/', views.generate_placeholder_image, name='placeholder_image'),
 ]
@@ -1,13 +1,35 @@
+import asyncio
+import base64
 import json
+import threading
 import uuid
-import requests
+from datetime import datetime
+from functools import partial
+from queue import Queue
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.db import connections
+from django.db.models import Q
 from django.utils import timezone
-import re
-from .models import Conversation, Message, SentimentAnalysis, UserPreference, AIRecommendation
+from .models import Message, UserPreference
+from . import lexicon, ollama
+from .classifier import get_sentiment_classifier, loaded_classifier, route_sentiment
+from .insights import build_recommendation
+from .llm_cache import llm_cache
+from .persistence import chat_turn_writer, persist_chat_turn
+from .pipeline import StageGraph
+from .rerank import LLM_INSIGHT_FIELDS, generate_within, rerank
+from places.gazetteer import find_location
+from places.keywords import place_name_matcher
+from places.services import (
+    afetch_place_pages, build_user_context, candidates_from_pages, fetch_place_pages, resolve_location, search_places
+)
 # Note: Using Google Maps API directly instead of Place model
 
 @csrf_exempt
@@ -25,157 +47,70 @@ def chat_with_ai(request):
             if not user_message or not session_id:
                 return JsonResponse({'error': 'Missing message or session_id'}, status=400)
             
-            # Get or create conversation
-            conversation, created = Conversation.objects.get_or_create(
-                session_id=session_id
-            )
-            
-            # Save user message
-            user_msg = Message.objects.create(
-                conversation=conversation,
-                role='user',
-                content=user_message
-            )
+            # The whole turn is saved in one transaction once the reply is ready
+            received_at = timezone.now()
             
-            # Analyze sentiment and extract preferences
-            sentiment_result = analyze_sentiment_with_ollama(user_message)
+            # Sentiment, location, place search and the reply run as a stage graph
+            pipeline = build_chat_pipeline(user_message, user_lat, user_lng, session_id)
+            results = pipeline.run()
+            print(f"Chat pipeline timings: {pipeline.report()}")
+            sentiment_result = results['sentiment']
             sentiment = sentiment_result.get('sentiment', 'neutral')
-            preferences = sentiment_result.get('preferences', [])
+            cafe_recommendations = results['recommendations']
+            ai_message = results['reply']
             
-            # Save sentiment analysis
-            SentimentAnalysis.objects.create(
-                message=user_msg,
-                sentiment=sentiment,
-                confidence=sentiment_result.get('confidence', 0.8),
-                extracted_preferences=json.dumps(preferences)
-            )
+            persist_chat_turn(session_id, user_message, received_at, sentiment_result, ai_message, cafe_recommendations)
             
-            # Save user preferences
-            save_user_preferences(session_id, preferences, sentiment_result.get('confidence', 0.8))
+            return JsonResponse({
+                'message': ai_message,
+                'recommendations': cafe_recommendations,
+                'sentiment': sentiment,
+                'session_id': session_id
+            })
             
-            # Get AI-enhanced café recommendations
-            try:
-                # First try to extract location from user message
-                message_location = extract_location_from_message(user_message)
-                
-                # Determine search coordinates
-                if message_location:
-                    # User asked for a specific location - use that
-                    search_lat, search_lng = message_location
-                    print(f"Searching near user-requested location: {message_location}")
-                elif user_lat and user_lng:
-                    # User provided coordinates
-                    search_lat, search_lng = user_lat, user_lng
-                    print(f"Using user-provided coordinates: {search_lat}, {search_lng}")
-                else:
-                    # No location specified, use Darling Harbour as default
-                    search_lat, search_lng = -33.8715, 151.2006
-                    print(f"Using default location (Darling Harbour): {search_lat}, {search_lng}")
-                
-                # Search for places using the determined coordinates
-                places_response = requests.get(f'http://localhost:8000/api/places/?lat={search_lat}&lng={search_lng}&sentiment={sentiment}', timeout=10)
-                
-                if places_response.status_code == 200:
-                    places = places_response.json()
-                    
-                    # Always create enhanced recommendations with AI insights
-                    cafe_recommendations = []
-                    for i, place in enumerate(places[:3]):
-                        # Generate personalized AI insights based on sentiment and place data
-                        if sentiment == 'stressed':
-                            mood_match = f"This café offers a peaceful, calming atmosphere perfect for when you're feeling {sentiment}. The quiet environment will help you relax and unwind."
-                            best_for = "Stress relief, relaxation, peaceful dining, quiet contemplation"
-                            key_features = "Tranquil atmosphere, comfortable seating, soothing environment"
-                        elif sentiment == 'excited':
-                            mood_match = f"This vibrant café matches your {sentiment} energy perfectly! The lively atmosphere will keep your spirits high."
-                            best_for = "Celebrations, social gatherings, energetic dining, fun experiences"
-                            key_features = "Vibrant atmosphere, social environment, exciting menu options"
-                        elif sentiment == 'focused':
-                            mood_match = f"This café provides the perfect environment for your {sentiment} mindset. The quiet atmosphere supports concentration and focus."
-                            best_for = "Study sessions, work meetings, focused dining, concentration"
-                            key_features = "Quiet atmosphere, good lighting, comfortable work spaces"
-                        else:
-                            mood_match = f"This café is ideal for your {sentiment} mood! The atmosphere perfectly complements your current state of mind."
-                            best_for = "Quality dining, authentic matcha experience, comfortable atmosphere"
-                            key_features = "High rating, good location, authentic atmosphere"
-                        
-                        # Generate specific reason based on place characteristics
-                        place_name = place.get('name', '').lower()
-                        rating = place.get('rating', 0)
-                        distance = place.get('distance', 0)
-                        
-                        if 'matcha' in place_name:
-                            matcha_reason = "This café specializes in authentic matcha, offering you the genuine Japanese tea experience you're looking for."
-                        elif rating >= 4.5:
-                            matcha_reason = f"With an excellent {rating}-star rating, this café consistently delivers outstanding quality and service."
-                        else:
-                            matcha_reason = f"This café offers a solid {rating}-star experience with good value for your money."
-                        
-                        # Distance benefit
-                        if distance <= 1.0:
-                            distance_benefit = f"Located just {distance} km away, this café is extremely convenient for your current location."
-                        elif distance <= 2.0:
-                            distance_benefit = f"At {distance} km away, this café is easily accessible and worth the short trip."
-                        else:
-                            distance_benefit = f"While {distance} km away, this café's exceptional quality makes it worth the journey."
-                        
-                        # Why this ranks higher
-                        if i == 0:
-                            why_better = f"This café ranks #1 because it perfectly balances your {sentiment} mood, location convenience, and quality expectations."
-                        elif i == 1:
-                            why_better = f"This café ranks #2 as an excellent alternative that closely matches your needs and preferences."
-                        else:
-                            why_better = f"This café ranks #3 as a solid option that meets your basic requirements and offers good value."
-                        
-                        # Combine everything into a comprehensive explanation
-                        reason = f"{matcha_reason} {mood_match} The combination of quality, atmosphere, and convenience makes this an ideal choice for your current needs."
-                        
-                        cafe_recommendations.append({
-                            'id': place.get('id'),
-                            'place_id': place.get('place_id'),
-                            'name': place.get('name'),
-                            'address': place.get('vicinity'),
-                            'rating': place.get('rating'),
-                            'price_level': place.get('price_range'),
-                            'distance': place.get('distance'),
-                            'photos': place.get('photos', []),
-                            'ai_insight': {
-                                'rank': i + 1,
-                                'reason': reason,
-                                'mood_match': mood_match,
-                                'best_for': best_for,
-                                'key_features': key_features,
-                                'why_better_than_others': why_better,
-                                'budget_explanation': "This café provides excellent value for the quality and experience offered.",
-                                'distance_benefit': distance_benefit
-                            }
-                        })
-                else:
-                    # Fallback to regular recommendations
-                    cafe_recommendations = get_cafe_recommendations(user_message, sentiment, preferences, user_lat, user_lng)
-            except Exception as e:
-                # Fallback to regular recommendations
-                cafe_recommendations = get_cafe_recommendations(user_message, sentiment, preferences, user_lat, user_lng)
+        except Exception as e:
+            print(f"Error in chat_with_ai: {e}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChatView(View):
+    """
+    Async version of chat_with_ai for ASGI deployments.
+    
+    Ollama and the places search are awaited (Ollama over a pooled httpx
+    client), so a turn that waits on the models holds no worker thread; only
+    the single transaction that saves the turn runs in a thread.
+    """
+    http_method_names = ['post']
+    
+    async def post(self, request):
+        try:
+            data = json.loads(request.body)
+            user_message = data.get('message', '')
+            session_id = data.get('session_id', '')
+            user_lat = data.get('lat')  # User's latitude
+            user_lng = data.get('lng')  # User's longitude
             
-            # Generate AI response
-            ai_message = generate_ai_response(user_message, sentiment, preferences, session_id)
+            if not user_message or not session_id:
+                return JsonResponse({'error': 'Missing message or session_id'}, status=400)
             
-            # Save AI message
-            ai_msg = Message.objects.create(
-                conversation=conversation,
-                role='assistant',
-                content=ai_message
-            )
+            # The whole turn is saved in one transaction once the reply is ready
+            received_at = timezone.now()
             
-            # Save recommendations
-            for cafe in cafe_recommendations:
-                AIRecommendation.objects.create(
-                    conversation=conversation,
-                    place_id=cafe['id'],
-                    place_name=cafe['name'],
-                    recommendation_reason=f"Matches your {sentiment} mood and preferences",
-                    sentiment_context=sentiment
-                )
+            # Sentiment, location, place search and the reply run as a stage graph
+            pipeline = build_chat_pipeline(user_message, user_lat, user_lng, session_id, use_async=True)
+            results = await pipeline.arun()
+            print(f"Chat pipeline timings: {pipeline.report()}")
+            sentiment_result = results['sentiment']
+            sentiment = sentiment_result.get('sentiment', 'neutral')
+            cafe_recommendations = results['recommendations']
+            ai_message = results['reply']
+            
+            await sync_to_async(persist_chat_turn)(
+                session_id, user_message, received_at, sentiment_result, ai_message, cafe_recommendations
+            )
             
             return JsonResponse({
                 'message': ai_message,
@@ -185,16 +120,298 @@ def chat_with_ai(request):
             })
             
         except Exception as e:
-            print(f"Error in chat_with_ai: {e}")
+            print(f"Error in AsyncChatView: {e}")
             return JsonResponse({'error': str(e)}, status=500)
+
+def sse_event(event, data):
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+def parse_chat_request(request):
+    """Read a chat POST body; returns (data, error response)"""
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return None, JsonResponse({'error': 'Invalid JSON'}, status=400)
+    if not data.get('message') or not data.get('session_id'):
+        return None, JsonResponse({'error': 'Missing message or session_id'}, status=400)
+    return data, None
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def chat_stream(request):
+    """
+    Streaming chat endpoint (Server-Sent Events).
     
-    return JsonResponse({'error': 'Method not allowed'}, status=405)
+    Emits 'start' straight away, 'sentiment' and 'recommendations' as those
+    stages finish, 'token' for each piece of the Ollama reply, and 'done'
+    once the turn has been saved or queued for writing. The pipeline thread
+    starts before 'start' is sent and saves the turn itself, so the turn is
+    kept even if the client disconnects.
+    """
+    data, error = parse_chat_request(request)
+    if error:
+        return error
+    user_message = data['message']
+    session_id = data['session_id']
+    
+    def events():
+        try:
+            received_at = timezone.now()
+            
+            # Stage results and reply tokens arrive on this queue from the pipeline threads
+            queue = Queue()
+            pipeline = build_chat_pipeline(
+                user_message, data.get('lat'), data.get('lng'), session_id,
+                on_token=lambda piece: queue.put(('token', {'text': piece})),
+                on_stage_done=lambda name, result: queue.put((name, result))
+            )
+            
+            def run_pipeline():
+                try:
+                    results = pipeline.run()
+                    persist_chat_turn(
+                        session_id, user_message, received_at, results['sentiment'],
+                        results['reply'], results['recommendations']
+                    )
+                    queue.put(('finished', results))
+                except Exception as e:
+                    queue.put(('failed', e))
+                finally:
+                    connections.close_all()
+            
+            threading.Thread(target=run_pipeline, daemon=True).start()
+            yield sse_event('start', {'session_id': session_id})
+            
+            while True:
+                event, payload = queue.get()
+                if event == 'failed':
+                    raise payload
+                if event == 'finished':
+                    results = payload
+                    break
+                if event in ('token', 'recommendations'):
+                    yield sse_event(event, payload)
+                elif event == 'sentiment':
+                    yield sse_event(event, {'sentiment': payload.get('sentiment', 'neutral')})
+            
+            print(f"Chat pipeline timings: {pipeline.report()}")
+            sentiment_result = results['sentiment']
+            yield sse_event('done', {
+                'message': results['reply'],
+                'sentiment': sentiment_result.get('sentiment', 'neutral'),
+                'session_id': session_id
+            })
+        except Exception as e:
+            print(f"Error in chat_stream: {e}")
+            yield sse_event('error', {'error': str(e)})
+    
+    return event_stream_response(events())
 
-def analyze_sentiment_with_ollama(text):
-    """Use Ollama to analyze sentiment and extract preferences"""
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChatStreamView(View):
+    """
+    Async version of chat_stream; the events come from an async generator.
+    
+    The pipeline and the save run in a task of their own, so a client that
+    disconnects does not stop the turn from being saved.
+    """
+    http_method_names = ['post']
+    
+    # Running turns, referenced so they are not garbage collected mid-flight
+    turns = set()
+    
+    async def post(self, request):
+        data, error = parse_chat_request(request)
+        if error:
+            return error
+        return event_stream_response(self.events(data))
+    
+    async def events(self, data):
+        user_message = data['message']
+        session_id = data['session_id']
+        try:
+            received_at = timezone.now()
+            
+            queue = asyncio.Queue()
+            pipeline = build_chat_pipeline(
+                user_message, data.get('lat'), data.get('lng'), session_id, use_async=True,
+                on_token=lambda piece: queue.put_nowait(('token', {'text': piece})),
+                on_stage_done=lambda name, result: queue.put_nowait((name, result))
+            )
+            
+            async def run_turn():
+                results = await pipeline.arun()
+                await sync_to_async(persist_chat_turn)(
+                    session_id, user_message, received_at, results['sentiment'],
+                    results['reply'], results['recommendations']
+                )
+                return results
+            
+            run = asyncio.ensure_future(run_turn())
+            self.turns.add(run)
+            run.add_done_callback(self.turns.discard)
+            run.add_done_callback(lambda _: queue.put_nowait(('finished', None)))
+            yield sse_event('start', {'session_id': session_id})
+            
+            while True:
+                event, payload = await queue.get()
+                if event == 'finished':
+                    results = run.result()
+                    break
+                if event in ('token', 'recommendations'):
+                    yield sse_event(event, payload)
+                elif event == 'sentiment':
+                    yield sse_event(event, {'sentiment': payload.get('sentiment', 'neutral')})
+            
+            print(f"Chat pipeline timings: {pipeline.report()}")
+            sentiment_result = results['sentiment']
+            yield sse_event('done', {
+                'message': results['reply'],
+                'sentiment': sentiment_result.get('sentiment', 'neutral'),
+                'session_id': session_id
+            })
+        except Exception as e:
+            print(f"Error in AsyncChatStreamView: {e}")
+            yield sse_event('error', {'error': str(e)})
+
+def resolve_search_location(user_message, user_lat, user_lng):
+    """Pick the coordinates to search around for a chat message"""
+    # First try to extract location from user message
+    message_location = extract_location_from_message(user_message)
+    
+    if message_location:
+        # User asked for a specific location - use that
+        print(f"Searching near user-requested location: {message_location}")
+        return message_location
+    elif user_lat and user_lng:
+        # User provided coordinates
+        print(f"Using user-provided coordinates: {user_lat}, {user_lng}")
+        return user_lat, user_lng
+    
+    # No location specified, use Darling Harbour as default
+    search_lat, search_lng = -33.8715, 151.2006
+    print(f"Using default location (Darling Harbour): {search_lat}, {search_lng}")
+    return search_lat, search_lng
+
+def build_chat_pipeline(user_message, user_lat, user_lng, session_id, use_async=False,
+                        on_token=None, on_stage_done=None):
+    """
+    Stage graph for one chat turn.
+    
+    Sentiment analysis and location extraction start together; the place
+    prefetch only needs the location, so it overlaps the Ollama call. Ranking
+    and the reply each wait for just the stages they use. With on_token the
+    reply is streamed from Ollama and each piece is passed to on_token.
+    """
+    graph = StageGraph(on_stage_done=on_stage_done)
+    graph.add('location', partial(resolve_search_location, user_message, user_lat, user_lng))
+    graph.add('sentiment', partial(
+        analyze_sentiment_with_ollama_async if use_async else analyze_sentiment_with_ollama, user_message
+    ))
+    graph.add('prefetch', aprefetch_places if use_async else prefetch_places, deps=['location'])
+    graph.add('recommendations', partial(recommend_places, user_message, user_lat, user_lng),
+              deps=['location', 'prefetch', 'sentiment'])
+    if on_token:
+        reply = partial(astream_reply if use_async else stream_reply, user_message, on_token)
+    else:
+        reply = partial(areply_to_message if use_async else reply_to_message, user_message, session_id)
+    graph.add('reply', reply, deps=['sentiment'])
+    return graph
+
+def prefetch_places(location):
+    """Fetch the raw places around the search location before the mood is known"""
+    try:
+        pages = fetch_place_pages(*resolve_location(*location))
+        return None if pages is None else list(pages)
+    except Exception as e:
+        print(f"Error prefetching places: {e}")
+        return None
+
+async def aprefetch_places(location):
+    """Async prefetch_places"""
+    try:
+        return await afetch_place_pages(*resolve_location(*location))
+    except Exception as e:
+        print(f"Error prefetching places: {e!r}")
+        return None
+
+def recommend_places(user_message, user_lat, user_lng, location, pages, sentiment_result):
+    """Rank the prefetched places for the user's mood and add AI insights"""
+    sentiment = sentiment_result.get('sentiment', 'neutral')
+    try:
+        search_lat, search_lng = resolve_location(*location)
+        places = candidates_from_pages(pages, search_lat, search_lng, build_user_context(sentiment=sentiment), limit=3)
+        
+        # Always create enhanced recommendations with AI insights
+        return build_chat_recommendations(places, sentiment)
+    except Exception as e:
+        print(f"Error searching places: {e}")
+        # Fallback to regular recommendations
+        return get_cafe_recommendations(user_message, sentiment, sentiment_result.get('preferences', []), user_lat, user_lng)
+
+def reply_to_message(user_message, session_id, sentiment_result):
+    return generate_ai_response(
+        user_message, sentiment_result.get('sentiment', 'neutral'), sentiment_result.get('preferences', []), session_id
+    )
+
+async def areply_to_message(user_message, session_id, sentiment_result):
+    return await generate_ai_response_async(
+        user_message, sentiment_result.get('sentiment', 'neutral'), sentiment_result.get('preferences', []), session_id
+    )
+
+def stream_reply(user_message, on_token, sentiment_result):
+    """Stream the conversational reply from Ollama, passing each piece to on_token"""
+    sentiment = sentiment_result.get('sentiment', 'neutral')
+    preferences = sentiment_result.get('preferences', [])
+    pieces = []
     try:
-        # Prompt for sentiment analysis and preference extraction
-        prompt = f"""
+        for piece in ollama.generate_stream(
+            'llama3.2:1b', build_response_prompt(user_message, sentiment, preferences), timeout=10
+        ):
+            pieces.append(piece)
+            on_token(piece)
+    except Exception as e:
+        print(f"Ollama error: {e}")
+        if not pieces:
+            # Nothing streamed yet - send the canned reply as a single piece
+            fallback = generate_fallback_response(sentiment, preferences)
+            on_token(fallback)
+            return fallback
+    return ''.join(pieces).strip()
+
+async def astream_reply(user_message, on_token, sentiment_result):
+    """Async stream_reply"""
+    sentiment = sentiment_result.get('sentiment', 'neutral')
+    preferences = sentiment_result.get('preferences', [])
+    pieces = []
+    try:
+        async for piece in ollama.agenerate_stream(
+            'llama3.2:1b', build_response_prompt(user_message, sentiment, preferences), timeout=10
+        ):
+            pieces.append(piece)
+            on_token(piece)
+    except Exception as e:
+        print(f"Ollama error: {e!r}")
+        if not pieces:
+            fallback = generate_fallback_response(sentiment, preferences)
+            on_token(fallback)
+            return fallback
+    return ''.join(pieces).strip()
+
+def build_chat_recommendations(places, sentiment):
+    """Turn the top 3 PlaceCandidates into chat recommendations with AI insights"""
+    return [build_recommendation(place, i + 1, sentiment) for i, place in enumerate(places[:3])]
+
+def build_sentiment_prompt(text):
+    """Prompt for sentiment analysis and preference extraction"""
+    return f"""
         Analyze this café search request: "{text}"
         
         Respond with ONLY a JSON object in this exact format:
@@ -211,93 +428,76 @@ def analyze_sentiment_with_ollama(text):
         
         Sentiment options: happy, excited, calm, stressed, sad, angry, neutral, social, focused
         """
-        
+
+def parse_sentiment_response(text, ai_response):
+    """Parse Ollama's sentiment JSON, falling back to keyword analysis"""
+    try:
+        # Extract JSON from the response
+        json_start = ai_response.find('{')
+        json_end = ai_response.rfind('}') + 1
+        if json_start != -1 and json_end != 0:
+            parsed_data = json.loads(ai_response[json_start:json_end])
+            return {
+                'sentiment': parsed_data.get('sentiment', 'neutral'),
+                'confidence': parsed_data.get('confidence', 0.5),
+                'preferences': parsed_data.get('preferences', {}),
+                'source': 'ollama'
+            }
+    except json.JSONDecodeError:
+        pass
+    
+    # Fallback: keyword-based sentiment analysis
+    return fallback_sentiment_analysis(text)
+
+def classify_sentiment_locally(classifier, text):
+    """Answer from the local classifier tier, or None to escalate to Ollama"""
+    routed = route_sentiment(classifier, text)
+    if routed is None:
+        return None
+    sentiment, confidence = routed
+    return {
+        'sentiment': sentiment,
+        'confidence': confidence,
+        'preferences': fallback_sentiment_analysis(text)['preferences'],
+        'source': 'classifier'
+    }
+
+def analyze_sentiment_with_ollama(text):
+    """Use Ollama to analyze sentiment and extract preferences"""
+    # Confident local classifications skip the Ollama call entirely
+    local_result = classify_sentiment_locally(get_sentiment_classifier(), text)
+    if local_result:
+        return local_result
+    
+    try:
         # Call Ollama API
-        response = requests.post('http://localhost:11434/api/generate', {
-            'model': 'llama2',
-            'prompt': prompt,
-            'stream': False,
-        })
+        ai_response = ollama.generate('llama2', build_sentiment_prompt(text), timeout=30)
+        return parse_sentiment_response(text, ai_response)
         
-        if response.status_code == 200:
-            result = response.json()
-            ai_response = result.get('response', '')
-            
-            # Try to parse JSON from response
-            try:
-                # Extract JSON from the response
-                json_start = ai_response.find('{')
-                json_end = ai_response.rfind('}') + 1
-                if json_start != -1 and json_end != 0:
-                    parsed_data = json.loads(ai_response[json_start:json_end])
-                    return {
-                        'sentiment': parsed_data.get('sentiment', 'neutral'),
-                        'confidence': parsed_data.get('confidence', 0.5),
-                        'preferences': parsed_data.get('preferences', {})
-                    }
-            except json.JSONDecodeError:
-                pass
-            
-            # Fallback: keyword-based sentiment analysis
-            return fallback_sentiment_analysis(text)
-        else:
-            return fallback_sentiment_analysis(text)
-            
     except Exception as e:
         print(f"Ollama error: {e}")
         return fallback_sentiment_analysis(text)
 
 def fallback_sentiment_analysis(text):
     """Fallback sentiment analysis when Ollama fails"""
-    text_lower = text.lower()
-    
-    # Simple keyword-based sentiment analysis
-    happy_words = ['happy', 'excited', 'great', 'awesome', 'love', 'enjoy']
-    stressed_words = ['stressed', 'busy', 'work', 'study', 'quiet', 'peaceful']
-    social_words = ['friends', 'meet', 'social', 'fun', 'party', 'group']
-    focused_words = ['study', 'work', 'focus', 'quiet', 'concentration']
-    
-    if any(word in text_lower for word in happy_words):
-        sentiment = 'happy'
-    elif any(word in text_lower for word in stressed_words):
-        sentiment = 'stressed'
-    elif any(word in text_lower for word in social_words):
-        sentiment = 'social'
-    elif any(word in text_lower for word in focused_words):
-        sentiment = 'focused'
-    else:
-        sentiment = 'neutral'
-    
-    # Extract basic preferences
-    preferences = {
-        'budget': 'medium',
-        'vibe': 'neutral',
-        'location': 'anywhere',
-        'special_needs': 'none'
-    }
-    
-    if any(word in text_lower for word in ['cheap', 'affordable', 'budget']):
-        preferences['budget'] = 'low'
-    elif any(word in text_lower for word in ['expensive', 'luxury', 'premium']):
-        preferences['budget'] = 'high'
-    
-    if any(word in text_lower for word in ['cozy', 'quiet', 'peaceful']):
-        preferences['vibe'] = 'quiet'
-    elif any(word in text_lower for word in ['trendy', 'vibrant', 'lively']):
-        preferences['vibe'] = 'trendy'
-    
+    return keyword_sentiment_result(lexicon.analyze(text))
+
+def fallback_sentiment_analysis_batch(texts):
+    """fallback_sentiment_analysis() for many messages at once, e.g. backfills"""
+    return [keyword_sentiment_result(result) for result in lexicon.analyze_batch(texts)]
+
+def keyword_sentiment_result(result):
+    """Sentiment result dict for a lexicon analysis"""
     return {
-        'sentiment': sentiment,
+        'sentiment': result['sentiment'],
         'confidence': 0.6,
-        'preferences': preferences
+        'preferences': dict(result['preferences']),
+        'source': 'keywords'
     }
 
-def generate_ai_response(user_message, sentiment, preferences, session_id):
-    """Generate AI response with real café recommendations"""
-    try:
-        # Call Ollama for conversational response
-        ollama_url = "http://localhost:11434/api/generate"
-        prompt = f"""
+def build_response_prompt(user_message, sentiment, preferences):
+    """Prompt for the conversational reply"""
+    return f"""
         You are a friendly AI matcha guide. A user said: "{user_message}"
         Their mood is: {sentiment}
         Their preferences: {preferences}
@@ -305,26 +505,48 @@ def generate_ai_response(user_message, sentiment, preferences, session_id):
         Respond in a friendly, helpful way and suggest what kind of café experience would be perfect for them.
         Keep it conversational and warm.
         """
+
+def generate_ai_response(user_message, sentiment, preferences, session_id):
+    """Generate AI response with real café recommendations"""
+    try:
+        # Call Ollama for conversational response
+        ai_message = ollama.generate(
+            'llama3.2:1b', build_response_prompt(user_message, sentiment, preferences), timeout=10
+        ).strip()
         
-        payload = {
-            "model": "llama3.2:1b",
-            "prompt": prompt,
-            "stream": False
-        }
-        
-        response = requests.post(ollama_url, json=payload, timeout=10)
-        if response.status_code == 200:
-            result = response.json()
-            ai_message = result.get('response', '').strip()
-        else:
-            ai_message = generate_fallback_response(sentiment, preferences)
-            
     except Exception as e:
         print(f"Ollama error: {e}")
         ai_message = generate_fallback_response(sentiment, preferences)
     
     return ai_message
 
+async def analyze_sentiment_with_ollama_async(text):
+    """Async analyze_sentiment_with_ollama"""
+    classifier = loaded_classifier() or await sync_to_async(get_sentiment_classifier)()
+    local_result = classify_sentiment_locally(classifier, text)
+    if local_result:
+        return local_result
+    
+    try:
+        ai_response = await ollama.agenerate('llama2', build_sentiment_prompt(text), timeout=30)
+        return parse_sentiment_response(text, ai_response)
+        
+    except Exception as e:
+        print(f"Ollama error: {e!r}")
+        return fallback_sentiment_analysis(text)
+
+async def generate_ai_response_async(user_message, sentiment, preferences, session_id):
+    """Async generate_ai_response"""
+    try:
+        ai_message = await ollama.agenerate(
+            'llama3.2:1b', build_response_prompt(user_message, sentiment, preferences), timeout=10
+        )
+        return ai_message.strip()
+        
+    except Exception as e:
+        print(f"Ollama error: {e!r}")
+        return generate_fallback_response(sentiment, preferences)
+
 def generate_fallback_response(sentiment, preferences):
     """Generate fallback response when Ollama fails"""
     mood_responses = {
@@ -339,23 +561,6 @@ def generate_fallback_response(sentiment, preferences):
     
     return mood_responses.get(sentiment, mood_responses['neutral'])
 
-def save_user_preferences(session_id, preferences, confidence):
-    """Save extracted user preferences to database"""
-    try:
-        for pref_type, pref_value in preferences.items():
-            if pref_value and pref_value != 'none':
-                UserPreference.objects.update_or_create(
-                    session_id=session_id,
-                    preference_type=pref_type,
-                    defaults={
-                        'preference_value': pref_value,
-                        'confidence': confidence,
-                        'extracted_at': timezone.now()
-                    }
-                )
-    except Exception as e:
-        print(f"Error saving preferences: {e}")
-
 def get_cafe_recommendations(user_message, sentiment, preferences, user_lat=None, user_lng=None):
     """Get real café recommendations from Google Maps - bulletproof version"""
     try:
@@ -366,73 +571,47 @@ def get_cafe_recommendations(user_message, sentiment, preferences, user_lat=None
             # Default location (Darling Harbour Sydney)
             lat, lng = -33.8715, 151.2006
         
-        # Get places from your existing API
-        import requests
-        
+        # Get places from the places search service
         try:
-            response = requests.get(f'http://localhost:8000/api/places/?lat={lat}&lng={lng}', timeout=10)
-            
-            if response.status_code == 200:
-                places = response.json()
-            else:
-                return []
+            places = search_places(lat, lng, limit=3)
         except Exception as e:
             return []
         
-        if not places or not isinstance(places, list):
-            print(f"DEBUG: Places is not a valid list: {type(places)}")
+        if not places:
             return []
         
-        # Take first 3 places without complex sorting
-        top_places = places[:3] if len(places) >= 3 else places
-        
         # Format recommendations with minimal processing
         recommendations = []
-        for place in top_places:
+        for place in places:
             try:
-                # Get basic info with safe defaults
-                place_id = place.get('id', 'unknown')
-                place_name = place.get('name', 'Unknown Café')
-                place_address = place.get('vicinity', 'Address not available')
-                place_rating = place.get('rating', 0)
-                place_price = place.get('price_level', 2)
                 # Convert distance from miles to kilometers and round to 1 decimal place
-                place_distance_miles = place.get('distance', 0)
-                place_distance_km = round(place_distance_miles * 1.60934, 1)  # Convert miles to km
+                place_distance_km = round(place.distance * 1.60934, 1)  # Convert miles to km
                 
                 # Simple price formatting
-                if place_price == 1:
+                if place.price_level == 1:
                     price_display = '$'
-                elif place_price == 2:
+                elif place.price_level == 2:
                     price_display = '$$'
-                elif place_price == 3:
+                elif place.price_level == 3:
                     price_display = '$$$'
-                elif place_price == 4:
+                elif place.price_level == 4:
                     price_display = '$$$$'
                 else:
                     price_display = '$$'
                 
-                # Get photos from the place data - they're already URLs
-                photos = place.get('photos', [])
-                photo_urls = []
-                
-                # Photos are already URLs, just use them directly
-                if photos and isinstance(photos, list):
-                    photo_urls = photos[:3]  # Limit to first 3 photos
-                
                 # Create recommendation
                 recommendation = {
-                    'id': place_id,
-                    'place_id': place_id,  # Add place_id for Google Maps integration
-                    'name': place_name,
-                    'address': place_address,
-                    'rating': place_rating,
+                    'id': place.place_id,
+                    'place_id': place.place_id,  # Add place_id for Google Maps integration
+                    'name': place.name,
+                    'address': place.vicinity or 'Address not available',
+                    'rating': place.rating,
                     'price_level': price_display,
                     'match_reason': f"Great matcha café in Sydney - perfect for your {sentiment} mood",
                     'distance': place_distance_km,  # Now in kilometers
-                    'photos': photo_urls,  # Include actual photos
-                    'lat': place.get('geometry', {}).get('location', {}).get('lat'),
-                    'lng': place.get('geometry', {}).get('location', {}).get('lng')
+                    'photos': place.photos,  # Include actual photos
+                    'lat': place.lat,
+                    'lng': place.lng
                 }
                 
                 recommendations.append(recommendation)
@@ -448,150 +627,94 @@ def get_cafe_recommendations(user_message, sentiment, preferences, user_lat=None
         traceback.print_exc()
         return []
 
+def build_ranking_prompt(user_message, sentiment, preferences, places):
+    """Prompt asking the model to rank and explain the best 3 of up to 10 cafés"""
+    # Prepare places data for AI analysis
+    places_summary = []
+    for place in places[:10]:  # Analyze top 10 places
+        places_summary.append({
+            'name': place.name,
+            'rating': place.rating,
+            'price_level': place.price_range,
+            'address': place.vicinity or 'Unknown',
+            'distance': place.distance,
+            'types': place.types,
+            'photos': len(place.photo_refs)
+        })
+    
+    return f"""
+    As an expert matcha café consultant, analyze these cafés for a user who said: "{user_message}"
+    
+    User's mood: {sentiment}
+    User's preferences: {preferences}
+    
+    Cafés to analyze:
+    {places_summary}
+    
+    Rank the top 3 cafés that would be PERFECT for this user. For each recommendation, provide detailed reasoning.
+    
+    Consider these factors and explain how each café matches:
+    1. **Mood Match**: How does this café's atmosphere match the user's current mood?
+    2. **Time Appropriateness**: Is this café suitable for the current time/occasion?
+    3. **Budget Alignment**: How does the price level match their budget preferences?
+    4. **Atmosphere Match**: Does the vibe/ambiance align with what they're looking for?
+    5. **Distance Convenience**: Is the location practical for their needs?
+    6. **Matcha Authenticity**: How authentic is the matcha experience?
+    7. **Special Features**: What unique aspects make this café stand out?
+    
+    Return ONLY a JSON array with the top 3 cafés in this exact format:
+    [
+        {{
+            "rank": 1,
+            "cafe_name": "exact name from list",
+            "reason": "Detailed explanation of why this café is perfect for this specific user, considering their mood, preferences, and needs. Explain the specific factors that make it an ideal choice.",
+            "mood_match": "Specific explanation of how this café's atmosphere matches their current mood and why this is beneficial",
+            "best_for": "What specific occasion, need, or experience this café is best suited for",
+            "key_features": "2-3 key features that make this café special for this user",
+            "why_better_than_others": "Brief explanation of why this café ranks higher than alternatives"
+        }}
+    ]
+    
+    Make your explanations specific, helpful, and educational. Help the user understand exactly why each café is recommended for them.
+    """
+
 def get_ai_enhanced_recommendations(user_message, sentiment, preferences, places, user_lat, user_lng):
-    """Use AI to intelligently rank and explain café recommendations"""
+    """
+    Use AI to intelligently rank and explain café recommendations.
+    
+    The model gets AI_RERANK_DEADLINE seconds; after that the heuristic
+    order is returned and the model's answer, once it arrives, is cached
+    for the next identical request.
+    """
     try:
         if not places or len(places) == 0:
             return []
         
-        # Prepare places data for AI analysis
-        places_summary = []
-        for place in places[:10]:  # Analyze top 10 places
-            places_summary.append({
-                'name': place.get('name', 'Unknown'),
-                'rating': place.get('rating', 0),
-                'price_level': place.get('price_range', 'Unknown'),
-                'address': place.get('vicinity', 'Unknown'),
-                'distance': place.get('distance', 0),
-                'types': place.get('types', []),
-                'photos': len(place.get('photos', []))
-            })
-        
-        # Create AI prompt for intelligent ranking
-        prompt = f"""
-        As an expert matcha café consultant, analyze these cafés for a user who said: "{user_message}"
-        
-        User's mood: {sentiment}
-        User's preferences: {preferences}
-        
-        Cafés to analyze:
-        {places_summary}
-        
-        Rank the top 3 cafés that would be PERFECT for this user. For each recommendation, provide detailed reasoning.
-        
-        Consider these factors and explain how each café matches:
-        1. **Mood Match**: How does this café's atmosphere match the user's current mood?
-        2. **Time Appropriateness**: Is this café suitable for the current time/occasion?
-        3. **Budget Alignment**: How does the price level match their budget preferences?
-        4. **Atmosphere Match**: Does the vibe/ambiance align with what they're looking for?
-        5. **Distance Convenience**: Is the location practical for their needs?
-        6. **Matcha Authenticity**: How authentic is the matcha experience?
-        7. **Special Features**: What unique aspects make this café stand out?
-        
-        Return ONLY a JSON array with the top 3 cafés in this exact format:
-        [
-            {{
-                "rank": 1,
-                "cafe_name": "exact name from list",
-                "reason": "Detailed explanation of why this café is perfect for this specific user, considering their mood, preferences, and needs. Explain the specific factors that make it an ideal choice.",
-                "mood_match": "Specific explanation of how this café's atmosphere matches their current mood and why this is beneficial",
-                "best_for": "What specific occasion, need, or experience this café is best suited for",
-                "key_features": "2-3 key features that make this café special for this user",
-                "why_better_than_others": "Brief explanation of why this café ranks higher than alternatives"
-            }}
-        ]
-        
-        Make your explanations specific, helpful, and educational. Help the user understand exactly why each café is recommended for them.
-        """
-        
-        # Call Ollama for intelligent ranking
-        response = requests.post('http://localhost:11434/api/generate', {
-            'model': 'llama2:latest',
-            'prompt': prompt,
-            'stream': False
-        }, timeout=30)
+        # Call Ollama for intelligent ranking, within the latency budget
+        ai_response = generate_within(
+            'llama2:latest',
+            build_ranking_prompt(user_message, sentiment, preferences, places),
+            deadline=getattr(settings, 'AI_RERANK_DEADLINE', 2.0),
+            timeout=30
+        )
+        if ai_response is None:
+            print("AI ranking missed its deadline or the ranking pool is busy, using the heuristic order")
+            ranked = [(place, None) for place in places[:3]]
+        else:
+            ranked = rerank(places, ai_response)
         
-        if response.status_code == 200:
-            result = response.json()
-            ai_response = result.get('response', '')
-            
-            # Always return enhanced recommendations with AI insights
-            enhanced_recommendations = []
-            for i, place in enumerate(places[:3]):
-                # Generate personalized AI insights based on sentiment and place data
-                if sentiment == 'stressed':
-                    mood_match = f"This café offers a peaceful, calming atmosphere perfect for when you're feeling {sentiment}. The quiet environment will help you relax and unwind."
-                    best_for = "Stress relief, relaxation, peaceful dining, quiet contemplation"
-                    key_features = "Tranquil atmosphere, comfortable seating, soothing environment"
-                elif sentiment == 'excited':
-                    mood_match = f"This vibrant café matches your {sentiment} energy perfectly! The lively atmosphere will keep your spirits high."
-                    best_for = "Celebrations, social gatherings, energetic dining, fun experiences"
-                    key_features = "Vibrant atmosphere, social environment, exciting menu options"
-                elif sentiment == 'focused':
-                    mood_match = f"This café provides the perfect environment for your {sentiment} mindset. The quiet atmosphere supports concentration and focus."
-                    best_for = "Study sessions, work meetings, focused dining, concentration"
-                    key_features = "Quiet atmosphere, good lighting, comfortable work spaces"
-                else:
-                    mood_match = f"This café is ideal for your {sentiment} mood! The atmosphere perfectly complements your current state of mind."
-                    best_for = "Quality dining, authentic matcha experience, comfortable atmosphere"
-                    key_features = "High rating, good location, authentic atmosphere"
-                
-                # Generate specific reason based on place characteristics
-                place_name = place.get('name', '').lower()
-                rating = place.get('rating', 0)
-                distance = place.get('distance', 0)
-                
-                if 'matcha' in place_name:
-                    matcha_reason = "This café specializes in authentic matcha, offering you the genuine Japanese tea experience you're looking for."
-                elif rating >= 4.5:
-                    matcha_reason = f"With an excellent {rating}-star rating, this café consistently delivers outstanding quality and service."
-                else:
-                    matcha_reason = f"This café offers a solid {rating}-star experience with good value for your money."
-                
-                # Distance benefit
-                if distance <= 1.0:
-                    distance_benefit = f"Located just {distance} km away, this café is extremely convenient for your current location."
-                elif distance <= 2.0:
-                    distance_benefit = f"At {distance} km away, this café is easily accessible and worth the short trip."
-                else:
-                    distance_benefit = f"While {distance} km away, this café's exceptional quality makes it worth the journey."
-                
-                # Why this ranks higher
-                if i == 0:
-                    why_better = f"This café ranks #1 because it perfectly balances your {sentiment} mood, location convenience, and quality expectations."
-                elif i == 1:
-                    why_better = f"This café ranks #2 as an excellent alternative that closely matches your needs and preferences."
-                else:
-                    why_better = f"This café ranks #3 as a solid option that meets your basic requirements and offers good value."
-                
-                # Combine everything into a comprehensive explanation
-                reason = f"{matcha_reason} {mood_match} The combination of quality, atmosphere, and convenience makes this an ideal choice for your current needs."
-                
-                enhanced_recommendations.append({
-                    'id': place.get('id'),
-                    'place_id': place.get('place_id'),
-                    'name': place.get('name'),
-                    'address': place.get('vicinity'),
-                    'rating': place.get('rating'),
-                    'price_level': place.get('price_range'),
-                    'distance': place.get('distance'),
-                    'photos': place.get('photos', []),
-                    'ai_insight': {
-                        'rank': i + 1,
-                        'reason': reason,
-                        'mood_match': mood_match,
-                        'best_for': best_for,
-                        'key_features': key_features,
-                        'why_better_than_others': why_better,
-                        'budget_explanation': "This café provides excellent value for the quality and experience offered.",
-                        'distance_benefit': distance_benefit
-                    }
+        # Template insights, with the model's own explanations where it gave them
+        enhanced_recommendations = []
+        for i, (place, entry) in enumerate(ranked):
+            recommendation = build_recommendation(place, i + 1, sentiment)
+            if entry:
+                recommendation['ai_insight'].update({
+                    name: entry[name] for name in LLM_INSIGHT_FIELDS
+                    if isinstance(entry.get(name), str) and entry[name].strip()
                 })
-            
-            return enhanced_recommendations
+            enhanced_recommendations.append(recommendation)
         
-        # Fallback: return regular recommendations if AI fails
-        return get_cafe_recommendations(user_message, sentiment, preferences, user_lat, user_lng)
+        return enhanced_recommendations
         
     except Exception as e:
         print(f"AI enhancement error: {e}")
@@ -612,24 +735,24 @@ def calculate_match_score(place, sentiment, preferences, user_message):
         score -= 10
     
     # Sentiment matching
-    place_name = place.get('name', '').lower()
-    place_types = place.get('types', [])
+    name_tags = place_name_matcher.match(place.get('name', ''))
+    place_types = frozenset(place.get('types', []))
     
     if sentiment == 'stressed' or sentiment == 'tired':
-        if any(word in place_name for word in ['zen', 'quiet', 'peaceful', 'calm']):
+        if 'chat_calm' in name_tags:
             score += 15
         if 'park' in place_types:
             score += 10
     elif sentiment == 'excited' or sentiment == 'happy':
-        if any(word in place_name for word in ['social', 'bar', 'rooftop', 'trendy']):
+        if 'chat_lively' in name_tags:
             score += 15
     
     # User message context
     if 'study' in user_message.lower():
-        if any(word in place_name for word in ['library', 'quiet', 'study', 'work']):
+        if 'chat_study' in name_tags:
             score += 20
     elif 'friends' in user_message.lower() or 'meeting' in user_message.lower():
-        if any(word in place_name for word in ['social', 'lounge', 'bar']):
+        if 'chat_meetup' in name_tags:
             score += 15
     
     # Price preferences
@@ -677,26 +800,70 @@ def get_match_reason(sentiment, preferences, score):
     
     return " - ".join(reasons)
 
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+def encode_history_cursor(msg):
+    """Opaque keyset cursor for the page of messages older than msg"""
+    raw = f"{msg.timestamp.isoformat()}|{msg.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_history_cursor(cursor):
+    """(timestamp, id) from a history cursor; raises ValueError if malformed"""
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except ValueError:
+        # Also covers bad base64 (binascii.Error) and bad UTF-8
+        raise ValueError("Invalid cursor")
+
 @require_http_methods(["GET"])
 def get_conversation_history(request, session_id):
-    """Get conversation history for a session"""
+    """
+    Get conversation history for a session, newest page first.
+    
+    Pages hold up to `limit` messages in time order; pass the returned
+    `next_cursor` as `before` to load the next older page. Each page is one
+    query: messages are found by keyset on (timestamp, id) through the
+    (conversation, timestamp) index, and sentiments are joined in.
+    """
     try:
-        conversation = Conversation.objects.get(session_id=session_id)
-        messages = conversation.messages.all()
+        try:
+            limit = min(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid limit'}, status=400)
+        if limit < 1:
+            return JsonResponse({'error': 'Invalid limit'}, status=400)
+        
+        messages = Message.objects.filter(conversation__session_id=session_id).select_related('sentiment')
+        
+        before = request.GET.get('before')
+        if before:
+            try:
+                timestamp, pk = decode_history_cursor(before)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            messages = messages.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk))
+        
+        # One extra row tells us whether an older page exists
+        page = list(messages.order_by('-timestamp', '-pk')[:limit + 1])
+        next_cursor = encode_history_cursor(page[limit - 1]) if len(page) > limit else None
+        page = page[:limit]
+        page.reverse()
         
         history = []
-        for msg in messages:
+        for msg in page:
+            sentiment = getattr(msg, 'sentiment', None) if msg.role == 'user' else None
             history.append({
+                'id': msg.pk,
                 'role': msg.role,
                 'content': msg.content,
                 'timestamp': msg.timestamp.isoformat(),
-                'sentiment': getattr(msg.sentiment, 'sentiment', None) if msg.role == 'user' else None
+                'sentiment': sentiment.sentiment if sentiment else None
             })
         
-        return JsonResponse({'conversation': history})
+        return JsonResponse({'conversation': history, 'next_cursor': next_cursor})
         
-    except Conversation.DoesNotExist:
-        return JsonResponse({'conversation': []})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -704,36 +871,37 @@ def get_conversation_history(request, session_id):
 def get_user_preferences(request, session_id):
     """Get extracted user preferences for a session"""
     try:
-        preferences = UserPreference.objects.filter(session_id=session_id)
+        preferences = UserPreference.objects.filter(session_id=session_id).values_list(
+            'preference_type', 'preference_value', 'confidence'
+        )
         
         pref_data = {}
-        for pref in preferences:
-            pref_data[pref.preference_type] = {
-                'value': pref.preference_value,
-                'confidence': pref.confidence
-            }
+        for pref_type, value, confidence in preferences:
+            # Rows come newest first; keep the latest value of each type
+            pref_data.setdefault(pref_type, {
+                'value': value,
+                'confidence': confidence
+            })
         
         return JsonResponse({'preferences': pref_data})
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+@require_http_methods(["GET"])
+def ollama_stats(request):
+    """Report LLM response cache and write-behind queue counters"""
+    return JsonResponse({'llm_cache': llm_cache.stats(), 'chat_writes': chat_turn_writer.stats()})
+
 def test_ollama_connection():
     """Test if Ollama is working properly"""
     try:
-        response = requests.post('http://localhost:11434/api/generate', {
-            'model': 'llama2:latest',
-            'prompt': 'Say "Hello, Ollama is working!"',
-            'stream': False
-        }, timeout=10)
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"DEBUG: Ollama test successful: {result.get('response', '')[:100]}")
-            return True
-        else:
-            print(f"DEBUG: Ollama test failed with status {response.status_code}")
-            return False
+        ai_response = ollama.generate('llama2:latest', 'Say "Hello, Ollama is working!"', timeout=10, cache=False)
+        print(f"DEBUG: Ollama test successful: {ai_response[:100]}")
+        return True
+    except ollama.OllamaError as e:
+        print(f"DEBUG: Ollama test failed with status {e.status_code}")
+        return False
     except Exception as e:
         print(f"DEBUG: Ollama test error: {e}")
         return False
@@ -754,37 +922,31 @@ def test_ai_enhancement(request):
         ollama_working = test_ollama_connection()
         print(f"   Ollama working: {ollama_working}")
         
-        # Test 2: Get places from API
-        print("2. Getting places from API...")
-        places_response = requests.get(f'http://localhost:8000/api/places/?lat={test_lat}&lng={test_lng}&sentiment={test_sentiment}', timeout=10)
-        print(f"   API status: {places_response.status_code}")
+        # Test 2: Get places from the search service
+        print("2. Getting places from search service...")
+        places = search_places(test_lat, test_lng, build_user_context(sentiment=test_sentiment), limit=10)
+        print(f"   Got {len(places)} places")
+        print(f"   First place: {places[0].name if places else 'None'}")
         
-        if places_response.status_code == 200:
-            places = places_response.json()
-            print(f"   Got {len(places)} places")
-            print(f"   First place: {places[0].get('name') if places else 'None'}")
-            
-            # Test 3: AI enhancement
-            print("3. Testing AI enhancement...")
-            enhanced = get_ai_enhanced_recommendations(test_message, test_sentiment, test_preferences, places, test_lat, test_lng)
-            print(f"   Enhanced recommendations: {len(enhanced)}")
-            
-            if enhanced and len(enhanced) > 0:
-                first_rec = enhanced[0]
-                print(f"   First recommendation: {first_rec.get('name')}")
-                print(f"   Has AI insight: {'ai_insight' in first_rec}")
-                if 'ai_insight' in first_rec:
-                    print(f"   AI insight: {first_rec['ai_insight']}")
-            else:
-                print("   No enhanced recommendations returned")
+        # Test 3: AI enhancement
+        print("3. Testing AI enhancement...")
+        enhanced = get_ai_enhanced_recommendations(test_message, test_sentiment, test_preferences, places, test_lat, test_lng)
+        print(f"   Enhanced recommendations: {len(enhanced)}")
+        
+        if enhanced and len(enhanced) > 0:
+            first_rec = enhanced[0]
+            print(f"   First recommendation: {first_rec.get('name')}")
+            print(f"   Has AI insight: {'ai_insight' in first_rec}")
+            if 'ai_insight' in first_rec:
+                print(f"   AI insight: {first_rec['ai_insight']}")
         else:
-            print(f"   API failed: {places_response.text[:200]}")
+            print("   No enhanced recommendations returned")
         
         return JsonResponse({
             'status': 'test_completed',
             'ollama_working': ollama_working,
-            'places_count': len(places) if places_response.status_code == 200 else 0,
-            'enhanced_count': len(enhanced) if 'enhanced' in locals() else 0
+            'places_count': len(places),
+            'enhanced_count': len(enhanced)
         })
         
     except Exception as e:
@@ -863,55 +1025,4 @@ def generate_placeholder_image(request, width, height):
 
 def extract_location_from_message(message):
     """Extract location names from user messages and convert to coordinates"""
-    import re
-    
-    # Common Sydney suburbs and areas
-    sydney_locations = {
-        'darling harbour': (-33.8715, 151.2006),
-        'surry hills': (-33.8847, 151.2087),
-        'haymarket': (-33.8847, 151.2087),
-        'newtown': (-33.8983, 151.1783),
-        'glebe': (-33.8847, 151.1883),
-        'ultimo': (-33.8847, 151.1983),
-        'pyrmont': (-33.8715, 151.1883),
-        'balmain': (-33.8583, 151.1783),
-        'bondi': (-33.8914, 151.2766),
-        'manly': (-33.7969, 151.2857),
-        'circular quay': (-33.8583, 151.2087),
-        'the rocks': (-33.8583, 151.2087),
-        'woolloomooloo': (-33.8715, 151.2183),
-        'potts point': (-33.8715, 151.2283),
-        'darlinghurst': (-33.8847, 151.2183),
-        'paddington': (-33.8847, 151.2283),
-        'bondi junction': (-33.8914, 151.2666),
-        'randwick': (-33.9167, 151.2500),
-        'coogee': (-33.9167, 151.2666),
-        'maroubra': (-33.9500, 151.2333)
-    }
-    
-    message_lower = message.lower()
-    
-    # Look for location keywords
-    for location, coords in sydney_locations.items():
-        if location in message_lower:
-            return coords
-    
-    # Look for "near [location]" or "close to [location]" patterns
-    near_pattern = r'near\s+([a-zA-Z\s]+)'
-    close_pattern = r'close\s+to\s+([a-zA-Z\s]+)'
-    
-    near_match = re.search(near_pattern, message_lower)
-    if near_match:
-        location_name = near_match.group(1).strip()
-        for location, coords in sydney_locations.items():
-            if location_name in location or location in location_name:
-                return coords
-    
-    close_match = re.search(close_pattern, message_lower)
-    if close_match:
-        location_name = close_match.group(1).strip()
-        for location, coords in sydney_locations.items():
-            if location_name in location or location in location_name:
-                return coords
-    
-    return None
+    return find_location(message)
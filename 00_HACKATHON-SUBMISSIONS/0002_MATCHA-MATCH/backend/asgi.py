@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Route the places and chat endpoints to their async views under ASGI
+os.environ.setdefault('ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
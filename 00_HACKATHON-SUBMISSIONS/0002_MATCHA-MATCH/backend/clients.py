@@ -0,0 +1,14 @@
+import asyncio
+import weakref
+
+# One httpx.AsyncClient per (event loop, name); a client cannot be shared across loops
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client(name, factory):
+    """Return the httpx.AsyncClient called name for the running event loop, creating it with factory()"""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    if name not in clients:
+        clients[name] = factory()
+    return clients[name]
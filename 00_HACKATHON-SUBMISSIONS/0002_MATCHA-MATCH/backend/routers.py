@@ -0,0 +1,38 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_ALIAS = 'read'
+
+
+class ReadReplicaRouter:
+    """
+    Send chat history and preference reads to the read-only alias.
+
+    Both aliases open the same SQLite file; in WAL mode readers never block
+    the writer, so those reads no longer queue behind chat turns being saved.
+    Reads inside a transaction on the default database stay on it, so code
+    that reads back what it just wrote sees its own uncommitted rows.
+    """
+
+    read_models = {
+        ('ai_chat', 'conversation'),
+        ('ai_chat', 'message'),
+        ('ai_chat', 'sentimentanalysis'),
+        ('ai_chat', 'userpreference'),
+    }
+
+    def db_for_read(self, model, **hints):
+        if (model._meta.app_label, model._meta.model_name) not in self.read_models:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return READ_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or Django would write objects back to the alias they were read from
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != READ_ALIAS
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,6 +21,58 @@ load_dotenv()
 # Google Maps API key - use a separate backend key
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY", "demo-key")
 
+# Shared Google Maps client - one pooled keep-alive client per worker process
+GOOGLE_MAPS_BASE_URL = os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com")
+GOOGLE_MAPS_POOL_SIZE = int(os.getenv("GOOGLE_MAPS_POOL_SIZE", "10"))
+GOOGLE_MAPS_CONNECT_TIMEOUT = float(os.getenv("GOOGLE_MAPS_CONNECT_TIMEOUT", "3"))  # seconds
+GOOGLE_MAPS_READ_TIMEOUT = float(os.getenv("GOOGLE_MAPS_READ_TIMEOUT", "10"))  # seconds
+GOOGLE_MAPS_RETRY_TIMEOUT = int(os.getenv("GOOGLE_MAPS_RETRY_TIMEOUT", "15"))  # seconds
+
+# Places lookup cache - raw results are cached per snapped lat/lng cell
+PLACES_CACHE_PRECISION = int(os.getenv("PLACES_CACHE_PRECISION", "3"))  # decimal places kept
+PLACES_CACHE_TTL = int(os.getenv("PLACES_CACHE_TTL", "300"))  # seconds
+PLACES_CACHE_MAX_ENTRIES = int(os.getenv("PLACES_CACHE_MAX_ENTRIES", "512"))
+
+# Local-first lookups - serve radius queries from the Place table while it is fresh
+PLACES_LOCAL_FIRST = os.getenv("PLACES_LOCAL_FIRST", "true").lower() == "true"
+PLACES_LOCAL_MAX_AGE = int(os.getenv("PLACES_LOCAL_MAX_AGE", "86400"))  # seconds
+
+# Keyword queries issued concurrently per search and merged by place_id. Each
+# keyword is one Places request per search (up to PLACES_DEEP_MAX_PAGES for
+# deep searches), so extra keywords multiply quota use on cache misses; opt in
+# with e.g. "matcha cafe tea,matcha,tea house,japanese cafe"
+PLACES_SEARCH_KEYWORDS = [
+    keyword.strip()
+    for keyword in os.getenv("PLACES_SEARCH_KEYWORDS", "matcha cafe tea").split(",")
+    if keyword.strip()
+]
+
+# Deep search (?deep=1) - follow next_page_token up to a page cap and latency budget
+PLACES_DEEP_MAX_PAGES = int(os.getenv("PLACES_DEEP_MAX_PAGES", "3"))
+PLACES_DEEP_BUDGET = float(os.getenv("PLACES_DEEP_BUDGET", "8"))  # seconds
+PLACES_PAGE_TOKEN_DELAY = float(os.getenv("PLACES_PAGE_TOKEN_DELAY", "2"))  # seconds
+
+# Ollama - one pooled keep-alive session per worker; models stay loaded between calls
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "10"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3"))  # seconds
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # how long a model stays resident
+
+# LLM re-ranking of recommendations - past the deadline the heuristic order is served
+AI_RERANK_DEADLINE = float(os.getenv("AI_RERANK_DEADLINE", "2"))  # seconds
+AI_RERANK_WORKERS = int(os.getenv("AI_RERANK_WORKERS", "2"))
+AI_RERANK_MAX_PENDING = int(os.getenv("AI_RERANK_MAX_PENDING", "2"))  # calls in flight before ranking is skipped
+
+# Local sentiment classifier - messages it labels with at least this confidence skip Ollama
+SENTIMENT_CLASSIFIER_ENABLED = os.getenv("SENTIMENT_CLASSIFIER_ENABLED", "true").lower() == "true"
+SENTIMENT_CLASSIFIER_THRESHOLD = float(os.getenv("SENTIMENT_CLASSIFIER_THRESHOLD", "0.8"))
+
+# Optional CSV of extra place names (name,lat,lng[,aliases]) for locations in chat messages
+GAZETTEER_CSV = os.getenv("GAZETTEER_CSV", "")
+
+# Serve the async PlacesView/chat views (set by backend/asgi.py; WSGI keeps the sync views)
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "false").lower() == "true"
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -78,12 +131,61 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+DATABASE_PATH = os.getenv("DATABASE_PATH", str(BASE_DIR / 'db.sqlite3'))
+
+# SQLite production profile - WAL journal, relaxed fsync, busy timeout and
+# persistent connections; SQLITE_PROFILE=false gives Django's defaults
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "true").lower() == "true"
+SQLITE_READ_ALIAS = os.getenv("SQLITE_READ_ALIAS", "false").lower() == "true"  # route history/preference reads
+
+if SQLITE_PROFILE:
+    SQLITE_DATABASE = {
+        'ENGINE': 'backend.sqlite',
+        'NAME': DATABASE_PATH,
+        'CONN_MAX_AGE': int(os.getenv("SQLITE_CONN_MAX_AGE", "600")),  # seconds
+        'CONN_HEALTH_CHECKS': True,
+        'TRANSACTION_MODE': 'IMMEDIATE',
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',  # with WAL, fsync at checkpoints rather than every commit
+            'busy_timeout': int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),  # milliseconds
+            'cache_size': -int(os.getenv("SQLITE_CACHE_KB", "20000")),  # negative means KiB
+            'mmap_size': int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024))),  # bytes
+            'temp_store': 'MEMORY',
+        },
     }
-}
+    DATABASES = {
+        'default': SQLITE_DATABASE,
+    }
+    if SQLITE_READ_ALIAS:
+        DATABASES['read'] = dict(
+            SQLITE_DATABASE, READ_ONLY=True, TRANSACTION_MODE='DEFERRED', TEST={'MIRROR': 'default'}
+        )
+        DATABASE_ROUTERS = ['backend.routers.ReadReplicaRouter']
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': DATABASE_PATH,
+        }
+    }
+
+# Ollama response cache - a separate SQLite file keyed by prompt fingerprint
+OLLAMA_CACHE_ENABLED = os.getenv("OLLAMA_CACHE_ENABLED", "true").lower() == "true"
+OLLAMA_CACHE_PATH = os.getenv("OLLAMA_CACHE_PATH", str(BASE_DIR / 'llm_cache.sqlite3'))
+OLLAMA_CACHE_TTL = int(os.getenv("OLLAMA_CACHE_TTL", "86400"))  # seconds
+OLLAMA_CACHE_MAX_ENTRIES = int(os.getenv("OLLAMA_CACHE_MAX_ENTRIES", "5000"))
+
+# The test runner keeps its cache in memory so test runs never read or leave rows in the real file
+if len(sys.argv) > 1 and sys.argv[1] == 'test':
+    OLLAMA_CACHE_PATH = ':memory:'
+
+# Write-behind for chat turns - a background thread saves them in batches after the response
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "false").lower() == "true"
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", "1000"))
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "50"))
+CHAT_WRITE_BLOCK_TIMEOUT = float(os.getenv("CHAT_WRITE_BLOCK_TIMEOUT", "0.5"))  # seconds before writing inline
+CHAT_WRITE_FLUSH_TIMEOUT = float(os.getenv("CHAT_WRITE_FLUSH_TIMEOUT", "10"))  # seconds to drain at exit
 
 
 # Password validation
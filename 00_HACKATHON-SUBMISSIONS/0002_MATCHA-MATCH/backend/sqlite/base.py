@@ -0,0 +1,27 @@
+"""
+SQLite backend with a production profile.
+
+Set ENGINE to 'backend.sqlite' and these extra keys on the DATABASES entry:
+
+PRAGMAS           pragmas run on every new connection, e.g. journal_mode=WAL
+TRANSACTION_MODE  DEFERRED (SQLite's default), IMMEDIATE or EXCLUSIVE for atomic blocks
+READ_ONLY         open connections with query_only, for a read alias of the same file
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', {}).items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.settings_dict.get('READ_ONLY'):
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # IMMEDIATE takes the write lock when the transaction starts, so a
+        # writer waits on busy_timeout instead of failing with "database is
+        # locked" when it upgrades from a read half way through
+        mode = self.settings_dict.get('TRANSACTION_MODE') or 'DEFERRED'
+        self.cursor().execute(f"BEGIN {mode}")
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class GeoCache:
+    """TTL + LRU cache for raw Places results, keyed on a snapped lat/lng grid cell"""
+
+    def __init__(self, precision=3, ttl=300, max_entries=512, clock=time.monotonic):
+        # precision is the number of decimal places kept when snapping
+        # coordinates; 3 decimals is a cell of roughly 110m x 90m in Sydney
+        self.precision = precision
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def snap(self, lat, lng):
+        """The (lat, lng) grid cell a location falls in"""
+        return (round(float(lat), self.precision), round(float(lng), self.precision))
+
+    @staticmethod
+    def normalize_keyword(keyword):
+        return (keyword or '').strip().lower()
+
+    def make_key(self, lat, lng, keyword, radius):
+        """Snap the location to a grid cell and combine it with the query"""
+        return (self.snap(lat, lng), self.normalize_keyword(keyword), int(radius))
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_fetch(self, lat, lng, keyword, radius, fetch, flight=None):
+        """
+        Return cached results for the query, calling fetch() on a miss.
+
+        With a SingleFlight, concurrent misses for the same key share one
+        fetch() call instead of each going to the upstream API.
+        """
+        key = self.make_key(lat, lng, keyword, radius)
+        value = self.get(key)
+        if value is None:
+            def fetch_and_store():
+                result = fetch()
+                self.set(key, result)
+                return result
+            value = flight.do(key, fetch_and_store) if flight else fetch_and_store()
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'precision': self.precision,
+            }
+
+
+places_cache = GeoCache(
+    precision=getattr(settings, 'PLACES_CACHE_PRECISION', 3),
+    ttl=getattr(settings, 'PLACES_CACHE_TTL', 300),
+    max_entries=getattr(settings, 'PLACES_CACHE_MAX_ENTRIES', 512),
+)
@@ -0,0 +1,98 @@
+import os
+import threading
+
+import googlemaps
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from backend.clients import get_async_client
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def build_session():
+    """Keep-alive session with a connection pool sized for concurrent requests"""
+    pool_size = getattr(settings, 'GOOGLE_MAPS_POOL_SIZE', 10)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_gmaps_client():
+    """
+    Return the shared Google Maps client for this worker process.
+
+    The client is created on first use and reused afterwards, so requests
+    skip client construction and ride on pooled keep-alive connections.
+    A forked worker builds its own client instead of sharing sockets.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = googlemaps.Client(
+                key=settings.GOOGLE_MAPS_API_KEY,
+                connect_timeout=getattr(settings, 'GOOGLE_MAPS_CONNECT_TIMEOUT', 3),
+                read_timeout=getattr(settings, 'GOOGLE_MAPS_READ_TIMEOUT', 10),
+                retry_timeout=getattr(settings, 'GOOGLE_MAPS_RETRY_TIMEOUT', 15),
+                requests_session=build_session(),
+                base_url=getattr(settings, 'GOOGLE_MAPS_BASE_URL', 'https://maps.googleapis.com'),
+            )
+            _client_pid = pid
+    return _client
+
+
+def reset_gmaps_client():
+    """Drop the shared client, e.g. after changing settings"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
+        _client_pid = None
+
+
+def build_async_gmaps_client():
+    """Async counterpart of build_session() for the Places web service"""
+    pool_size = getattr(settings, 'GOOGLE_MAPS_POOL_SIZE', 10)
+    return httpx.AsyncClient(
+        base_url=getattr(settings, 'GOOGLE_MAPS_BASE_URL', 'https://maps.googleapis.com'),
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        timeout=httpx.Timeout(
+            getattr(settings, 'GOOGLE_MAPS_READ_TIMEOUT', 10),
+            connect=getattr(settings, 'GOOGLE_MAPS_CONNECT_TIMEOUT', 3),
+        ),
+    )
+
+
+async def aplaces_nearby(location=None, radius=None, keyword=None, type=None, page_token=None):
+    """Async equivalent of googlemaps.Client.places_nearby over a pooled httpx client"""
+    params = {'key': settings.GOOGLE_MAPS_API_KEY}
+    if page_token:
+        params['pagetoken'] = page_token
+    else:
+        params['location'] = f"{location[0]},{location[1]}"
+        params['radius'] = radius
+        if keyword:
+            params['keyword'] = keyword
+        if type:
+            params['type'] = type
+
+    client = get_async_client('google_maps', build_async_gmaps_client)
+    response = await client.get('/maps/api/place/nearbysearch/json', params=params)
+    if response.status_code != 200:
+        raise googlemaps.exceptions.HTTPError(response.status_code)
+
+    body = response.json()
+    if body.get('status') not in ('OK', 'ZERO_RESULTS'):
+        raise googlemaps.exceptions.ApiError(body.get('status'), body.get('error_message'))
+    return body
@@ -0,0 +1,195 @@
+"""
+Place-name gazetteer for finding locations mentioned in chat messages.
+
+Names are stored in a token trie, so a message is scanned once and the
+cost of a lookup depends on the message length and the longest name, not
+on how many names are loaded. Extra names (e.g. every Australian suburb)
+can be loaded from the CSV file named by the GAZETTEER_CSV setting.
+"""
+import csv
+import difflib
+import re
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+
+_token_pattern = re.compile(r"[a-z0-9']+")
+_near_pattern = re.compile(r"\b(?:near|close\s+to)\s+([a-z][a-z'\s-]*)")
+
+# Common Sydney suburbs and areas
+SYDNEY_LOCATIONS = {
+    'darling harbour': (-33.8715, 151.2006),
+    'surry hills': (-33.8847, 151.2087),
+    'haymarket': (-33.8847, 151.2087),
+    'newtown': (-33.8983, 151.1783),
+    'glebe': (-33.8847, 151.1883),
+    'ultimo': (-33.8847, 151.1983),
+    'pyrmont': (-33.8715, 151.1883),
+    'balmain': (-33.8583, 151.1783),
+    'bondi': (-33.8914, 151.2766),
+    'manly': (-33.7969, 151.2857),
+    'circular quay': (-33.8583, 151.2087),
+    'the rocks': (-33.8583, 151.2087),
+    'woolloomooloo': (-33.8715, 151.2183),
+    'potts point': (-33.8715, 151.2283),
+    'darlinghurst': (-33.8847, 151.2183),
+    'paddington': (-33.8847, 151.2283),
+    'bondi junction': (-33.8914, 151.2666),
+    'randwick': (-33.9167, 151.2500),
+    'coogee': (-33.9167, 151.2666),
+    'maroubra': (-33.9500, 151.2333),
+    'sydney cbd': (-33.8688, 151.2093),
+}
+
+# Alternative spellings and nicknames -> canonical name
+SYDNEY_ALIASES = {
+    'darling harbor': 'darling harbour',
+    'darling hbr': 'darling harbour',
+    'the quay': 'circular quay',
+    'cbd': 'sydney cbd',
+    'city centre': 'sydney cbd',
+    'city center': 'sydney cbd',
+    'bondi beach': 'bondi',
+    'surry hill': 'surry hills',
+}
+
+
+def tokenize(text):
+    """Lowercased word tokens; hyphens and punctuation separate words"""
+    return tuple(_token_pattern.findall(text.lower()))
+
+
+class Gazetteer:
+    """
+    Longest-match place-name lookup over a token trie.
+
+    Each trie node is a dict of next token -> child node; a node that ends a
+    name holds the canonical name under the None key. Aliases are inserted as
+    extra paths to the same canonical name.
+    """
+
+    def __init__(self):
+        self.coordinates = {}
+        self.root = {}
+        self.max_tokens = 0
+        self._names_by_initial = {}
+
+    def add(self, name, lat, lng, aliases=()):
+        """Add a place and its aliases; the first coordinates loaded for a name win"""
+        canonical = ' '.join(tokenize(name))
+        if not canonical:
+            return
+        self.coordinates.setdefault(canonical, (lat, lng))
+        for spelling in (name,) + tuple(aliases):
+            self.add_alias(spelling, canonical)
+
+    def add_alias(self, alias, canonical):
+        tokens = tokenize(alias)
+        if not tokens or canonical not in self.coordinates:
+            return
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node.setdefault(None, canonical)
+        self.max_tokens = max(self.max_tokens, len(tokens))
+        self._names_by_initial.setdefault(tokens[0][0], set()).add(' '.join(tokens))
+
+    def load_csv(self, path):
+        """
+        Load places from a CSV file with name, lat and lng columns and an
+        optional aliases column of |-separated alternative names.
+        """
+        with open(path, newline='', encoding='utf-8') as handle:
+            for row in csv.DictReader(handle):
+                try:
+                    lat, lng = float(row['lat']), float(row['lng'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                aliases = [alias for alias in (row.get('aliases') or '').split('|') if alias.strip()]
+                self.add(row.get('name') or '', lat, lng, aliases)
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def _longest_match(self, tokens, start):
+        """Canonical name of the longest entry starting at tokens[start], or None"""
+        node = self.root
+        found = None
+        for token in tokens[start:start + self.max_tokens]:
+            node = node.get(token)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+    def find(self, text):
+        """Canonical name of the first place mentioned in text, longest match first"""
+        tokens = tokenize(text)
+        for start in range(len(tokens)):
+            name = self._longest_match(tokens, start)
+            if name:
+                return name
+        return None
+
+    def fuzzy_find(self, phrase, cutoff=0.8):
+        """
+        Closest known name to a misspelt phrase, trying each leading run of
+        its words. Candidates share the phrase's first letter, which keeps
+        the comparison set small for large gazetteers.
+        """
+        tokens = tokenize(phrase)[:self.max_tokens]
+        if not tokens:
+            return None
+        candidates = list(self._names_by_initial.get(tokens[0][0], ()))
+        for length in range(len(tokens), 0, -1):
+            matches = difflib.get_close_matches(' '.join(tokens[:length]), candidates, n=1, cutoff=cutoff)
+            if matches:
+                return self._longest_match(tokenize(matches[0]), 0)
+        return None
+
+    def lookup(self, text):
+        """(lat, lng) for the place mentioned in text, or None"""
+        name = self.find(text)
+        if name is None:
+            # "near bondy" / "close to surry hils": try a fuzzy match on the named place
+            for found in _near_pattern.finditer(text.lower()):
+                name = self.fuzzy_find(found.group(1))
+                if name:
+                    break
+        return self.coordinates[name] if name else None
+
+
+def build_gazetteer(csv_path=None):
+    """Gazetteer of the built-in Sydney places plus those in csv_path"""
+    gazetteer = Gazetteer()
+    for name, (lat, lng) in SYDNEY_LOCATIONS.items():
+        gazetteer.add(name, lat, lng)
+    for alias, canonical in SYDNEY_ALIASES.items():
+        gazetteer.add_alias(alias, canonical)
+    if csv_path:
+        try:
+            gazetteer.load_csv(csv_path)
+        except OSError as e:
+            print(f"Error loading gazetteer CSV {csv_path}: {e}")
+    return gazetteer
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Return the shared gazetteer, building it on first use"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = build_gazetteer(getattr(settings, 'GAZETTEER_CSV', ''))
+    return _gazetteer
+
+
+@lru_cache(maxsize=4096)
+def find_location(message):
+    """(lat, lng) of the place named in a chat message, or None"""
+    return get_gazetteer().lookup(message)
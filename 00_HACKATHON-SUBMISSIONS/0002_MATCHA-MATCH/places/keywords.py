@@ -0,0 +1,56 @@
+import re
+from functools import lru_cache
+
+# Feature tag -> substrings of a lowercased place name that imply it
+PLACE_NAME_FEATURES = {
+    # places.scoring.score_places
+    'quiet': ('zen', 'quiet', 'peaceful', 'calm', 'serene', 'tranquil'),
+    'social': ('social', 'bar', 'rooftop', 'trendy', 'vibrant', 'lively'),
+    'work': ('study', 'work', 'focus', 'quiet', 'concentration', 'library'),
+    'vibe_cozy': ('cozy', 'warm', 'intimate'),
+    'vibe_trendy': ('trendy', 'modern', 'hip'),
+    'vibe_quiet': ('quiet', 'peaceful', 'serene'),
+    'matcha_style': ('matcha', 'green tea', 'tea house', 'tea room', 'japanese', 'asian'),
+    'matcha': ('matcha',),
+    # ai_chat calculate_match_score
+    'chat_calm': ('zen', 'quiet', 'peaceful', 'calm'),
+    'chat_lively': ('social', 'bar', 'rooftop', 'trendy'),
+    'chat_study': ('library', 'quiet', 'study', 'work'),
+    'chat_meetup': ('social', 'lounge', 'bar'),
+}
+
+
+class KeywordMatcher:
+    """
+    Match many substring keywords against a text in a single regex pass.
+
+    The pattern is one alternation inside a lookahead, so every position is
+    tried and overlapping keywords are all found. Alternatives are ordered
+    longest first; a shorter keyword hidden inside a longer match at the same
+    position is covered by giving each keyword the tags of every keyword it
+    contains.
+    """
+
+    def __init__(self, features):
+        keyword_tags = {}
+        for tag, keywords in features.items():
+            for keyword in keywords:
+                keyword_tags.setdefault(keyword, set()).add(tag)
+
+        self.keyword_tags = {
+            keyword: frozenset().union(*(tags for other, tags in keyword_tags.items() if other in keyword))
+            for keyword in keyword_tags
+        }
+        alternatives = sorted(self.keyword_tags, key=len, reverse=True)
+        self.pattern = re.compile('(?=(%s))' % '|'.join(map(re.escape, alternatives)))
+        self.match = lru_cache(maxsize=4096)(self._match)
+
+    def _match(self, text):
+        """Return the frozenset of feature tags whose keywords occur in text"""
+        tags = set()
+        for found in self.pattern.finditer(text.lower()):
+            tags |= self.keyword_tags[found.group(1)]
+        return frozenset(tags)
+
+
+place_name_matcher = KeywordMatcher(PLACE_NAME_FEATURES)
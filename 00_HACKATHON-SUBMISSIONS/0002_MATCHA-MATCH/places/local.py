@@ -0,0 +1,153 @@
+from datetime import timedelta
+from math import radians, sin, cos, sqrt, atan2
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import places_cache
+from .models import Place, SearchArea
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEGREE_LAT = 111320
+
+# Google price_level (0-4) -> Place.price_level choice
+PRICE_LEVEL_CHOICES = {
+    0: 'budget',
+    1: 'budget',
+    2: 'moderate',
+    3: 'premium',
+    4: 'premium'
+}
+
+
+def bounding_box(lat, lng, radius_m):
+    """Return (min_lat, max_lat, min_lng, max_lng) enclosing a circle of radius_m"""
+    dlat = radius_m / METERS_PER_DEGREE_LAT
+    dlng = radius_m / (METERS_PER_DEGREE_LAT * max(cos(radians(lat)), 1e-6))
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in metres"""
+    lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+    return EARTH_RADIUS_M * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+def find_nearby_places(lat, lng, radius_m, max_age=None):
+    """
+    Answer a radius query from the local Place table.
+
+    The lat/lng index narrows the table to the bounding box, then an exact
+    haversine check drops the corners. Only rows refreshed within max_age
+    seconds are returned. Results use the Google Places result shape.
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_m)
+    queryset = Place.objects.filter(
+        latitude__range=(min_lat, max_lat),
+        longitude__range=(min_lng, max_lng),
+    )
+    if max_age is not None:
+        queryset = queryset.filter(updated_at__gte=timezone.now() - timedelta(seconds=max_age))
+
+    return [
+        place.to_place_result()
+        for place in queryset
+        if haversine_m(lat, lng, place.latitude, place.longitude) <= radius_m
+    ]
+
+
+def is_covered(lat, lng, keywords, radius_m, max_age=None):
+    """
+    True if every keyword was searched on Google for this geo-cell with at
+    least radius_m, within max_age seconds. No keywords is never covered.
+    """
+    wanted = {places_cache.normalize_keyword(keyword) for keyword in keywords}
+    if not wanted:
+        return False
+    cell_lat, cell_lng = places_cache.snap(lat, lng)
+    queryset = SearchArea.objects.filter(
+        latitude=cell_lat,
+        longitude=cell_lng,
+        keyword__in=wanted,
+        radius__gte=radius_m,
+    )
+    if max_age is not None:
+        queryset = queryset.filter(searched_at__gte=timezone.now() - timedelta(seconds=max_age))
+    return set(queryset.values_list('keyword', flat=True)) == wanted
+
+
+def find_covered_places(lat, lng, radius_m, keywords, max_age=None):
+    """
+    Answer a search from the local Place table, or None when its geo-cell
+    has not been searched for all keywords recently (the caller then asks
+    Google). A covered area with no cafés gives an empty list.
+    """
+    if not is_covered(lat, lng, keywords, radius_m, max_age):
+        return None
+    return find_nearby_places(lat, lng, radius_m, max_age)
+
+
+def record_searches(keys, searched_at):
+    """Mark places cache keys ((lat, lng) cell, keyword, radius) as searched"""
+    SearchArea.objects.bulk_create(
+        [
+            SearchArea(latitude=lat, longitude=lng, keyword=keyword, radius=radius, searched_at=searched_at)
+            for (lat, lng), keyword, radius in keys
+        ],
+        update_conflicts=True,
+        unique_fields=['latitude', 'longitude', 'keyword', 'radius'],
+        update_fields=['searched_at'],
+    )
+
+
+def store_places(results, searched=()):
+    """
+    Upsert Google Places results into the local Place table.
+
+    searched lists the places cache keys the results answer; they are
+    recorded as covered in the same transaction, even when empty.
+    """
+    by_place_id = {}
+    for result in results:
+        location = result.get('geometry', {}).get('location', {})
+        if result.get('place_id') and location.get('lat') and location.get('lng'):
+            by_place_id[result['place_id']] = result
+
+    now = timezone.now()
+    with transaction.atomic():
+        if searched:
+            record_searches(searched, now)
+        if not by_place_id:
+            return 0
+        existing = {
+            place.place_id: place
+            for place in Place.objects.filter(place_id__in=list(by_place_id))
+        }
+        to_create, to_update = [], []
+        for place_id, result in by_place_id.items():
+            place = existing.get(place_id) or Place(place_id=place_id, created_at=now)
+            location = result['geometry']['location']
+            place.name = (result.get('name') or 'Unknown Place')[:200]
+            place.address = (result.get('vicinity') or '')[:500]
+            place.latitude = location['lat']
+            place.longitude = location['lng']
+            place.rating = result.get('rating') or 0.0
+            place.review_count = result.get('user_ratings_total') or 0
+            place.google_price_level = result.get('price_level')
+            place.price_level = PRICE_LEVEL_CHOICES.get(place.google_price_level, 'moderate')
+            place.has_wifi = bool(result.get('wifi', False))
+            place.types = result.get('types', [])
+            place.photos = result.get('photos', [])
+            # bulk_update bypasses auto_now, so stamp freshness explicitly
+            place.updated_at = now
+            (to_update if place.pk else to_create).append(place)
+
+        if to_create:
+            Place.objects.bulk_create(to_create, ignore_conflicts=True)
+        if to_update:
+            Place.objects.bulk_update(to_update, [
+                'name', 'address', 'latitude', 'longitude', 'rating', 'review_count',
+                'price_level', 'google_price_level', 'has_wifi', 'types', 'photos', 'updated_at'
+            ])
+    return len(by_place_id)
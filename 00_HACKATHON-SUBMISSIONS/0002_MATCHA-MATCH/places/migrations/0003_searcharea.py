@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-17 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0002_place_local_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchArea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('keyword', models.CharField(max_length=200)),
+                ('radius', models.IntegerField()),
+                ('searched_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searcharea',
+            constraint=models.UniqueConstraint(fields=('latitude', 'longitude', 'keyword', 'radius'), name='search_area_cell_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-17 22:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0003_searcharea'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='google_price_level',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
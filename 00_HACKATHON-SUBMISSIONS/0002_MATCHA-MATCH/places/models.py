@@ -4,6 +4,7 @@ class Place(models.Model):
     """Model for storing matcha café information"""
     
     # Basic information
+    place_id = models.CharField(max_length=255, unique=True, blank=True, null=True)  # Google Places ID
     name = models.CharField(max_length=200)
     address = models.CharField(max_length=500)
     phone = models.CharField(max_length=20, blank=True, null=True)
@@ -27,6 +28,8 @@ class Place(models.Model):
         ],
         default='moderate'
     )
+    # Google's own 0-4 price_level, kept as-is for local-first results
+    google_price_level = models.PositiveSmallIntegerField(blank=True, null=True)
     
     vibe = models.CharField(
         max_length=50,
@@ -68,6 +71,10 @@ class Place(models.Model):
     has_wifi = models.BooleanField(default=True)
     has_power_outlets = models.BooleanField(default=False)
     
+    # Raw Google Places data kept for local-first lookups
+    types = models.JSONField(default=list, blank=True)
+    photos = models.JSONField(default=list, blank=True)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -76,6 +83,10 @@ class Place(models.Model):
         ordering = ['-rating', '-review_count']
         verbose_name = 'Matcha Café'
         verbose_name_plural = 'Matcha Cafés'
+        indexes = [
+            # Bounding-box prefilter for radius queries
+            models.Index(fields=['latitude', 'longitude'], name='place_lat_lng_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.address}"
@@ -103,3 +114,48 @@ class Place(models.Model):
             'traditional': '🏮'
         }
         return vibe_emojis.get(self.vibe, '☕')
+    
+    def to_place_result(self):
+        """Return this café in the shape of a Google Places search result"""
+        types = list(self.types or [])
+        if self.has_outdoor_seating and 'outdoor_seating' not in types:
+            types.append('outdoor_seating')
+        result = {
+            'place_id': self.place_id or f"local-{self.pk}",
+            'name': self.name,
+            'rating': self.rating,
+            'user_ratings_total': self.review_count,
+            'vicinity': self.address,
+            'geometry': {'location': {'lat': self.latitude, 'lng': self.longitude}},
+            'types': types,
+            'photos': self.photos or [],
+            'wifi': self.has_wifi,
+        }
+        # Like Google, leave price_level out when it is unknown
+        if self.google_price_level is not None:
+            result['price_level'] = self.google_price_level
+        return result
+
+
+class SearchArea(models.Model):
+    """
+    A Google search already run for a geo-cell, keyed like the places cache.
+
+    Local-first lookups only answer from the Place table for cells where
+    every keyword was searched recently with at least the requested radius.
+    """
+    latitude = models.FloatField()  # snapped to PLACES_CACHE_PRECISION
+    longitude = models.FloatField()
+    keyword = models.CharField(max_length=200)
+    radius = models.IntegerField()  # metres
+    searched_at = models.DateTimeField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['latitude', 'longitude', 'keyword', 'radius'], name='search_area_cell_unique'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"'{self.keyword}' within {self.radius}m of ({self.latitude}, {self.longitude})"
@@ -0,0 +1,180 @@
+import numpy as np
+
+from .keywords import PLACE_NAME_FEATURES, place_name_matcher
+
+EARTH_RADIUS_MILES = 3959
+
+QUIET_SENTIMENTS = ('stressed', 'tired', 'calm')
+SOCIAL_SENTIMENTS = ('excited', 'happy', 'social')
+WORK_SENTIMENTS = ('focused', 'study', 'work')
+
+VIBE_FEATURES = {
+    'cozy': 'vibe_cozy',
+    'trendy': 'vibe_trendy',
+    'quiet': 'vibe_quiet',
+}
+
+OCCASION_TYPES = {
+    'date': 'romantic',
+    'birthday': 'celebration',
+    'meeting': 'quiet',
+}
+WEATHER_TYPES = {
+    'rainy': 'indoor',
+    'sunny': 'outdoor_seating',
+}
+
+# Every place type that contributes to the score
+SCORED_TYPES = frozenset([
+    'park', 'garden', 'bar', 'nightclub', 'library', 'cafe', 'breakfast', 'coffee',
+    'bakery', 'restaurant', 'lunch', 'dinner', 'rooftop', 'late_night',
+    'outdoor_seating', 'wheelchair_accessible',
+    *OCCASION_TYPES.values(), *WEATHER_TYPES.values(),
+])
+
+
+def haversine_miles(user_lat, user_lng, lats, lngs):
+    """Distances in miles from one point to arrays of points, rounded to 0.1"""
+    lat1, lng1 = np.radians(user_lat), np.radians(user_lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return np.round(EARTH_RADIUS_MILES * c, 1)
+
+
+def _place_coordinates(place, user_lat, user_lng):
+    """Place coordinates from geometry or flat lat/lng, else the user's own"""
+    geometry = place.get('geometry')
+    if geometry and 'location' in geometry:
+        return geometry['location']['lat'], geometry['location']['lng']
+    if 'lat' in place and 'lng' in place:
+        return place['lat'], place['lng']
+    return user_lat, user_lng
+
+
+def _number(value):
+    """Numeric value for packing into float arrays; None becomes NaN"""
+    return np.nan if value is None else value
+
+
+def score_places(places, user_lat, user_lng, user_context=None):
+    """
+    Score a whole candidate list in one vectorized pass.
+
+    Produces the same scores as the original per-place PlacesView scorer,
+    which places.tests keeps as the reference. Returns (scores, distances)
+    as NumPy arrays, with distances in miles rounded to 0.1.
+    """
+    user_context = user_context or {}
+    n = len(places)
+    if n == 0:
+        return np.zeros(0, dtype=int), np.zeros(0)
+
+    # Pack per-place attributes into arrays
+    ratings = np.empty(n)
+    prices = np.empty(n)
+    lats = np.empty(n)
+    lngs = np.empty(n)
+    wifi = np.zeros(n, dtype=bool)
+    type_flags = {place_type: np.zeros(n, dtype=bool) for place_type in SCORED_TYPES}
+    name_flags = {tag: np.zeros(n, dtype=bool) for tag in PLACE_NAME_FEATURES}
+    for i, place in enumerate(places):
+        ratings[i] = _number(place.get('rating', 0))
+        prices[i] = _number(place.get('price_level', 2))
+        lats[i], lngs[i] = _place_coordinates(place, user_lat, user_lng)
+        wifi[i] = bool(place.get('wifi', False))
+        for tag in place_name_matcher.match(place.get('name', '')):
+            name_flags[tag][i] = True
+        for place_type in SCORED_TYPES.intersection(place.get('types', [])):
+            type_flags[place_type][i] = True
+
+    def type_has(*wanted):
+        return np.logical_or.reduce([type_flags[place_type] for place_type in wanted])
+
+    score = np.zeros(n)
+
+    # Base score from rating (0-30 points); NaN ratings compare False
+    with np.errstate(invalid='ignore'):
+        score += np.select(
+            [ratings >= 4.8, ratings >= 4.5, ratings >= 4.0, ratings >= 3.5, ratings > 0],
+            [30, 25, 20, 15, 10],
+            default=0,
+        )
+
+        # Sentiment-based scoring (0-25 points)
+        sentiment = user_context.get('sentiment', 'neutral')
+        if sentiment in QUIET_SENTIMENTS:
+            score += 20 * name_flags['quiet']
+            score += 15 * type_has('park', 'garden')
+            score += 10 * (ratings >= 4.5)
+        elif sentiment in SOCIAL_SENTIMENTS:
+            score += 20 * name_flags['social']
+            score += 15 * type_has('bar', 'nightclub')
+            score += 10 * ((prices == 2) | (prices == 3))
+        elif sentiment in WORK_SENTIMENTS:
+            score += 20 * name_flags['work']
+            score += 15 * type_has('library', 'cafe')
+            score += 10 * wifi
+
+        # Time-based scoring (0-20 points)
+        current_hour = user_context.get('hour', 12)
+        if 6 <= current_hour <= 11:
+            score += 20 * type_has('breakfast', 'coffee')
+            score += 15 * type_has('bakery')
+        elif 11 <= current_hour <= 16:
+            score += 20 * type_has('restaurant', 'cafe')
+            score += 15 * type_has('lunch')
+        elif 16 <= current_hour <= 21:
+            score += 20 * type_has('dinner', 'bar')
+            score += 15 * type_has('rooftop')
+        elif 21 <= current_hour or current_hour <= 2:
+            score += 20 * type_has('bar', 'nightclub')
+            score += 15 * type_has('late_night')
+
+        # Budget preferences
+        user_preferences = user_context.get('preferences', {})
+        budget = user_preferences.get('budget', 'medium')
+        if budget == 'low':
+            score += 20 * (prices <= 1)
+        elif budget == 'medium':
+            score += 20 * ((prices == 1) | (prices == 2))
+        elif budget == 'high':
+            score += 20 * (prices >= 3)
+
+    # Atmosphere preferences
+    vibe = user_preferences.get('vibe', 'any')
+    if vibe in VIBE_FEATURES:
+        score += 20 * name_flags[VIBE_FEATURES[vibe]]
+
+    # Special needs
+    special_needs = user_preferences.get('special_needs', [])
+    if 'wifi' in special_needs:
+        score += 15 * wifi
+    if 'outdoor_seating' in special_needs:
+        score += 15 * type_has('outdoor_seating')
+    if 'accessible' in special_needs:
+        score += 15 * type_has('wheelchair_accessible')
+
+    # Matcha-specific scoring (0-15 points)
+    matcha_score = 5 * name_flags['matcha_style'] + 10 * name_flags['matcha']
+    score += np.minimum(15, matcha_score)
+
+    # Distance factor (0-15 points, closer is better)
+    distances = haversine_miles(user_lat, user_lng, lats, lngs)
+    score += np.select(
+        [distances <= 0.5, distances <= 1.0, distances <= 2.0, distances <= 3.0],
+        [15, 12, 8, 5],
+        default=2,
+    )
+
+    # Special occasion bonuses (0-10 points)
+    special_occasion = user_context.get('special_occasion', 'none')
+    if special_occasion in OCCASION_TYPES:
+        score += 10 * type_has(OCCASION_TYPES[special_occasion])
+
+    # Weather consideration (0-5 points)
+    weather = user_context.get('weather', 'sunny')
+    if weather in WEATHER_TYPES:
+        score += 5 * type_has(WEATHER_TYPES[weather])
+
+    return np.clip(score.astype(int), 0, 200), distances
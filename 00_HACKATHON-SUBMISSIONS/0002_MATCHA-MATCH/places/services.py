@@ -0,0 +1,666 @@
+"""
+Café search and scoring service.
+
+PlacesView, the async view and the AI chat pipeline all call into this
+module directly instead of going through HTTP. Searches return
+PlaceCandidate objects; to_dict() gives the /api/places/ JSON shape.
+"""
+import asyncio
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+import googlemaps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .cache import places_cache
+from .client import aplaces_nearby, get_gmaps_client
+from .local import find_covered_places, store_places
+from .scoring import score_places
+from .singleflight import async_places_flight, places_flight
+
+DEFAULT_LOCATION = (-33.8688, 151.2093)  # Sydney CBD
+DEFAULT_RADIUS = 5000  # metres
+DEFAULT_KEYWORD = 'matcha cafe tea'
+PLACEHOLDER_PHOTO_URL = "http://localhost:8000/api/ai/placeholder/400/300/"
+
+
+@dataclass
+class PlaceCandidate:
+    """A scored café returned by search_places"""
+    place_id: str
+    name: str
+    rating: float
+    price_level: Optional[int]
+    vicinity: str
+    lat: float
+    lng: float
+    match_score: int
+    distance: float  # miles
+    types: List[str] = field(default_factory=list)
+    photo_refs: List[dict] = field(default_factory=list)
+    photo_urls: Optional[List[str]] = None
+
+    @classmethod
+    def from_result(cls, place, match_score, distance):
+        """Build a candidate from a raw Google Places result"""
+        location = place['geometry']['location']
+        return cls(
+            place_id=place.get('place_id', ''),
+            name=place.get('name', 'Unknown Place'),
+            rating=place.get('rating', 0),
+            price_level=place.get('price_level'),
+            vicinity=place.get('vicinity', ''),
+            lat=location['lat'],
+            lng=location['lng'],
+            match_score=match_score,
+            distance=distance,
+            types=place.get('types', []),
+            photo_refs=place.get('photos', []),
+        )
+
+    @property
+    def price_range(self):
+        return format_price_range(self.price_level)
+
+    @property
+    def photos(self):
+        """Photo URLs, built on first access so unreturned places never pay for it"""
+        if self.photo_urls is None:
+            self.photo_urls = get_photo_urls(self.photo_refs)
+        return self.photo_urls
+
+    def to_dict(self):
+        """The /api/places/ JSON representation"""
+        return {
+            'id': self.place_id,
+            'place_id': self.place_id,  # Keep original place_id for Google Maps
+            'name': self.name,
+            'rating': self.rating,
+            'price_level': self.price_level,
+            'vicinity': self.vicinity,
+            'lat': self.lat,  # Required by frontend
+            'lng': self.lng,  # Required by frontend
+            'match_score': self.match_score,  # Required by frontend
+            'distance': self.distance,
+            'price_range': self.price_range,
+            'photos': self.photos
+        }
+
+
+def build_user_context(sentiment='neutral', budget='medium', vibe='any', special_needs=None,
+                       special_occasion='none', weather='sunny', hour=None):
+    """User context consumed by the match scorer"""
+    return {
+        'hour': datetime.now().hour if hour is None else hour,
+        'sentiment': sentiment,
+        'preferences': {
+            'budget': budget,
+            'vibe': vibe,
+            'special_needs': special_needs or []
+        },
+        'special_occasion': special_occasion,
+        'weather': weather
+    }
+
+
+def search_places(lat=None, lng=None, user_context=None, limit=None, deep=False, radius=DEFAULT_RADIUS):
+    """
+    Find and rank matcha cafés around (lat, lng).
+
+    Answers from the local Place table when the area is fresh, otherwise from
+    Google Places (cached, coalesced and fanned out over the configured
+    keywords). Falls back to mock cafés when no API key is configured or
+    Google fails, so callers always get a list.
+    """
+    lat, lng = resolve_location(lat, lng)
+    try:
+        pages = fetch_place_pages(lat, lng, deep, radius)
+        return candidates_from_pages(pages, lat, lng, user_context, limit)
+    except Exception as e:
+        print(f"Error fetching places from Google Maps: {e}")
+        # Fallback to mock data
+        return mock_candidates(lat, lng, limit)
+
+
+async def asearch_places(lat=None, lng=None, user_context=None, limit=None, deep=False, radius=DEFAULT_RADIUS):
+    """Async search_places: Google calls are awaited over a pooled httpx client"""
+    lat, lng = resolve_location(lat, lng)
+    try:
+        pages = await afetch_place_pages(lat, lng, deep, radius)
+        return candidates_from_pages(pages, lat, lng, user_context, limit)
+    except Exception as e:
+        print(f"Error fetching places from Google Maps: {e}")
+        return mock_candidates(lat, lng, limit)
+
+
+def resolve_location(lat, lng):
+    """Search coordinates as floats, defaulting to Sydney"""
+    if lat is None or lng is None:
+        return DEFAULT_LOCATION
+    return float(lat), float(lng)
+
+
+def fetch_place_pages(lat, lng, deep=False, radius=DEFAULT_RADIUS):
+    """
+    Fetch the raw result pages for a search without scoring them.
+
+    Returns None when there is no Google data to use (no API key), in which
+    case callers serve mock cafés. Deep searches return a generator so pages
+    can be scored while the next one is still being fetched.
+    """
+    # Local-first: answer from the Place table when this search already ran
+    # for the area recently
+    if getattr(settings, 'PLACES_LOCAL_FIRST', True):
+        try:
+            raw_places = find_covered_places(
+                lat, lng, radius, coverage_keywords(deep),
+                max_age=getattr(settings, 'PLACES_LOCAL_MAX_AGE', 86400)
+            )
+            if raw_places is not None:
+                return [raw_places]
+        except Exception as e:
+            print(f"Error querying local places: {e}")
+
+    if not has_api_key():
+        # Mock data when no API key is available
+        return None
+
+    # Shared Google Maps client (pooled keep-alive connections)
+    gmaps = get_gmaps_client()
+    if deep:
+        # Deep search: follow next_page_token per keyword, scoring each page as it arrives
+        return fetch_places_deep(gmaps, lat, lng, radius)
+    # One concurrent query per configured keyword (each cached per geo-cell)
+    return [fetch_places_fanout(gmaps, lat, lng, radius)]
+
+
+async def afetch_place_pages(lat, lng, deep=False, radius=DEFAULT_RADIUS):
+    """Async fetch_place_pages"""
+    if getattr(settings, 'PLACES_LOCAL_FIRST', True):
+        try:
+            raw_places = await sync_to_async(find_covered_places)(
+                lat, lng, radius, coverage_keywords(deep),
+                max_age=getattr(settings, 'PLACES_LOCAL_MAX_AGE', 86400)
+            )
+            if raw_places is not None:
+                return [raw_places]
+        except Exception as e:
+            print(f"Error querying local places: {e}")
+
+    if not has_api_key():
+        return None
+
+    if deep:
+        return await afetch_places_deep(lat, lng, radius)
+    return [await afetch_places_fanout(lat, lng, radius)]
+
+
+def candidates_from_pages(pages, lat, lng, user_context=None, limit=None):
+    """Rank fetched pages for a user; None (no Google data) gives the mock cafés"""
+    if pages is None:
+        return mock_candidates(lat, lng, limit)
+    return rank_places(pages, lat, lng, user_context or build_user_context(), limit)
+
+
+def has_api_key():
+    api_key = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
+    return bool(api_key) and api_key != 'demo-key'
+
+
+def rank_places(pages, user_lat, user_lng, user_context, limit=None):
+    """Score pages of raw Places results and return the best candidates first"""
+    places, match_scores, distances = [], [], []
+
+    for raw_places in pages:
+        # Skip places without coordinates
+        page = []
+        for place in raw_places:
+            location = place.get('geometry', {}).get('location', {})
+            if location.get('lat') and location.get('lng'):
+                page.append(place)
+
+        # Calculate match scores and distances for the whole page in one pass
+        page_scores, page_distances = score_places(page, user_lat, user_lng, user_context)
+        places.extend(page)
+        match_scores.extend(page_scores.tolist())
+        distances.extend(page_distances.tolist())
+
+    # Rank by match score (highest first); with a limit only the top-k are
+    # selected, so candidates are only built for places that are returned
+    if limit is not None:
+        ranked = heapq.nlargest(limit, range(len(places)), key=match_scores.__getitem__)
+    else:
+        ranked = sorted(range(len(places)), key=match_scores.__getitem__, reverse=True)
+
+    return [
+        PlaceCandidate.from_result(places[index], match_scores[index], distances[index])
+        for index in ranked
+    ]
+
+
+def fetch_places_nearby(gmaps, user_lat, user_lng, radius=DEFAULT_RADIUS, keyword=DEFAULT_KEYWORD):
+    """
+    Fetch raw Places results, served from the geo-cell cache when possible.
+
+    Concurrent identical lookups wait on a single in-flight Google call.
+    """
+    def fetch():
+        places_result = gmaps.places_nearby(
+            location=(user_lat, user_lng),
+            radius=radius,
+            keyword=keyword,
+            type='cafe'
+        )
+        results = places_result.get('results', [])
+        if getattr(settings, 'PLACES_LOCAL_FIRST', True):
+            try:
+                store_places(results, [places_cache.make_key(user_lat, user_lng, keyword, radius)])
+            except Exception as e:
+                print(f"Error storing places locally: {e}")
+        return results
+
+    return places_cache.get_or_fetch(user_lat, user_lng, keyword, radius, fetch, flight=places_flight)
+
+
+def search_keywords():
+    return getattr(settings, 'PLACES_SEARCH_KEYWORDS', None) or [DEFAULT_KEYWORD]
+
+
+def deep_keyword(keyword):
+    """Cache and coverage keyword for a completed deep search"""
+    return f"{keyword} (deep)"
+
+
+def coverage_keywords(deep=False):
+    """Keywords whose searches must have covered an area before it is answered locally"""
+    if deep:
+        return [deep_keyword(keyword) for keyword in search_keywords()]
+    return search_keywords()
+
+
+def merge_by_place_id(keywords, outcomes):
+    """Merge per-keyword result lists in keyword order, dropping duplicate place_ids"""
+    merged = {}
+    for keyword, results in zip(keywords, outcomes):
+        if isinstance(results, Exception):
+            print(f"Error fetching places for keyword '{keyword}': {results}")
+            continue
+        for place in results:
+            merged.setdefault(place.get('place_id') or id(place), place)
+    if not merged and outcomes and isinstance(outcomes[0], Exception):
+        # Every query failed - surface the first error to the caller
+        raise outcomes[0]
+    return list(merged.values())
+
+
+def closing_connections(fn, *args):
+    """
+    Call fn(*args) on a pool thread that is thrown away after the search,
+    closing the thread's DB connections once it returns.
+    """
+    try:
+        return fn(*args)
+    finally:
+        connections.close_all()
+
+
+def fetch_places_fanout(gmaps, user_lat, user_lng, radius=DEFAULT_RADIUS):
+    """
+    Run every PLACES_SEARCH_KEYWORDS query concurrently and merge results by place_id.
+
+    Each search gets a pool with one thread per keyword, so concurrent
+    searches never queue behind each other's queries.
+    """
+    keywords = search_keywords()
+    if len(keywords) == 1:
+        return fetch_places_nearby(gmaps, user_lat, user_lng, radius, keywords[0])
+
+    with ThreadPoolExecutor(max_workers=len(keywords), thread_name_prefix='places-fetch') as executor:
+        futures = [
+            executor.submit(closing_connections, fetch_places_nearby, gmaps, user_lat, user_lng, radius, keyword)
+            for keyword in keywords
+        ]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append(e)
+    return merge_by_place_id(keywords, outcomes)
+
+
+def unseen_places(page, seen):
+    """Places in page whose place_id is not in seen, adding them to it"""
+    fresh = []
+    for place in page:
+        place_id = place.get('place_id') or id(place)
+        if place_id not in seen:
+            seen.add(place_id)
+            fresh.append(place)
+    return fresh
+
+
+def fetch_places_deep(gmaps, user_lat, user_lng, radius=DEFAULT_RADIUS):
+    """
+    Yield deduplicated pages of a deep search over every PLACES_SEARCH_KEYWORDS query.
+
+    The keywords page through their results side by side on this search's
+    own pool (one thread per keyword); each round yields one page per
+    keyword, in keyword order, without places already yielded.
+    """
+    keywords = search_keywords()
+    if len(keywords) == 1:
+        yield from fetch_places_pages(gmaps, user_lat, user_lng, radius, keywords[0])
+        return
+
+    searches = {keyword: fetch_places_pages(gmaps, user_lat, user_lng, radius, keyword) for keyword in keywords}
+    seen = set()
+    first_round = True
+    with ThreadPoolExecutor(max_workers=len(keywords), thread_name_prefix='places-deep') as executor:
+        try:
+            while searches:
+                futures = {
+                    keyword: executor.submit(closing_connections, next, search, None)
+                    for keyword, search in searches.items()
+                }
+                # Wait for the whole round, so no page fetch is running while the caller holds a page
+                outcomes = []
+                for keyword, future in futures.items():
+                    try:
+                        outcomes.append(future.result())
+                    except Exception as e:
+                        outcomes.append(e)
+                if first_round and all(isinstance(outcome, Exception) for outcome in outcomes):
+                    # Every query failed - surface the first error to the caller
+                    raise outcomes[0]
+                first_round = False
+
+                for keyword, page in zip(list(futures), outcomes):
+                    if isinstance(page, Exception):
+                        print(f"Error fetching places for keyword '{keyword}': {page}")
+                    if page is None or isinstance(page, Exception):
+                        del searches[keyword]
+                        continue
+                    yield unseen_places(page, seen)
+        finally:
+            for search in searches.values():
+                search.close()
+
+
+def fetch_places_pages(gmaps, user_lat, user_lng, radius=DEFAULT_RADIUS, keyword=DEFAULT_KEYWORD):
+    """
+    Yield successive pages of Places results for a deep search.
+
+    While the caller scores page N, page N+1 is already being fetched in the
+    background. Stops at PLACES_DEEP_MAX_PAGES or when the PLACES_DEEP_BUDGET
+    latency budget runs out, keeping what it has.
+    """
+    cache_key = places_cache.make_key(user_lat, user_lng, deep_keyword(keyword), radius)
+    cached = places_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    max_pages = getattr(settings, 'PLACES_DEEP_MAX_PAGES', 3)
+    deadline = time.monotonic() + getattr(settings, 'PLACES_DEEP_BUDGET', 8.0)
+
+    response = gmaps.places_nearby(
+        location=(user_lat, user_lng),
+        radius=radius,
+        keyword=keyword,
+        type='cafe'
+    )
+    all_results = []
+    pages = 1
+    complete = True
+    # One page is prefetched at a time, on this search's own thread
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='places-page')
+    try:
+        while True:
+            token = response.get('next_page_token')
+            future = None
+            if token and pages < max_pages:
+                future = executor.submit(fetch_next_page, gmaps, token, deadline)
+
+            results = response.get('results', [])
+            all_results.extend(results)
+            yield results
+
+            if future is None:
+                break
+            try:
+                response = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                print(f"Deep search budget exhausted after {pages} page(s)")
+                complete = False
+                break
+            except Exception as e:
+                print(f"Error fetching next Places page: {e}")
+                complete = False
+                break
+            pages += 1
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if getattr(settings, 'PLACES_LOCAL_FIRST', True):
+        try:
+            store_places(all_results, [cache_key] if complete else [])
+        except Exception as e:
+            print(f"Error storing places locally: {e}")
+    if complete:
+        places_cache.set(cache_key, all_results)
+
+
+def fetch_next_page(gmaps, token, deadline):
+    """Fetch the page behind a next_page_token, waiting for it to become valid"""
+    delay = getattr(settings, 'PLACES_PAGE_TOKEN_DELAY', 2.0)
+    while True:
+        # Google only accepts a page token a short while after issuing it
+        time.sleep(min(delay, max(0, deadline - time.monotonic())))
+        try:
+            return gmaps.places_nearby(page_token=token)
+        except googlemaps.exceptions.ApiError as e:
+            if e.status != 'INVALID_REQUEST' or time.monotonic() + delay > deadline:
+                raise
+            delay = 0.5
+
+
+async def afetch_places_nearby(user_lat, user_lng, radius=DEFAULT_RADIUS, keyword=DEFAULT_KEYWORD):
+    """Async fetch_places_nearby: geo-cell cache, then one shared in-flight call per key"""
+    key = places_cache.make_key(user_lat, user_lng, keyword, radius)
+    results = places_cache.get(key)
+    if results is not None:
+        return results
+
+    async def fetch():
+        places_result = await aplaces_nearby(
+            location=(user_lat, user_lng),
+            radius=radius,
+            keyword=keyword,
+            type='cafe'
+        )
+        results = places_result.get('results', [])
+        places_cache.set(key, results)
+        if getattr(settings, 'PLACES_LOCAL_FIRST', True):
+            try:
+                await sync_to_async(store_places)(results, [key])
+            except Exception as e:
+                print(f"Error storing places locally: {e}")
+        return results
+
+    return await async_places_flight.do(key, fetch)
+
+
+async def afetch_places_fanout(user_lat, user_lng, radius=DEFAULT_RADIUS):
+    """Async fetch_places_fanout: all keyword queries awaited together"""
+    keywords = search_keywords()
+    outcomes = await asyncio.gather(
+        *(afetch_places_nearby(user_lat, user_lng, radius, keyword) for keyword in keywords),
+        return_exceptions=True
+    )
+    return merge_by_place_id(keywords, outcomes)
+
+
+async def afetch_places_deep(user_lat, user_lng, radius=DEFAULT_RADIUS):
+    """Async fetch_places_deep: every keyword's pages fetched together, then deduplicated"""
+    keywords = search_keywords()
+    outcomes = await asyncio.gather(
+        *(afetch_places_pages(user_lat, user_lng, radius, keyword) for keyword in keywords),
+        return_exceptions=True
+    )
+    if all(isinstance(outcome, Exception) for outcome in outcomes):
+        raise outcomes[0]
+
+    seen = set()
+    pages = []
+    for keyword, keyword_pages in zip(keywords, outcomes):
+        if isinstance(keyword_pages, Exception):
+            print(f"Error fetching places for keyword '{keyword}': {keyword_pages}")
+            continue
+        pages.extend(unseen_places(page, seen) for page in keyword_pages)
+    return pages
+
+
+async def afetch_places_pages(user_lat, user_lng, radius=DEFAULT_RADIUS, keyword=DEFAULT_KEYWORD):
+    """Async fetch_places_pages: follow page tokens within the deep search budget"""
+    cache_key = places_cache.make_key(user_lat, user_lng, deep_keyword(keyword), radius)
+    cached = places_cache.get(cache_key)
+    if cached is not None:
+        return [cached]
+
+    max_pages = getattr(settings, 'PLACES_DEEP_MAX_PAGES', 3)
+    delay = getattr(settings, 'PLACES_PAGE_TOKEN_DELAY', 2.0)
+    deadline = time.monotonic() + getattr(settings, 'PLACES_DEEP_BUDGET', 8.0)
+
+    response = await aplaces_nearby(
+        location=(user_lat, user_lng),
+        radius=radius,
+        keyword=keyword,
+        type='cafe'
+    )
+    pages = [response.get('results', [])]
+    complete = True
+    while response.get('next_page_token') and len(pages) < max_pages:
+        token = response['next_page_token']
+        try:
+            while True:
+                # Google only accepts a page token a short while after issuing it
+                await asyncio.sleep(min(delay, max(0, deadline - time.monotonic())))
+                try:
+                    response = await asyncio.wait_for(
+                        aplaces_nearby(page_token=token),
+                        timeout=max(0.001, deadline - time.monotonic())
+                    )
+                    break
+                except googlemaps.exceptions.ApiError as e:
+                    if e.status != 'INVALID_REQUEST' or time.monotonic() + 0.5 > deadline:
+                        raise
+                    delay = 0.5
+        except Exception as e:
+            print(f"Deep search stopped after {len(pages)} page(s): {e!r}")
+            complete = False
+            break
+        pages.append(response.get('results', []))
+
+    all_results = [place for page in pages for place in page]
+    if getattr(settings, 'PLACES_LOCAL_FIRST', True):
+        try:
+            await sync_to_async(store_places)(all_results, [cache_key] if complete else [])
+        except Exception as e:
+            print(f"Error storing places locally: {e}")
+    if complete:
+        places_cache.set(cache_key, all_results)
+    return pages
+
+
+def mock_candidates(user_lat, user_lng, limit=None):
+    """Mock cafés used when the Google Maps API is not available, best first"""
+    candidates = [
+        PlaceCandidate(
+            place_id='mock-1',
+            name='Zen Matcha House',
+            rating=4.8,
+            price_level=2,
+            vicinity='123 Green St, Sydney NSW',
+            lat=user_lat + 0.001,  # Slightly offset from user location
+            lng=user_lng + 0.001,
+            match_score=95,
+            distance=0.3,
+            photo_urls=[]
+        ),
+        PlaceCandidate(
+            place_id='mock-2',
+            name='Emerald Tea Lounge',
+            rating=4.6,
+            price_level=3,
+            vicinity='456 Matcha Ave, Sydney NSW',
+            lat=user_lat - 0.001,
+            lng=user_lng - 0.001,
+            match_score=88,
+            distance=0.7,
+            photo_urls=[]
+        ),
+        PlaceCandidate(
+            place_id='mock-3',
+            name='Green Leaf Cafe',
+            rating=4.4,
+            price_level=1,
+            vicinity='789 Tea Rd, Sydney NSW',
+            lat=user_lat + 0.002,
+            lng=user_lng - 0.002,
+            match_score=82,
+            distance=1.2,
+            photo_urls=[]
+        )
+    ]
+    return candidates[:limit]
+
+
+def format_price_range(price_level):
+    """Convert price level to dollar signs"""
+    if price_level is None:
+        return "Price not available"
+
+    price_map = {
+        0: "Free",
+        1: "$",
+        2: "$$",
+        3: "$$$",
+        4: "$$$$"
+    }
+
+    return price_map.get(price_level, "Price not available")
+
+
+def get_photo_urls(photos):
+    """Extract photo URLs from place photos using photo_reference"""
+    if not photos:
+        # Return a fallback placeholder image when no photos are available
+        return [PLACEHOLDER_PHOTO_URL]
+
+    api_key = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
+    photo_urls = []
+    for photo in photos[:3]:  # Limit to first 3 photos
+        photo_reference = photo.get('photo_reference')
+
+        if photo_reference:
+            if api_key and api_key != "demo-key":
+                photo_urls.append(
+                    f"https://maps.googleapis.com/maps/api/place/photo?maxwidth=400&photoreference={photo_reference}&key={api_key}"
+                )
+            else:
+                print("Warning: No valid Google Maps API key found for photos")
+                # Add fallback placeholder when no API key
+                photo_urls.append(PLACEHOLDER_PHOTO_URL)
+
+    # If we still have no photos after processing, add a fallback
+    if not photo_urls:
+        photo_urls.append(PLACEHOLDER_PHOTO_URL)
+
+    return photo_urls
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """An in-flight call that other callers with the same key can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is running block until it finishes and receive the same result (or the
+    same exception). Nothing is remembered once the call completes.
+    """
+
+    def __init__(self):
+        self.executions = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls),
+            }
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: concurrent awaits of a key share one task"""
+
+    def __init__(self):
+        self.executions = 0
+        self.coalesced = 0
+        self._tasks = {}
+
+    async def do(self, key, coro_fn):
+        # Tasks belong to one event loop, so keep them per running loop
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get((loop, key))
+        if task is None:
+            self.executions += 1
+            task = loop.create_task(coro_fn())
+            self._tasks[(loop, key)] = task
+            task.add_done_callback(lambda _: self._tasks.pop((loop, key), None))
+        else:
+            self.coalesced += 1
+        # shield() so one cancelled caller does not cancel the shared call
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._tasks),
+        }
+
+
+places_flight = SingleFlight()
+async_places_flight = AsyncSingleFlight()
@@ -1,3 +1,899 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import product
+from unittest import mock
 
-# Create your tests here.
+import googlemaps
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .client import aplaces_nearby, get_gmaps_client, reset_gmaps_client
+from .gazetteer import SYDNEY_LOCATIONS, Gazetteer, build_gazetteer, find_location
+from .keywords import PLACE_NAME_FEATURES, KeywordMatcher, place_name_matcher
+from .local import find_covered_places, is_covered, store_places
+from .models import SearchArea
+from .scoring import score_places
+from . import views as places_views
+from .cache import GeoCache, places_cache
+from .services import (
+    build_user_context, deep_keyword, fetch_places_deep, fetch_places_fanout, fetch_places_pages, search_keywords,
+    search_places
+)
+from .singleflight import AsyncSingleFlight, SingleFlight
+
+SYDNEY = (-33.8688, 151.2093)
+
+
+def place_result(place_id, lat, lng, **fields):
+    """A raw Google Places result"""
+    return dict({
+        'place_id': place_id,
+        'name': f'Cafe {place_id}',
+        'geometry': {'location': {'lat': lat, 'lng': lng}},
+    }, **fields)
+
+
+class SearchCoverageTests(TestCase):
+    """Local-first lookups answer only for geo-cells Google was already asked about"""
+
+    def search_key(self, keyword='matcha', radius=5000, location=SYDNEY):
+        return ((round(location[0], 3), round(location[1], 3)), keyword, radius)
+
+    def test_rows_without_coverage_are_not_used(self):
+        # Stored by a search somewhere else, but inside this radius
+        store_places([place_result('a', SYDNEY[0] + 0.001, SYDNEY[1])])
+        self.assertIsNone(find_covered_places(*SYDNEY, 5000, ['matcha'], max_age=60))
+
+    def test_covered_cell_is_answered_locally(self):
+        store_places([place_result('a', SYDNEY[0] + 0.001, SYDNEY[1])], [self.search_key()])
+        places = find_covered_places(*SYDNEY, 5000, ['Matcha '], max_age=60)
+        self.assertEqual([place['place_id'] for place in places], ['a'])
+
+    def test_empty_search_still_covers_the_cell(self):
+        store_places([], [self.search_key()])
+        self.assertEqual(find_covered_places(*SYDNEY, 5000, ['matcha'], max_age=60), [])
+
+    def test_coverage_needs_every_keyword_and_the_radius(self):
+        store_places([place_result('a', *SYDNEY)], [self.search_key(radius=2000)])
+        self.assertIsNone(find_covered_places(*SYDNEY, 5000, ['matcha'], max_age=60))
+        self.assertIsNotNone(find_covered_places(*SYDNEY, 1000, ['matcha'], max_age=60))
+        self.assertIsNone(find_covered_places(*SYDNEY, 1000, ['matcha', 'tea'], max_age=60))
+
+    def test_no_keywords_is_never_covered(self):
+        store_places([place_result('a', *SYDNEY)], [self.search_key()])
+        self.assertFalse(is_covered(*SYDNEY, [], 5000, max_age=60))
+        self.assertIsNone(find_covered_places(*SYDNEY, 5000, [], max_age=60))
+
+    def test_neighbouring_cell_is_not_covered(self):
+        store_places([place_result('a', *SYDNEY)], [self.search_key()])
+        self.assertIsNone(find_covered_places(SYDNEY[0] + 0.01, SYDNEY[1], 5000, ['matcha'], max_age=60))
+
+    def test_stale_coverage_is_ignored(self):
+        store_places([place_result('a', *SYDNEY)], [self.search_key()])
+        SearchArea.objects.update(searched_at=timezone.now() - timedelta(hours=2))
+        self.assertIsNone(find_covered_places(*SYDNEY, 5000, ['matcha'], max_age=3600))
+
+    def test_repeated_search_refreshes_coverage(self):
+        store_places([], [self.search_key()])
+        SearchArea.objects.update(searched_at=timezone.now() - timedelta(hours=2))
+        store_places([], [self.search_key()])
+        self.assertEqual(SearchArea.objects.count(), 1)
+        self.assertEqual(find_covered_places(*SYDNEY, 5000, ['matcha'], max_age=3600), [])
+
+    def test_price_level_round_trips_unchanged(self):
+        store_places([
+            place_result('cheap', *SYDNEY, price_level=0),
+            place_result('luxury', *SYDNEY, price_level=4),
+            place_result('unknown', *SYDNEY),
+        ], [self.search_key()])
+        places = {place['place_id']: place for place in find_covered_places(*SYDNEY, 5000, ['matcha'], max_age=60)}
+        self.assertEqual(places['cheap']['price_level'], 0)
+        self.assertEqual(places['luxury']['price_level'], 4)
+        self.assertNotIn('price_level', places['unknown'])
+
+
+def reference_match_score(place, user_lat, user_lng, user_context=None):
+    """
+    The baseline PlacesView.calculate_match_score, copied word for word, as
+    the oracle places.scoring.score_places must agree with.
+
+    Advanced match scoring that considers multiple factors for intelligent recommendations
+    """
+    score = 0
+    user_context = user_context or {}
+
+    # Base score from rating (0-30 points)
+    rating = place.get('rating', 0)
+    if rating > 0:
+        # Exponential rating boost - 4.5+ gets much higher scores
+        if rating >= 4.8:
+            score += 30
+        elif rating >= 4.5:
+            score += 25
+        elif rating >= 4.0:
+            score += 20
+        elif rating >= 3.5:
+            score += 15
+        else:
+            score += 10
+
+    # Sentiment-based scoring (0-25 points)
+    sentiment = user_context.get('sentiment', 'neutral')
+    place_name = place.get('name', '').lower()
+    place_types = place.get('types', [])
+
+    if sentiment in ['stressed', 'tired', 'calm']:
+        # Quiet, peaceful places for stressed users
+        quiet_keywords = ['zen', 'quiet', 'peaceful', 'calm', 'serene', 'tranquil']
+        if any(keyword in place_name for keyword in quiet_keywords):
+            score += 20
+        if 'park' in place_types or 'garden' in place_types:
+            score += 15
+        if place.get('rating', 0) >= 4.5:  # High-rated peaceful places
+            score += 10
+
+    elif sentiment in ['excited', 'happy', 'social']:
+        # Lively, social places for excited users
+        social_keywords = ['social', 'bar', 'rooftop', 'trendy', 'vibrant', 'lively']
+        if any(keyword in place_name for keyword in social_keywords):
+            score += 20
+        if 'bar' in place_types or 'nightclub' in place_types:
+            score += 15
+        if place.get('price_level', 2) in [2, 3]:  # Social price range
+            score += 10
+
+    elif sentiment in ['focused', 'study', 'work']:
+        # Quiet, focused places for work/study
+        work_keywords = ['study', 'work', 'focus', 'quiet', 'concentration', 'library']
+        if any(keyword in place_name for keyword in work_keywords):
+            score += 20
+        if 'library' in place_types or 'cafe' in place_types:
+            score += 15
+        if place.get('wifi', False):  # Assuming wifi availability
+            score += 10
+
+    # Time-based scoring (0-20 points)
+    current_hour = user_context.get('hour', 12)  # Default to noon
+    if 6 <= current_hour <= 11:  # Morning (6 AM - 11 AM)
+        if 'breakfast' in place_types or 'coffee' in place_types:
+            score += 20
+        if 'bakery' in place_types:
+            score += 15
+    elif 11 <= current_hour <= 16:  # Lunch (11 AM - 4 PM)
+        if 'restaurant' in place_types or 'cafe' in place_types:
+            score += 20
+        if 'lunch' in place_types:
+            score += 15
+    elif 16 <= current_hour <= 21:  # Afternoon/Evening (4 PM - 9 PM)
+        if 'dinner' in place_types or 'bar' in place_types:
+            score += 20
+        if 'rooftop' in place_types:
+            score += 15
+    elif 21 <= current_hour or current_hour <= 2:  # Night (9 PM - 2 AM)
+        if 'bar' in place_types or 'nightclub' in place_types:
+            score += 20
+        if 'late_night' in place_types:
+            score += 15
+
+    # User preference matching (0-20 points)
+    user_preferences = user_context.get('preferences', {})
+
+    # Budget preferences
+    budget = user_preferences.get('budget', 'medium')
+    price_level = place.get('price_level', 2)
+    if budget == 'low' and price_level <= 1:
+        score += 20
+    elif budget == 'medium' and price_level in [1, 2]:
+        score += 20
+    elif budget == 'high' and price_level >= 3:
+        score += 20
+
+    # Atmosphere preferences
+    vibe = user_preferences.get('vibe', 'any')
+    if vibe == 'cozy' and any(word in place_name for word in ['cozy', 'warm', 'intimate']):
+        score += 20
+    elif vibe == 'trendy' and any(word in place_name for word in ['trendy', 'modern', 'hip']):
+        score += 20
+    elif vibe == 'quiet' and any(word in place_name for word in ['quiet', 'peaceful', 'serene']):
+        score += 20
+
+    # Special needs
+    special_needs = user_preferences.get('special_needs', [])
+    if 'wifi' in special_needs and place.get('wifi', False):
+        score += 15
+    if 'outdoor_seating' in special_needs and 'outdoor_seating' in place_types:
+        score += 15
+    if 'accessible' in special_needs and 'wheelchair_accessible' in place_types:
+        score += 15
+
+    # Matcha-specific scoring (0-15 points)
+    matcha_keywords = ['matcha', 'green tea', 'tea house', 'tea room', 'japanese', 'asian']
+    matcha_score = 0
+    for keyword in matcha_keywords:
+        if keyword in place_name.lower():
+            matcha_score += 5
+            break
+    if 'matcha' in place_name.lower():
+        matcha_score += 10  # Bonus for explicit matcha mention
+    score += min(15, matcha_score)
+
+    # Distance factor (0-15 points, closer is better)
+    try:
+        # Handle different possible data structures
+        if 'geometry' in place and 'location' in place['geometry']:
+            place_lat = place['geometry']['location']['lat']
+            place_lng = place['geometry']['location']['lng']
+        elif 'lat' in place and 'lng' in place:
+            place_lat = place['lat']
+            place_lng = place['lng']
+        else:
+            place_lat = user_lat
+            place_lng = user_lng
+
+        distance = reference_distance(user_lat, user_lng, place_lat, place_lng)
+    except Exception as e:
+        print(f"Error calculating distance: {e}")
+        distance = 5.0  # Default distance
+
+    # Smart distance scoring based on context
+    if distance <= 0.5:  # Within 0.5 miles - very convenient
+        score += 15
+    elif distance <= 1.0:  # Within 1 mile - convenient
+        score += 12
+    elif distance <= 2.0:  # Within 2 miles - acceptable
+        score += 8
+    elif distance <= 3.0:  # Within 3 miles - okay for special places
+        score += 5
+    else:  # Beyond 3 miles - only for exceptional places
+        score += 2
+
+    # Special occasion bonuses (0-10 points)
+    special_occasion = user_context.get('special_occasion', 'none')
+    if special_occasion == 'date' and 'romantic' in place_types:
+        score += 10
+    elif special_occasion == 'birthday' and 'celebration' in place_types:
+        score += 10
+    elif special_occasion == 'meeting' and 'quiet' in place_types:
+        score += 10
+
+    # Weather consideration (0-5 points)
+    weather = user_context.get('weather', 'sunny')
+    if weather == 'rainy' and 'indoor' in place_types:
+        score += 5
+    elif weather == 'sunny' and 'outdoor_seating' in place_types:
+        score += 5
+
+    # Ensure score is within 0-200 range and return as integer
+    return min(200, max(0, int(score)))
+
+
+def reference_distance(lat1, lng1, lat2, lng2):
+    """Calculate distance between two points in miles"""
+    from math import radians, sin, cos, sqrt, atan2
+
+    R = 3959  # Earth's radius in miles
+
+    lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlng/2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1-a))
+    distance = R * c
+
+    return round(distance, 1)
+
+
+SCORING_PLACES = [
+    place_result('zen', SYDNEY[0] + 0.002, SYDNEY[1], name='Zen Matcha Tea House', rating=4.9,
+                 price_level=1, types=['cafe', 'garden', 'outdoor_seating']),
+    place_result('bar', SYDNEY[0] - 0.02, SYDNEY[1] + 0.01, name='Rooftop Social Bar', rating=4.5,
+                 price_level=3, types=['bar', 'nightclub', 'rooftop', 'romantic']),
+    place_result('study', SYDNEY[0] + 0.01, SYDNEY[1] - 0.01, name='Quiet Study Library Cafe', rating=4.0,
+                 price_level=2, wifi=True, types=['library', 'cafe', 'indoor', 'wheelchair_accessible']),
+    place_result('bakery', SYDNEY[0] + 0.04, SYDNEY[1] + 0.04, name='Cozy Warm Bakery', rating=3.6,
+                 price_level=4, types=['bakery', 'breakfast', 'coffee', 'celebration']),
+    place_result('plain', SYDNEY[0] - 0.1, SYDNEY[1], name='Corner Store', rating=0,
+                 types=['restaurant', 'lunch', 'late_night', 'quiet']),
+    place_result('trendy', SYDNEY[0], SYDNEY[1] + 0.006, name='Hip Modern Japanese Green Tea', rating=3.2,
+                 price_level=0, types=['dinner']),
+    {'place_id': 'flat', 'name': 'Serene Matcha', 'rating': 4.6, 'lat': SYDNEY[0] + 0.01, 'lng': SYDNEY[1]},
+    {'place_id': 'nowhere', 'name': 'Peaceful Matcha', 'rating': 4.2, 'price_level': 2},
+]
+
+
+class ScoringEquivalenceTests(SimpleTestCase):
+    """The vectorised scorer must give the same scores and distances as the per-place one"""
+
+    def assertScoresMatch(self, user_context):
+        scores, distances = score_places(SCORING_PLACES, *SYDNEY, user_context)
+        expected_scores = [reference_match_score(place, *SYDNEY, user_context) for place in SCORING_PLACES]
+        self.assertEqual(scores.tolist(), expected_scores, user_context)
+        for place, distance in zip(SCORING_PLACES, distances.tolist()):
+            location = place.get('geometry', {}).get('location') or place
+            self.assertEqual(
+                distance, reference_distance(*SYDNEY, location.get('lat', SYDNEY[0]), location.get('lng', SYDNEY[1]))
+            )
+
+    def test_sentiments_and_hours(self):
+        for sentiment, hour in product(
+            ['neutral', 'stressed', 'tired', 'calm', 'excited', 'happy', 'social', 'focused', 'study', 'work'],
+            [1, 3, 6, 11, 12, 16, 20, 21, 23],
+        ):
+            with self.subTest(sentiment=sentiment, hour=hour):
+                self.assertScoresMatch(build_user_context(sentiment=sentiment, hour=hour))
+
+    def test_preferences_and_occasions(self):
+        for budget, vibe, special_needs, occasion, weather in product(
+            ['low', 'medium', 'high'],
+            ['any', 'cozy', 'trendy', 'quiet'],
+            [[], ['wifi', 'outdoor_seating', 'accessible']],
+            ['none', 'date', 'birthday', 'meeting'],
+            ['sunny', 'rainy'],
+        ):
+            with self.subTest(budget=budget, vibe=vibe, special_needs=special_needs, occasion=occasion, weather=weather):
+                self.assertScoresMatch(build_user_context(
+                    budget=budget, vibe=vibe, special_needs=special_needs,
+                    special_occasion=occasion, weather=weather, hour=12
+                ))
+
+    def test_empty_context(self):
+        self.assertScoresMatch({})
+        self.assertScoresMatch(None)
+
+
+def reference_tags(name, features=PLACE_NAME_FEATURES):
+    """Tags the way the original per-tag any(keyword in name) checks assign them"""
+    lowered = name.lower()
+    return frozenset(tag for tag, keywords in features.items() if any(keyword in lowered for keyword in keywords))
+
+
+# Overlapping, nested and case-varied names
+KEYWORD_NAMES = [
+    '', 'Plain Bakery', 'Zen', 'ZENITH Roasters', 'Citizen Cafe', 'Green Tea House', 'The Tea Room',
+    'Tea Rooms & Tea Houses', 'tea', 'Matcha', 'MATCHA bar', 'Calmatcha', 'Barista Lab', 'Library Lounge',
+    'Networking Hub', 'Homework Cafe', 'Quietude', 'Serene Peaceful Calm', 'Warmth', 'HipSter Spot',
+    'Asiana Japanese Kitchen', 'Rooftop Social', 'Trendy Modern Bar', 'Cozy Intimate Corner', 'Focused Study',
+    'Concentration Camp Coffee', 'Tranquil Lively Vibrant', 'greenteahouse', 'Zen-Matcha', 'Café Matchá',
+]
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    """The single-pass matcher must tag names exactly like per-keyword substring checks"""
+
+    def test_table_matches_substring_semantics(self):
+        for name in KEYWORD_NAMES:
+            for variant in (name, name.upper(), name.lower(), name.swapcase()):
+                with self.subTest(name=variant):
+                    self.assertEqual(place_name_matcher.match(variant), reference_tags(variant))
+
+    def test_every_pair_of_keywords(self):
+        keywords = sorted({keyword for group in PLACE_NAME_FEATURES.values() for keyword in group})
+        for first, second in product(keywords, repeat=2):
+            for name in (first + second, f'{first} {second}', (first + second).title()):
+                with self.subTest(name=name):
+                    self.assertEqual(place_name_matcher.match(name), reference_tags(name))
+
+    def test_nested_keywords_keep_their_own_tags(self):
+        self.assertEqual(place_name_matcher.match('Networking Hub'), frozenset({'work', 'chat_study'}))
+        self.assertEqual(place_name_matcher.match('Citizen'), frozenset({'quiet', 'chat_calm'}))
+        # "tea" is found inside the longer "tea house" match at the same position
+        matcher = KeywordMatcher({'short': ('tea',), 'long': ('tea house',), 'zen': ('zen',)})
+        self.assertEqual(matcher.match('Zen Tea House'), frozenset({'short', 'long', 'zen'}))
+        self.assertEqual(matcher.match('Tea Shop'), frozenset({'short'}))
+        self.assertEqual(matcher.match('Citizens'), frozenset({'zen'}))
+
+
+class GazetteerTests(SimpleTestCase):
+    def setUp(self):
+        self.gazetteer = Gazetteer()
+        self.gazetteer.add('York', 1, 1)
+        self.gazetteer.add('New York', 2, 2, aliases=['NYC', 'the big apple'])
+        self.gazetteer.add('New York Mills', 3, 3)
+        self.gazetteer.add('Glebe', 4, 4)
+
+    def test_longest_match_wins(self):
+        cases = {
+            'coffee in new york please': 'new york',
+            'new york mills matcha': 'new york mills',
+            'old york tea rooms': 'york',
+            'a new cafe in york': 'york',
+            'new mills': None,
+        }
+        for text, name in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(self.gazetteer.find(text), name)
+
+    def test_aliases_resolve_to_the_canonical_place(self):
+        self.assertEqual(self.gazetteer.find('matcha in NYC'), 'new york')
+        self.assertEqual(self.gazetteer.lookup('somewhere in the Big Apple'), (2, 2))
+        self.assertEqual(find_location('cafes near darling harbor'), SYDNEY_LOCATIONS['darling harbour'])
+        self.assertEqual(find_location('anything in the CBD?'), SYDNEY_LOCATIONS['sydney cbd'])
+
+    def test_punctuation_and_case_are_ignored(self):
+        for text in ('NEW YORK!', 'New-York, today', '(new york)', 'new   york...'):
+            with self.subTest(text=text):
+                self.assertEqual(self.gazetteer.find(text), 'new york')
+        self.assertEqual(find_location('Surry Hills, please.'), SYDNEY_LOCATIONS['surry hills'])
+        self.assertEqual(find_location('BONDI-JUNCTION?'), SYDNEY_LOCATIONS['bondi junction'])
+
+    def test_fuzzy_fallback_threshold(self):
+        # "glebr" is 0.8 similar to "glebe", "glxbr" only 0.6
+        self.assertEqual(self.gazetteer.fuzzy_find('glebr'), 'glebe')
+        self.assertIsNone(self.gazetteer.fuzzy_find('glebr', cutoff=0.9))
+        self.assertIsNone(self.gazetteer.fuzzy_find('glxbr'))
+        self.assertEqual(self.gazetteer.lookup('somewhere near glebr'), (4, 4))
+        self.assertIsNone(self.gazetteer.lookup('somewhere near glxbr'))
+        # Misspellings are only tried after "near" or "close to"
+        self.assertIsNone(self.gazetteer.lookup('glebr'))
+        self.assertEqual(find_location('close to newtwn'), SYDNEY_LOCATIONS['newtown'])
+
+    def test_csv_places_and_aliases_are_loaded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'places.csv')
+            with open(path, 'w', newline='', encoding='utf-8') as handle:
+                handle.write('name,lat,lng,aliases\nParramatta,-33.8150,151.0011,Parra|PARRAMATTA CBD\nBad,x,y,\n')
+            gazetteer = build_gazetteer(path)
+        self.assertEqual(gazetteer.lookup('matcha in parra'), (-33.8150, 151.0011))
+        self.assertEqual(gazetteer.find('Parramatta CBD'), 'parramatta')
+        self.assertIsNone(gazetteer.find('bad'))
+        self.assertEqual(len(gazetteer), len(SYDNEY_LOCATIONS) + 1)
+
+
+class GeoCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.cache = GeoCache(precision=3, ttl=60, max_entries=2, clock=lambda: self.now)
+
+    def test_entries_expire_after_ttl(self):
+        key = self.cache.make_key(*SYDNEY, 'matcha', 5000)
+        self.cache.set(key, ['a'])
+        self.now += 59.9
+        self.assertEqual(self.cache.get(key), ['a'])
+        self.now += 0.1
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_least_recently_used_entry_is_evicted_past_max_entries(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.stats()['size'], 2)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual((self.cache.get('a'), self.cache.get('c')), (1, 3))
+
+    def test_locations_snap_to_the_precision_grid(self):
+        key = self.cache.make_key(-33.86884, 151.20926, ' Matcha ', 5000.0)
+        self.assertEqual(key, ((-33.869, 151.209), 'matcha', 5000))
+        self.assertEqual(self.cache.make_key(-33.8686, 151.2094, 'matcha', 5000), key)
+        self.assertNotEqual(self.cache.make_key(-33.8696, 151.2094, 'matcha', 5000), key)
+        coarse = GeoCache(precision=2)
+        self.assertEqual(coarse.snap('-33.8688', '151.2093'), (-33.87, 151.21))
+
+    def test_get_or_fetch_counts_hits_and_misses(self):
+        fetch = mock.Mock(return_value=['a'])
+        for lat in (SYDNEY[0], SYDNEY[0] + 0.0001, SYDNEY[0] + 0.01):
+            self.assertEqual(self.cache.get_or_fetch(lat, SYDNEY[1], 'matcha', 5000, fetch), ['a'])
+        self.assertEqual(fetch.call_count, 2)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 2, 0.333))
+
+    def test_stats_endpoint_reports_the_counters(self):
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        self.cache.get('b')
+        with mock.patch.object(places_views, 'places_cache', self.cache):
+            stats = self.client.get('/api/places/stats/').json()['cache']
+        self.assertEqual(
+            stats, {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'size': 1, 'max_entries': 2, 'ttl': 60, 'precision': 3}
+        )
+
+
+class StubPlacesHandler(BaseHTTPRequestHandler):
+    """Nearby search endpoint that answers with the server's queued (status, delay) replies, then OK"""
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse shows up as one client port
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.client_address[1], self.path))
+            status, delay = server.replies.pop(0) if server.replies else (200, 0)
+        time.sleep(delay)
+        body = json.dumps({'status': 'OK', 'results': [place_result('stub', *SYDNEY)]}).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting (read timeout tests)
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SharedClientTests(SimpleTestCase):
+    """The shared Google Maps clients reuse one connection pool and apply the configured timeouts and retries"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubPlacesHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.replies = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        settings_override = override_settings(
+            GOOGLE_MAPS_API_KEY='AIzaStubKey',
+            GOOGLE_MAPS_BASE_URL=f'http://127.0.0.1:{self.server.server_port}',
+            GOOGLE_MAPS_POOL_SIZE=4,
+            GOOGLE_MAPS_CONNECT_TIMEOUT=1,
+            GOOGLE_MAPS_READ_TIMEOUT=0.5,
+            GOOGLE_MAPS_RETRY_TIMEOUT=1,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_gmaps_client()
+        self.addCleanup(reset_gmaps_client)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def search(self):
+        return get_gmaps_client().places_nearby(location=SYDNEY, radius=500, keyword='matcha', type='cafe')
+
+    def test_one_client_and_connection_across_requests(self):
+        client = get_gmaps_client()
+        for _ in range(3):
+            self.assertEqual(self.search()['results'][0]['place_id'], 'stub')
+        self.assertIs(get_gmaps_client(), client)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertTrue(all(path.startswith('/maps/api/place/nearbysearch/json?') for _, path in self.server.requests))
+        self.assertEqual(len({port for port, _ in self.server.requests}), 1, "requests did not share a connection")
+        self.assertEqual(client.session.get_adapter(client.base_url)._pool_maxsize, 4)
+
+    def test_timeouts_are_applied(self):
+        client = get_gmaps_client()
+        self.assertEqual(client.timeout, (1, 0.5))
+        self.assertEqual(client.retry_timeout, timedelta(seconds=1))
+
+        self.server.replies = [(200, 1.0)]
+        with self.assertRaises(googlemaps.exceptions.Timeout):
+            self.search()
+
+    def test_server_errors_are_retried(self):
+        self.server.replies = [(500, 0), (503, 0)]
+        self.assertEqual(self.search()['status'], 'OK')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retries_stop_at_the_retry_timeout(self):
+        self.server.replies = [(500, 0)] * 100
+        start = time.monotonic()
+        with self.assertRaises(googlemaps.exceptions.Timeout):
+            self.search()
+        self.assertLess(time.monotonic() - start, 3)
+
+    def test_async_client_is_reused_within_a_loop(self):
+        async def search_twice():
+            return [
+                await aplaces_nearby(location=SYDNEY, radius=500, keyword='matcha', type='cafe')
+                for _ in range(2)
+            ]
+
+        responses = asyncio.run(search_twice())
+        self.assertEqual([response['status'] for response in responses], ['OK', 'OK'])
+        self.assertEqual(len({port for port, _ in self.server.requests}), 1, "requests did not share a connection")
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Concurrent calls for one key share a single execution, its result and its error"""
+
+    def run_callers(self, flight, fn, callers=5):
+        """Call flight.do from several threads, releasing the leader once the rest are waiting"""
+        release = threading.Event()
+        outcomes = [None] * callers
+
+        def leader_fn():
+            release.wait(5)
+            return fn()
+
+        def caller(index):
+            try:
+                outcomes[index] = flight.do('key', leader_fn)
+            except Exception as e:
+                outcomes[index] = e
+
+        threads = [threading.Thread(target=caller, args=(index,)) for index in range(callers)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while flight.stats()['coalesced'] < callers - 1 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+        outcomes = self.run_callers(flight, lambda: calls.append(1) or {'results': []})
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(outcome is outcomes[0] for outcome in outcomes))
+        self.assertEqual(flight.stats(), {'executions': 1, 'coalesced': 4, 'in_flight': 0})
+
+    def test_concurrent_callers_share_one_error(self):
+        flight = SingleFlight()
+        error = googlemaps.exceptions.ApiError('OVER_QUERY_LIMIT')
+
+        def fail():
+            raise error
+
+        outcomes = self.run_callers(flight, fail)
+        self.assertTrue(all(outcome is error for outcome in outcomes))
+        self.assertEqual(flight.stats()['executions'], 1)
+
+    def test_finished_calls_are_not_remembered(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+        self.assertEqual(flight.do('key', lambda: 2), 2)
+        with self.assertRaises(ValueError):
+            flight.do('key', lambda: int('x'))
+        self.assertEqual(flight.do('key', lambda: 3), 3)
+        self.assertEqual(flight.stats(), {'executions': 4, 'coalesced': 0, 'in_flight': 0})
+
+    def test_async_callers_share_one_call_and_error(self):
+        flight = AsyncSingleFlight()
+        calls = []
+        error = googlemaps.exceptions.ApiError('OVER_QUERY_LIMIT')
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {'results': []}
+
+        async def fail():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise error
+
+        async def main():
+            results = await asyncio.gather(*(flight.do('ok', fetch) for _ in range(5)))
+            errors = await asyncio.gather(*(flight.do('bad', fail) for _ in range(5)), return_exceptions=True)
+            return results, errors
+
+        results, errors = asyncio.run(main())
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertTrue(all(outcome is error for outcome in errors))
+        self.assertEqual(flight.stats(), {'executions': 2, 'coalesced': 8, 'in_flight': 0})
+
+    def test_cancelled_async_caller_does_not_cancel_the_call(self):
+        flight = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return 'done'
+
+        async def main():
+            first = asyncio.ensure_future(flight.do('key', fetch))
+            second = asyncio.ensure_future(flight.do('key', fetch))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(main()), 'done')
+
+
+@override_settings(GOOGLE_MAPS_API_KEY='demo-key')
+class PlacesLimitTests(TestCase):
+    """?limit applies to the mock cafés too, whether served for a missing key or after an error"""
+
+    def test_limit_without_an_api_key(self):
+        self.assertEqual(len(search_places(limit=2)), 2)
+        self.assertEqual(len(self.client.get('/api/places/', {'limit': 1}).json()), 1)
+        self.assertEqual(len(search_places()), 3)
+
+    def test_limit_after_a_google_error(self):
+        with mock.patch('places.services.fetch_place_pages', side_effect=RuntimeError('quota')):
+            self.assertEqual([place.place_id for place in search_places(limit=2)], ['mock-1', 'mock-2'])
+
+
+class FakePlacesClient:
+    """googlemaps.Client stand-in: each keyword maps to its results, or an exception to raise"""
+
+    def __init__(self, results_by_keyword, delay=0):
+        self.results_by_keyword = results_by_keyword
+        self.delay = delay
+        self.keywords = []
+        self.lock = threading.Lock()
+
+    def places_nearby(self, location=None, radius=None, keyword=None, type=None, page_token=None):
+        with self.lock:
+            self.keywords.append(keyword)
+        time.sleep(self.delay)
+        results = self.results_by_keyword[keyword]
+        if isinstance(results, Exception):
+            raise results
+        return {'status': 'OK', 'results': results}
+
+
+@override_settings(PLACES_LOCAL_FIRST=False)
+class KeywordFanoutTests(SimpleTestCase):
+    """Multi-keyword searches run concurrently and merge their results by place_id"""
+
+    def setUp(self):
+        places_cache.clear()
+        self.addCleanup(places_cache.clear)
+
+    def test_default_is_the_single_legacy_keyword(self):
+        with override_settings(PLACES_SEARCH_KEYWORDS=None):
+            self.assertEqual(search_keywords(), ['matcha cafe tea'])
+
+    @override_settings(PLACES_SEARCH_KEYWORDS=['matcha', 'tea house', 'japanese cafe'])
+    def test_results_are_merged_by_place_id(self):
+        gmaps = FakePlacesClient({
+            'matcha': [place_result('a', *SYDNEY), place_result('b', *SYDNEY)],
+            'tea house': [place_result('b', *SYDNEY, name='Duplicate'), place_result('c', *SYDNEY)],
+            'japanese cafe': [place_result('a', *SYDNEY), place_result('d', *SYDNEY)],
+        }, delay=0.2)
+        start = time.monotonic()
+        results = fetch_places_fanout(gmaps, *SYDNEY)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual([place['place_id'] for place in results], ['a', 'b', 'c', 'd'])
+        self.assertEqual(results[1]['name'], 'Cafe b')  # first keyword wins
+        self.assertEqual(sorted(gmaps.keywords), ['japanese cafe', 'matcha', 'tea house'])
+        self.assertLess(elapsed, 0.5, "keyword queries ran one after another")
+
+    @override_settings(PLACES_SEARCH_KEYWORDS=['matcha', 'tea house', 'japanese cafe'])
+    def test_failing_keyword_does_not_drop_the_others(self):
+        gmaps = FakePlacesClient({
+            'matcha': [place_result('a', *SYDNEY)],
+            'tea house': googlemaps.exceptions.ApiError('OVER_QUERY_LIMIT'),
+            'japanese cafe': [place_result('d', *SYDNEY)],
+        })
+        results = fetch_places_fanout(gmaps, *SYDNEY)
+        self.assertEqual([place['place_id'] for place in results], ['a', 'd'])
+
+    @override_settings(PLACES_SEARCH_KEYWORDS=['matcha', 'tea house'])
+    def test_keyword_threads_close_their_connections(self):
+        gmaps = FakePlacesClient({'matcha': [place_result('a', *SYDNEY)], 'tea house': googlemaps.exceptions.ApiError('OVER_QUERY_LIMIT')})
+        closed = []
+        with mock.patch('places.services.connections') as connections:
+            connections.close_all.side_effect = lambda: closed.append(threading.current_thread().name)
+            fetch_places_fanout(gmaps, *SYDNEY)
+        self.assertEqual(len(closed), 2)
+        self.assertTrue(all(name.startswith('places-fetch') for name in closed))
+
+    @override_settings(PLACES_SEARCH_KEYWORDS=['matcha', 'tea house'])
+    def test_every_keyword_failing_raises(self):
+        error = googlemaps.exceptions.ApiError('REQUEST_DENIED')
+        gmaps = FakePlacesClient({'matcha': error, 'tea house': googlemaps.exceptions.ApiError('REQUEST_DENIED')})
+        with self.assertRaises(googlemaps.exceptions.ApiError) as raised:
+            fetch_places_fanout(gmaps, *SYDNEY)
+        self.assertIs(raised.exception, error)
+
+
+class FakePagingClient:
+    """
+    googlemaps.Client stand-in serving pages pages per keyword, linked by
+    next_page_token. A token is rejected as INVALID_REQUEST its first
+    not_ready times, like a token Google has not activated yet.
+    """
+
+    def __init__(self, pages=3, page_delay=0, not_ready=0):
+        self.pages = pages
+        self.page_delay = page_delay
+        self.not_ready = not_ready
+        self.calls = []
+        self.rejected = {}
+        self.lock = threading.Lock()
+
+    def page(self, keyword, number):
+        response = {
+            'status': 'OK',
+            'results': [place_result(f'{keyword}-{number}-{i}', *SYDNEY) for i in range(2)]
+            + [place_result(f'shared-{number}', *SYDNEY)],
+        }
+        if number + 1 < self.pages:
+            response['next_page_token'] = f'{keyword}|{number + 1}'
+        return response
+
+    def places_nearby(self, location=None, radius=None, keyword=None, type=None, page_token=None):
+        with self.lock:
+            self.calls.append((time.monotonic(), page_token))
+            if page_token and self.rejected.get(page_token, 0) < self.not_ready:
+                self.rejected[page_token] = self.rejected.get(page_token, 0) + 1
+                raise googlemaps.exceptions.ApiError('INVALID_REQUEST')
+        if not page_token:
+            return self.page(keyword, 0)
+        time.sleep(self.page_delay)
+        keyword, number = page_token.split('|')
+        return self.page(keyword, int(number))
+
+
+@override_settings(
+    PLACES_LOCAL_FIRST=False, PLACES_DEEP_MAX_PAGES=3, PLACES_DEEP_BUDGET=5, PLACES_PAGE_TOKEN_DELAY=0
+)
+class DeepSearchTests(SimpleTestCase):
+    """Deep searches follow next_page_token within the page cap and latency budget"""
+
+    def setUp(self):
+        places_cache.clear()
+        self.addCleanup(places_cache.clear)
+
+    def deep_cache_key(self, keyword='matcha'):
+        return places_cache.make_key(*SYDNEY, deep_keyword(keyword), 5000)
+
+    def test_follows_tokens_and_caches_the_complete_search(self):
+        gmaps = FakePagingClient(pages=3)
+        pages = list(fetch_places_pages(gmaps, *SYDNEY, 5000, 'matcha'))
+        self.assertEqual([len(page) for page in pages], [3, 3, 3])
+        self.assertEqual([token for _, token in gmaps.calls], [None, 'matcha|1', 'matcha|2'])
+        self.assertEqual(len(places_cache.get(self.deep_cache_key())), 9)
+
+        # A repeated search is one cached page, without Google calls
+        self.assertEqual([len(page) for page in fetch_places_pages(gmaps, *SYDNEY, 5000, 'matcha')], [9])
+        self.assertEqual(len(gmaps.calls), 3)
+
+    @override_settings(PLACES_DEEP_MAX_PAGES=2)
+    def test_page_cap(self):
+        gmaps = FakePagingClient(pages=5)
+        self.assertEqual(len(list(fetch_places_pages(gmaps, *SYDNEY, 5000, 'matcha'))), 2)
+        self.assertEqual(len(gmaps.calls), 2)
+
+    def test_token_not_ready_is_retried(self):
+        gmaps = FakePagingClient(pages=2, not_ready=1)
+        pages = list(fetch_places_pages(gmaps, *SYDNEY, 5000, 'matcha'))
+        self.assertEqual(len(pages), 2)
+        self.assertEqual([token for _, token in gmaps.calls], [None, 'matcha|1', 'matcha|1'])
+
+    @override_settings(PLACES_DEEP_BUDGET=0.2)
+    def test_budget_cuts_the_search_short(self):
+        gmaps = FakePagingClient(pages=3, page_delay=1)
+        start = time.monotonic()
+        pages = list(fetch_places_pages(gmaps, *SYDNEY, 5000, 'matcha'))
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(len(pages), 1)
+        # An incomplete search is not cached
+        self.assertIsNone(places_cache.get(self.deep_cache_key()))
+
+    def test_next_page_is_prefetched_while_the_caller_scores(self):
+        gmaps = FakePagingClient(pages=2, page_delay=0.2)
+        search = fetch_places_pages(gmaps, *SYDNEY, 5000, 'matcha')
+        next(search)
+        handed_over = time.monotonic()
+        time.sleep(0.3)  # score the first page
+        waited = time.monotonic()
+        next(search)
+        self.assertLess(time.monotonic() - waited, 0.1, "the second page was not fetched in the background")
+        self.assertLess(gmaps.calls[1][0], handed_over + 0.1)
+        search.close()
+
+    @override_settings(PLACES_SEARCH_KEYWORDS=['matcha', 'tea house'])
+    def test_deep_search_covers_every_keyword_without_duplicates(self):
+        gmaps = FakePagingClient(pages=2)
+        pages = list(fetch_places_deep(gmaps, *SYDNEY, 5000))
+        place_ids = [place['place_id'] for page in pages for place in page]
+        self.assertEqual(len(place_ids), len(set(place_ids)))
+        self.assertEqual(len(place_ids), 2 * 2 * 2 + 2)  # two own places per page, plus one shared per round
+        self.assertTrue(all(places_cache.get(self.deep_cache_key(keyword)) for keyword in ('matcha', 'tea house')))
+
+    @override_settings(PLACES_SEARCH_KEYWORDS=['matcha', 'tea house'])
+    def test_deep_search_threads_close_their_connections(self):
+        closed = []
+        with mock.patch('places.services.connections') as connections:
+            connections.close_all.side_effect = lambda: closed.append(threading.current_thread().name)
+            list(fetch_places_deep(FakePagingClient(pages=2), *SYDNEY, 5000))
+        # One call per keyword per round, the last round finding each search exhausted
+        self.assertEqual(len(closed), 2 * 3)
+        self.assertTrue(all(name.startswith('places-deep') for name in closed))
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path
-from .views import PlacesView
+from .views import AsyncPlacesView, PlacesView, PlacesStatsView
 
 urlpatterns = [
-    path("places/", PlacesView.as_view(), name="places"),  # <-- NO leading 'api/'
+    path("places/", (AsyncPlacesView if settings.ASYNC_VIEWS else PlacesView).as_view(), name="places"),  # <-- NO leading 'api/'
+    path("places/stats/", PlacesStatsView.as_view(), name="places_stats"),
 ]